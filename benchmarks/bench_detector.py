@@ -0,0 +1,214 @@
+# benchmarks/bench_detector.py
+#
+# 顔検出モデル (hog / cnn / cascade) ごとに、1フレームあたりの検出時間と
+# 顔の大きさ別の検出率 (再現率) ・誤検出数を比較するベンチマーク。
+# 登録画像 (FACE_DATA_DIR) の顔を様々な大きさで背景に貼り付けた合成フレームを使い、
+# 貼り付けた位置を正解として評価する (--source を指定した場合は検出数と時間のみ)。
+#
+# 実行例:
+#   python -m benchmarks.bench_detector --models hog cnn cascade --scales 0.25 0.5
+#   python -m benchmarks.bench_detector --source recording.mp4 --models hog cascade
+
+import argparse
+import json
+import time
+
+import cv2
+import numpy as np
+import face_recognition
+
+from benchmarks.bench_pipeline import load_frames
+from src.config import config
+from src.recognition.detector import detect_faces
+from src.recognition.face_db import IMAGE_EXTENSIONS
+from src.recognition.preprocess import Preprocessor
+from src.recognition.tracker import box_iou
+
+# 顔の大きさ (元の解像度での幅, ピクセル) の区分
+SIZE_BUCKETS = (0, 40, 80, 160)
+# 検出結果を正解と対応付けるIoUのしきい値
+MATCH_IOU = 0.4
+
+
+def face_crops() -> list[tuple[np.ndarray, tuple]]:
+    """登録画像から顔の周囲を切り出し、(画像, 画像内の顔の位置) のリストを返す"""
+    crops = []
+    for image_path in sorted(config.FACE_DATA_DIR.glob("*/*")):
+        if not image_path.name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        image = cv2.imread(str(image_path))
+        if image is None:
+            continue
+        # 大きな写真は検出が遅いので、顔の検出用に縮小する
+        ratio = min(1.0, 800 / max(image.shape[:2]))
+        image = cv2.resize(image, None, fx=ratio, fy=ratio)
+        locations = face_recognition.face_locations(image[:, :, ::-1].copy())
+        if len(locations) != 1:
+            continue
+        top, right, bottom, left = locations[0]
+        # 顔の大きさの半分の余白を付けて切り出す
+        pad = (bottom - top) // 2
+        y0, x0 = max(0, top - pad), max(0, left - pad)
+        y1, x1 = min(image.shape[0], bottom + pad), min(image.shape[1], right + pad)
+        crops.append(
+            (image[y0:y1, x0:x1], (top - y0, right - x0, bottom - y0, left - x0))
+        )
+    if not crops:
+        raise SystemExit(
+            f"{config.FACE_DATA_DIR} に顔が1つだけ写った登録画像がありません。"
+        )
+    return crops
+
+
+def synthetic_scenes(args, rng: np.random.Generator):
+    """顔を大きさを変えて貼り付けたフレームと、正解の顔の位置のリストを作る"""
+    crops = face_crops()
+    gradient = np.linspace(40, 160, args.width, dtype=np.float32)
+    frames, truths = [], []
+    for _ in range(args.frames):
+        frame = np.empty((args.height, args.width, 3), dtype=np.uint8)
+        frame[:] = (gradient[None, :, None] + rng.normal(0, 8, frame.shape)).clip(
+            0, 255
+        )
+        boxes = []
+        for _ in range(args.faces):
+            crop, (top, right, bottom, left) = crops[int(rng.integers(len(crops)))]
+            # 顔の幅が min_face〜max_face ピクセルになるように縮小する (対数一様)
+            width = np.exp(rng.uniform(np.log(args.min_face), np.log(args.max_face)))
+            ratio = width / (right - left)
+            face = cv2.resize(crop, None, fx=ratio, fy=ratio)
+            h, w = face.shape[:2]
+            if h >= args.height or w >= args.width:
+                continue
+            y = int(rng.integers(0, args.height - h))
+            x = int(rng.integers(0, args.width - w))
+            box = (
+                y + int(top * ratio),
+                x + int(right * ratio),
+                y + int(bottom * ratio),
+                x + int(left * ratio),
+            )
+            # 既に貼り付けた顔と重なる場合は貼らない
+            if any(box_iou(box, other) > 0 for other in boxes):
+                continue
+            frame[y : y + h, x : x + w] = face
+            boxes.append(box)
+        frames.append(frame)
+        truths.append(boxes)
+    return frames, truths
+
+
+def size_label(lower: int) -> str:
+    upper = next((b for b in SIZE_BUCKETS if b > lower), None)
+    return f"{lower}-{upper}px" if upper else f"{lower}px+"
+
+
+def run_one(model: str, scale: float, frames, truths, args) -> dict:
+    preprocessor = Preprocessor(scale=scale)
+    # 初回呼び出しのモデル読み込みなどを計測から除く
+    for image in frames[: args.warmup]:
+        detect_faces(preprocessor.prepare(image)[0], model=model, frame_bgr=image)
+
+    elapsed, detections, false_positives = [], 0, 0
+    # 顔の大きさの区分 -> [検出できた数, 正解の数]
+    hits: dict[int, list[int]] = {}
+    for i, image in enumerate(frames):
+        small_rgb, _, effective = preprocessor.prepare(image)
+        t0 = time.perf_counter()
+        locations = detect_faces(small_rgb, model=model, frame_bgr=image)
+        elapsed.append(time.perf_counter() - t0)
+        detections += len(locations)
+        if truths is None:
+            continue
+        found = [tuple(int(round(v / effective)) for v in loc) for loc in locations]
+        matched = set()
+        for box in truths[i]:
+            best = max(
+                range(len(found)),
+                key=lambda d: box_iou(box, found[d]),
+                default=None,
+            )
+            hit = best is not None and box_iou(box, found[best]) >= MATCH_IOU
+            if hit:
+                matched.add(best)
+            width = box[1] - box[3]
+            lower = max(b for b in SIZE_BUCKETS if b <= width)
+            counts = hits.setdefault(lower, [0, 0])
+            counts[0] += hit
+            counts[1] += 1
+        false_positives += len(found) - len(matched)
+
+    elapsed_ms = np.asarray(elapsed) * 1000
+    row = {
+        "model": model,
+        "scale": scale,
+        "mean_ms": round(float(elapsed_ms.mean()), 2),
+        "p95_ms": round(float(np.percentile(elapsed_ms, 95)), 2),
+        "faces_per_frame": round(detections / len(frames), 3),
+    }
+    if truths is not None:
+        total = sum(c[1] for c in hits.values())
+        row["recall"] = round(sum(c[0] for c in hits.values()) / total, 3)
+        row["recall_by_size"] = {
+            size_label(lower): round(hits[lower][0] / hits[lower][1], 3)
+            for lower in SIZE_BUCKETS
+            if lower in hits
+        }
+        row["false_positives_per_frame"] = round(false_positives / len(frames), 3)
+    return row
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="顔検出モデルの速度と検出率の比較")
+    parser.add_argument(
+        "--source", help="動画ファイルか画像ディレクトリ (省略時は合成)"
+    )
+    parser.add_argument("--frames", type=int, default=50, help="フレーム数")
+    parser.add_argument("--faces", type=int, default=4, help="合成フレームの顔の数")
+    parser.add_argument("--min-face", type=int, default=24, help="合成する顔の最小幅")
+    parser.add_argument("--max-face", type=int, default=200, help="合成する顔の最大幅")
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--models", nargs="+", default=["hog", "cnn", "cascade"])
+    parser.add_argument("--scales", type=float, nargs="+", default=[0.25, 0.5])
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="結果をJSONで出力する")
+    args = parser.parse_args()
+
+    if args.source:
+        frames = load_frames(args.source, args.frames, args.width, args.height)
+        truths = None
+    else:
+        frames, truths = synthetic_scenes(args, np.random.default_rng(args.seed))
+
+    rows = [
+        run_one(model, scale, frames, truths, args)
+        for model in args.models
+        for scale in args.scales
+    ]
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+
+    header = f"{'model':<10}{'scale':>7}{'mean ms':>10}{'p95 ms':>10}{'faces':>8}"
+    if truths is not None:
+        header += f"{'recall':>8}{'FP/frame':>10}  recall by face width"
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        line = (
+            f"{row['model']:<10}{row['scale']:>7}{row['mean_ms']:>10.2f}"
+            f"{row['p95_ms']:>10.2f}{row['faces_per_frame']:>8.2f}"
+        )
+        if truths is not None:
+            by_size = ", ".join(f"{k}: {v}" for k, v in row["recall_by_size"].items())
+            line += (
+                f"{row['recall']:>8.3f}{row['false_positives_per_frame']:>10.2f}"
+                f"  {by_size}"
+            )
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+# benchmarks/bench_identity.py
+#
+# トラック単位の人物名の決め方 (キーフレームごとの照合結果をそのまま使う / 多数決 /
+# 多数決 + ほぼ同じエンコーディングの照合の省略) を、合成データで比較するベンチマーク。
+# 各トラックは登録済み (または未登録) の人物のエンコーディングに、撮影条件によるずれと
+# フレームごとの揺らぎを加えた列で、一部のフレームはぼけや横向きを想定して大きく崩す。
+# 表示される人物名の正解率、人物名が切り替わった回数、照合した顔の割合、照合時間を比較する。
+#
+# 実行例:
+#   python -m benchmarks.bench_identity --people 1000 --tracks 8 --keyframes 200
+#   python -m benchmarks.bench_identity --hard 0.2 --windows 1 3 5 9
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+from benchmarks.bench_index import (
+    ENCODING_DIM,
+    NOISE_SCALE,
+    make_centers,
+    make_gallery,
+)
+from src.config import config
+from src.recognition.face_db import FaceDB
+from src.recognition.tracker import FaceTracker, Track
+
+# 連続するキーフレーム間の揺らぎ (同じ顔のエンコーディングの距離 ≈ 0.05)
+JITTER_SCALE = 0.05 / np.sqrt(2 * ENCODING_DIM)
+# 崩れたフレーム (ぼけ・横向き) のずれ (元のエンコーディングからの距離 ≈ 0.5)
+HARD_SCALE = 0.5 / np.sqrt(ENCODING_DIM)
+
+
+def make_tracks(centers: np.ndarray, args, rng: np.random.Generator):
+    """トラックごとの正解の人物 (未登録はNone) と、キーフレームごとのエンコーディングを作る"""
+    truths, sequences = [], []
+    for _ in range(args.tracks):
+        if rng.random() < args.unknown:
+            # 未登録の人物も登録済みの人物と同じ顔の分布から生成する
+            center = make_centers(1, rng)[0]
+            truths.append(None)
+        else:
+            person = int(rng.integers(len(centers)))
+            center = centers[person]
+            truths.append(f"person{person:06d}")
+        # 撮影条件によるずれはトラックの間は変わらず、動きによる揺らぎはゆっくり変化する
+        session = center + rng.normal(0.0, NOISE_SCALE * 0.7, ENCODING_DIM)
+        drift = np.cumsum(
+            rng.normal(0.0, JITTER_SCALE * 0.5, (args.keyframes, ENCODING_DIM)), axis=0
+        )
+        frames = session + drift + rng.normal(0.0, JITTER_SCALE, drift.shape)
+        hard = rng.random(args.keyframes) < args.hard
+        frames[hard] += rng.normal(0.0, HARD_SCALE, (int(hard.sum()), ENCODING_DIM))
+        sequences.append(frames)
+    return truths, np.stack(sequences, axis=1)
+
+
+def run_one(face_db: FaceDB, truths, frames, window: int, dedup: float) -> dict:
+    tracker = FaceTracker(vote_window=window, dedup_distance=dedup)
+    tracks = [
+        Track(t, (0, 1, 1, 0), np.empty((0, 0), np.uint8), tracker.vote_window)
+        for t in range(len(truths))
+    ]
+    expected = [truth or "Unknown" for truth in truths]
+    correct = flips = 0
+    elapsed = 0.0
+    for encodings in frames:
+        before = [track.name for track in tracks]
+        t0 = time.perf_counter()
+        tracker.identify(tracks, list(encodings), face_db)
+        elapsed += time.perf_counter() - t0
+        for track, name, truth in zip(tracks, before, expected):
+            correct += track.name == truth
+            flips += track.name != name
+    faces = frames.shape[0] * frames.shape[1]
+    return {
+        "window": window,
+        "dedup": dedup,
+        "accuracy": round(correct / faces, 4),
+        # 最初の人物名の確定 (Unknown → 人物名) も1回と数える
+        "flips_per_100": round(flips / faces * 100, 2),
+        "matched": round(1.0 - tracker.dedup_ratio, 4),
+        "us_per_face": round(elapsed / faces * 1e6, 2),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="トラック単位の人物名の決め方の比較")
+    parser.add_argument("--people", type=int, default=1000, help="登録人数")
+    parser.add_argument(
+        "--per-person", type=int, default=5, help="1人あたりの登録ベクトル数"
+    )
+    parser.add_argument("--tracks", type=int, default=8, help="同時に写っている顔の数")
+    parser.add_argument("--keyframes", type=int, default=200)
+    parser.add_argument(
+        "--unknown", type=float, default=0.25, help="未登録の人物の割合"
+    )
+    parser.add_argument("--hard", type=float, default=0.15, help="崩れたフレームの割合")
+    parser.add_argument(
+        "--windows", type=int, nargs="+", default=[1, config.TRACK_VOTE_WINDOW]
+    )
+    parser.add_argument(
+        "--dedup", type=float, nargs="+", default=[0.0, config.TRACK_DEDUP_DISTANCE]
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="結果をJSONで出力する")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    centers, matrix, _ = make_gallery(args.people, args.per_person, rng)
+    face_db = FaceDB.from_encodings(
+        {
+            f"person{p:06d}": matrix[p * args.per_person : (p + 1) * args.per_person]
+            for p in range(args.people)
+        }
+    )
+    truths, frames = make_tracks(centers, args, rng)
+
+    rows = [
+        run_one(face_db, truths, frames, window, dedup)
+        for window in args.windows
+        for dedup in args.dedup
+    ]
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+
+    header = (
+        f"{'window':>7}{'dedup':>7}{'accuracy':>10}{'flips/100':>11}"
+        f"{'matched':>9}{'us/face':>9}"
+    )
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        print(
+            f"{row['window']:>7}{row['dedup']:>7}{row['accuracy']:>10.4f}"
+            f"{row['flips_per_100']:>11.2f}{row['matched']:>9.1%}{row['us_per_face']:>9.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+# benchmarks/bench_index.py
+#
+# 合成ギャラリーを使って、厳密探索 (exact) と近似探索 (ivf) の
+# 再現率 (厳密探索の1位との一致率) とレイテンシを比較するベンチマーク。
+# 似た顔の人物が集まり、本人と別人の距離が照合しきい値 (0.6) の付近で重なる
+# ギャラリーを生成し、nlist・nprobeごとの再現率を測る。
+#
+# 実行例:
+#   python -m benchmarks.bench_index --sizes 10000 100000 --nprobe 1 4 8 16 32
+#   python -m benchmarks.bench_index --sizes 100000 --nlist 316 1264 5000
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+from src.recognition.index import BruteForceIndex, IVFIndex
+
+ENCODING_DIM = 128
+# 等方的なガウス分布で顔を生成する場合の、dlibエンコーディングの典型的な距離感に合わせたスケール
+# (別人同士 ≈ 0.9〜1.0, 同一人物 ≈ 0.3〜0.4)
+CENTER_SCALE = 0.95 / np.sqrt(2 * ENCODING_DIM)
+NOISE_SCALE = 0.35 / np.sqrt(2 * ENCODING_DIM)
+
+# 実際のdlibエンコーディングは128次元に一様には散らばらず、少数の方向 (顔の形・年齢・性別など)
+# に偏り、似た顔の人物が集団を作る。撮影条件による同一人物のずれも主にこの部分空間の中で起きる。
+# 等方的なガウス分布では別人同士がすべて ≈ 0.95 離れ、同一人物のずれもクラスタの境界をほとんど
+# またがないため、IVFがnprobe=1でも再現率1.0になってしまう。
+FACE_SUBSPACE_DIM = 24
+# 似た顔の集団あたりの人数
+GROUP_SIZE = 50
+# 集団の中心同士、同じ集団の人物同士、同一人物の写真同士の典型的な距離
+# (別人同士 ≈ 0.8〜1.1 で、大きなギャラリーでは最も近い別人が 0.6 を下回ることも多い)
+GROUP_DISTANCE = 0.7
+PERSON_DISTANCE = 0.8
+SAMPLE_DISTANCE = 0.45
+# 同一人物のずれのうち、部分空間に沿う分散の割合
+SUBSPACE_SHARE = 0.9
+# 顔の部分空間の基底 (どのベンチマークでも同じ空間を使う)
+_BASIS = np.linalg.qr(
+    np.random.default_rng(0).normal(size=(ENCODING_DIM, FACE_SUBSPACE_DIM))
+)[0].T
+
+
+def make_centers(num_people: int, rng: np.random.Generator) -> np.ndarray:
+    """似た顔の集団に分かれた人物ごとの中心を、顔の部分空間の中に生成する"""
+    scale = 1.0 / np.sqrt(2 * FACE_SUBSPACE_DIM)
+    groups = rng.normal(
+        0.0,
+        GROUP_DISTANCE * scale,
+        (max(1, num_people // GROUP_SIZE), FACE_SUBSPACE_DIM),
+    )
+    member = rng.integers(0, len(groups), size=num_people)
+    latent = groups[member] + rng.normal(
+        0.0, PERSON_DISTANCE * scale, (num_people, FACE_SUBSPACE_DIM)
+    )
+    return latent @ _BASIS
+
+
+def make_samples(centers: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """
+    各中心について写真1枚分のエンコーディングを生成する。
+    ずれの大きさは写真ごとに変え、同一人物でも 0.6 に近づく写真を作る。
+    """
+    shape = centers.shape[:-1]
+    along = rng.normal(
+        0.0,
+        SAMPLE_DISTANCE * np.sqrt(SUBSPACE_SHARE / (2 * FACE_SUBSPACE_DIM)),
+        shape + (FACE_SUBSPACE_DIM,),
+    )
+    across = rng.normal(
+        0.0,
+        SAMPLE_DISTANCE * np.sqrt((1.0 - SUBSPACE_SHARE) / (2 * ENCODING_DIM)),
+        shape + (ENCODING_DIM,),
+    )
+    spread = rng.uniform(0.75, 1.25, shape + (1,))
+    return centers + (along @ _BASIS + across) * spread
+
+
+def make_gallery(num_people: int, per_person: int, rng: np.random.Generator):
+    """人物ごとに連続した行ブロックを持つ合成ギャラリーを生成する"""
+    centers = make_centers(num_people, rng)
+    samples = make_samples(np.repeat(centers[:, None, :], per_person, axis=1), rng)
+    matrix = samples.reshape(-1, ENCODING_DIM)
+    offsets = np.arange(num_people, dtype=np.intp) * per_person
+    return centers, matrix.astype(np.float32), offsets
+
+
+def make_probes(centers: np.ndarray, num_probes: int, rng: np.random.Generator):
+    """登録済み人物の新しいサンプルをプローブとして生成する"""
+    who = rng.integers(0, len(centers), size=num_probes)
+    return make_samples(centers[who], rng), who
+
+
+def distance_overlap(
+    matrix: np.ndarray, offsets: np.ndarray, probes: np.ndarray, who: np.ndarray
+) -> dict:
+    """
+    プローブから本人の最も近い写真と、最も近い別人の写真までの距離を集計する。
+    照合しきい値 (0.6) をまたぐ割合が、近似探索にとってのギャラリーの難しさになる。
+    """
+    owner = np.repeat(np.arange(len(offsets)), np.diff(np.append(offsets, len(matrix))))
+    norms = np.einsum("ij,ij->i", matrix, matrix)
+    own, other = [], []
+    for probe, person in zip(probes, who):
+        distances = np.sqrt(np.maximum(norms - 2 * matrix @ probe + probe @ probe, 0.0))
+        mine = owner == person
+        own.append(distances[mine].min())
+        other.append(distances[~mine].min() if (~mine).any() else np.inf)
+    own, other = np.asarray(own), np.asarray(other)
+    return {
+        "own_p50": round(float(np.median(own)), 3),
+        "other_p50": round(float(np.median(other)), 3),
+        "own_over_0.6": round(float((own > 0.6).mean()), 4),
+        "other_under_0.6": round(float((other < 0.6).mean()), 4),
+    }
+
+
+def measure(index, probes: np.ndarray, batch: int, k: int):
+    """バッチ単位で探索し、結果とプローブあたりのレイテンシ(ms)を返す"""
+    results, latencies = [], []
+    for start in range(0, len(probes), batch):
+        chunk = probes[start : start + batch]
+        t0 = time.perf_counter()
+        results.extend(index.search(chunk, k))
+        elapsed = (time.perf_counter() - t0) * 1000
+        latencies.extend([elapsed / len(chunk)] * len(chunk))
+    return results, np.asarray(latencies)
+
+
+def summarize(latencies: np.ndarray) -> dict:
+    return {
+        "p50_ms": round(float(np.percentile(latencies, 50)), 4),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 4),
+        "mean_ms": round(float(latencies.mean()), 4),
+    }
+
+
+def run(args) -> list[dict]:
+    rng = np.random.default_rng(args.seed)
+    rows = []
+    for size in args.sizes:
+        num_people = max(1, size // args.per_person)
+        centers, matrix, offsets = make_gallery(num_people, args.per_person, rng)
+        probes, who = make_probes(centers, args.probes, rng)
+
+        t0 = time.perf_counter()
+        exact = BruteForceIndex(matrix, offsets)
+        exact_build = time.perf_counter() - t0
+        exact_results, exact_lat = measure(exact, probes, args.batch, args.k)
+        # 近似探索の再現率は、正解の人物ではなく厳密探索の1位と一致した割合で測る
+        truth = [r[0][0] if r else -1 for r in exact_results]
+        rows.append(
+            {
+                "backend": "exact",
+                "gallery": len(matrix),
+                "people": num_people,
+                "build_s": round(exact_build, 3),
+                "recall_at_1": 1.0,
+                **distance_overlap(matrix, offsets, probes, who),
+                **summarize(exact_lat),
+            }
+        )
+
+        for nlist in args.nlist:
+            t0 = time.perf_counter()
+            ivf = IVFIndex(matrix, offsets, nlist=nlist, nprobe=1, seed=args.seed)
+            ivf_build = time.perf_counter() - t0
+            for nprobe in args.nprobe:
+                ivf.nprobe = max(1, min(nprobe, ivf.nlist))
+                ivf_results, ivf_lat = measure(ivf, probes, args.batch, args.k)
+                hits = sum(
+                    1
+                    for expected, r in zip(truth, ivf_results)
+                    if r and r[0][0] == expected
+                )
+                rows.append(
+                    {
+                        "backend": "ivf",
+                        "gallery": len(matrix),
+                        "people": num_people,
+                        "nlist": ivf.nlist,
+                        "nprobe": ivf.nprobe,
+                        "build_s": round(ivf_build, 3),
+                        "recall_at_1": round(hits / len(truth), 4),
+                        **summarize(ivf_lat),
+                    }
+                )
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="FaceDBインデックスのベンチマーク")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--per-person", type=int, default=5)
+    parser.add_argument("--probes", type=int, default=500)
+    parser.add_argument("--batch", type=int, default=4, help="1フレームあたりの顔数")
+    parser.add_argument("--k", type=int, default=1)
+    parser.add_argument(
+        "--nlist", type=int, nargs="+", default=[0], help="0の場合は自動決定 (4√N)"
+    )
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="結果をJSONで出力する")
+    args = parser.parse_args()
+
+    rows = run(args)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+
+    header = f"{'backend':<8}{'gallery':>9}{'nlist':>7}{'nprobe':>8}{'recall@1':>10}{'p50[ms]':>10}{'p95[ms]':>10}"
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        if row["backend"] == "exact":
+            print(
+                f"# gallery={row['gallery']}: 本人との距離 p50={row['own_p50']:.3f}"
+                f" (0.6超 {row['own_over_0.6']:.1%}),"
+                f" 最も近い別人との距離 p50={row['other_p50']:.3f}"
+                f" (0.6未満 {row['other_under_0.6']:.1%})"
+            )
+        print(
+            f"{row['backend']:<8}{row['gallery']:>9}{row.get('nlist', '-'):>7}"
+            f"{row.get('nprobe', '-'):>8}"
+            f"{row['recall_at_1']:>10.4f}{row['p50_ms']:>10.3f}{row['p95_ms']:>10.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,370 @@
+# benchmarks/bench_pipeline.py
+#
+# Raspberry Piなしで認識パイプライン全体 (StreamReceiver → process_frame_for_faces →
+# FaceDB.identify) を計測するベンチマーク。
+# 録画した動画ファイルや画像ディレクトリのフレームを StreamReceiver のリングバッファに
+# 流し込むため、カメラAPI (camera_control) やネットワークには一切アクセスしない。
+# 検出モデル (hog / cnn)・検出スケール・ギャラリーサイズ (合成エンコーディング) の
+# 組み合わせごとに、スループット・レイテンシのパーセンタイル・ピークメモリをJSONで出力する。
+# 各組み合わせは別プロセスで実行するため、ピークメモリは組み合わせごとに独立して測れる。
+#
+# 実行例:
+#   python -m benchmarks.bench_pipeline --source recording.mp4 --models hog cnn cascade \
+#       --scales 0.25 0.5 --gallery-sizes 0 10000 100000 --output results.json
+#   (--source を省略した場合は、登録画像を背景に貼り付けた合成フレームを使う)
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from benchmarks.bench_index import make_gallery
+from src.config import config
+from src.metrics import STAGE_SECONDS
+from src.recognition.face_db import IMAGE_EXTENSIONS, FaceDB
+from src.recognition.preprocess import Preprocessor
+from src.recognition.tracker import FaceTracker
+from src.recognition.worker import process_frame_for_faces
+from src.streaming.receiver import StreamReceiver
+
+PERCENTILES = (50, 95, 99)
+
+
+class ReplayReceiver(StreamReceiver):
+    """
+    メモリ上のフレームを順に配信するレシーバー (カメラとストリームの代わり)。
+    fps=0 の場合は、各フレームが取得されるまで次のフレームを出さない
+    (全フレームがちょうど1回ずつ処理されるので、スループットの計測に使う)。
+    fps>0 の場合はそのレートで配信し、処理が追いつかない分は本番と同じく捨てられる。
+    """
+
+    def __init__(self, frames: list[np.ndarray], fps: float = 0.0, loops: int = 1):
+        self._frames = frames
+        self._fps = fps
+        self._loops = loops
+        self._taken = threading.Event()
+        self.finished = threading.Event()
+        super().__init__(stream_url="replay://")
+
+    def _capture_loop(self):
+        self.connected_event.set()
+        interval = 1.0 / self._fps if self._fps > 0 else 0.0
+        next_time = time.perf_counter()
+        for _ in range(self._loops):
+            for image in self._frames:
+                if self._stopped.is_set():
+                    return
+                slot = self._acquire_write_slot()
+                if slot is None:
+                    self.frames_overrun += 1
+                else:
+                    if slot.image is None or slot.image.shape != image.shape:
+                        slot.image = np.empty_like(image)
+                    np.copyto(slot.image, image)
+                    self._taken.clear()
+                    self._publish(slot, 1.0)
+                if interval:
+                    next_time += interval
+                    delay = next_time - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                else:
+                    while not self._taken.wait(0.1):
+                        if self._stopped.is_set():
+                            return
+        self.finished.set()
+
+    def _lend(self, slot):
+        frame = super()._lend(slot)
+        self._taken.set()
+        return frame
+
+
+# --- フレームの読み込み ---
+def load_frames(source: str | None, count: int, width: int, height: int):
+    """動画ファイル・画像ディレクトリ・合成フレームのいずれかからフレームを読み込む"""
+    if source is None:
+        return synthetic_frames(count, width, height)
+    path = Path(source)
+    if path.is_dir():
+        frames = []
+        for image_path in sorted(path.iterdir()):
+            if image_path.name.lower().endswith(IMAGE_EXTENSIONS):
+                image = cv2.imread(str(image_path))
+                if image is not None:
+                    frames.append(image)
+            if len(frames) >= count:
+                break
+    else:
+        cap = cv2.VideoCapture(str(path))
+        frames = []
+        while len(frames) < count:
+            ok, image = cap.read()
+            if not ok:
+                break
+            frames.append(image)
+        cap.release()
+    if not frames:
+        raise SystemExit(f"フレームを読み込めませんでした: {source}")
+    return frames
+
+
+def synthetic_frames(count: int, width: int, height: int) -> list[np.ndarray]:
+    """登録画像 (FACE_DATA_DIR) を横に移動させながら背景に貼り付けた合成フレームを作る"""
+    rng = np.random.default_rng(0)
+    background = rng.integers(0, 64, size=(height, width, 3), dtype=np.uint8)
+    faces = []
+    if config.FACE_DATA_DIR.exists():
+        for image_path in sorted(config.FACE_DATA_DIR.glob("*/*")):
+            if image_path.name.lower().endswith(IMAGE_EXTENSIONS):
+                image = cv2.imread(str(image_path))
+                if image is not None:
+                    size = height // 2
+                    scale = size / max(image.shape[:2])
+                    faces.append(cv2.resize(image, None, fx=scale, fy=scale))
+    frames = []
+    for i in range(count):
+        frame = background.copy()
+        if faces:
+            face = faces[i % len(faces)]
+            h, w = face.shape[:2]
+            x = int((width - w) * i / max(1, count - 1))
+            y = (height - h) // 2
+            frame[y : y + h, x : x + w] = face
+        frames.append(frame)
+    return frames
+
+
+def synthetic_face_db(size: int, per_person: int, seed: int) -> FaceDB:
+    """合成エンコーディング size 件のギャラリーを持つFaceDBを作る"""
+    if size <= 0:
+        return FaceDB.from_encodings({})
+    rng = np.random.default_rng(seed)
+    num_people = max(1, size // per_person)
+    _, matrix, _ = make_gallery(num_people, per_person, rng)
+    return FaceDB.from_encodings(
+        {
+            f"person{p:06d}": matrix[p * per_person : (p + 1) * per_person]
+            for p in range(num_people)
+        }
+    )
+
+
+# --- 計測 ---
+def percentiles(values: list[float], prefix: str) -> dict:
+    arr = np.asarray(values) * 1000 if values else np.zeros(1)
+    return {
+        f"{prefix}_p{p}_ms": round(float(np.percentile(arr, p)), 2) for p in PERCENTILES
+    }
+
+
+def run_one(model: str, scale: float, gallery_size: int, frames, args) -> dict:
+    config.RECOGNITION_MODEL = model
+    face_db = synthetic_face_db(gallery_size, args.per_person, args.seed)
+    preprocessor = Preprocessor(scale=scale)
+    tracker = FaceTracker() if args.tracker else None
+
+    # 初回呼び出しのモデル読み込みなどを計測から除く
+    for image in frames[: args.warmup]:
+        process_frame_for_faces(image, face_db, tracker, preprocessor=preprocessor)
+    stages_before = STAGE_SECONDS.totals()
+
+    receiver = ReplayReceiver(frames, fps=args.fps, loops=args.loops)
+    latencies, ages, faces = [], [], 0
+    last_seq = -1
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    while not (receiver.finished.is_set() and receiver.latest_seq <= last_seq):
+        frame = receiver.acquire_frame(after_seq=last_seq, timeout=0.5)
+        if frame is None:
+            continue
+        with frame:
+            last_seq = frame.seq
+            t0 = time.perf_counter()
+            faces_data = process_frame_for_faces(
+                frame.image,
+                face_db,
+                tracker,
+                preprocessor=preprocessor,
+                frame_scale=frame.scale,
+            )
+            latencies.append(time.perf_counter() - t0)
+            ages.append(time.time() - frame.timestamp)
+            faces += len(faces_data or [])
+    wall = time.perf_counter() - started
+    cpu = time.process_time() - cpu_started
+    receiver.stop()
+
+    stages = {}
+    for (stage,), (count, total) in STAGE_SECONDS.totals().items():
+        before_count, before_total = stages_before.get((stage,), (0, 0.0))
+        if count > before_count:
+            stages[stage] = round(
+                (total - before_total) / (count - before_count) * 1000, 3
+            )
+    processed = len(latencies)
+    return {
+        "model": model,
+        "scale": scale,
+        "gallery": gallery_size,
+        "tracker": bool(args.tracker),
+        "frame_size": f"{frames[0].shape[1]}x{frames[0].shape[0]}",
+        "replay_fps": args.fps,
+        "captured": receiver.frames_captured,
+        "processed": processed,
+        "dropped": receiver.frames_captured - processed,
+        "fps": round(processed / wall, 2) if wall > 0 else 0.0,
+        "cpu_percent": round(100 * cpu / wall, 1) if wall > 0 else 0.0,
+        **percentiles(latencies, "latency"),
+        **percentiles(ages, "capture_to_result"),
+        "faces_per_frame": round(faces / processed, 3) if processed else 0.0,
+        "stage_mean_ms": stages,
+        # Linuxでは ru_maxrss はKB単位
+        "peak_rss_mb": round(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+        ),
+    }
+
+
+def environment() -> dict:
+    """実行環境の情報 (結果を時系列で比較するときの手がかり)"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=False,
+        ).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": commit or None,
+        "python": platform.python_version(),
+        "opencv": cv2.__version__,
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def child_argv(args, model: str, scale: float, gallery_size: int) -> list[str]:
+    """1つの組み合わせだけを別プロセスで実行するためのコマンドライン"""
+    argv = [
+        sys.executable,
+        "-m",
+        "benchmarks.bench_pipeline",
+        "--models",
+        model,
+        "--scales",
+        str(scale),
+        "--gallery-sizes",
+        str(gallery_size),
+        "--frames",
+        str(args.frames),
+        "--loops",
+        str(args.loops),
+        "--fps",
+        str(args.fps),
+        "--warmup",
+        str(args.warmup),
+        "--width",
+        str(args.width),
+        "--height",
+        str(args.height),
+        "--per-person",
+        str(args.per_person),
+        "--seed",
+        str(args.seed),
+        "--no-isolate",
+        "--rows-only",
+    ]
+    if args.source:
+        argv += ["--source", args.source]
+    if args.tracker:
+        argv.append("--tracker")
+    return argv
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="認識パイプラインのオフラインベンチマーク"
+    )
+    parser.add_argument(
+        "--source", help="動画ファイルか画像ディレクトリ (省略時は合成)"
+    )
+    parser.add_argument("--frames", type=int, default=100, help="読み込むフレーム数")
+    parser.add_argument("--loops", type=int, default=1, help="フレームを繰り返す回数")
+    parser.add_argument(
+        "--fps", type=float, default=0.0, help="配信レート (0で全フレームを1回ずつ処理)"
+    )
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--width", type=int, default=640, help="合成フレームの幅")
+    parser.add_argument("--height", type=int, default=480, help="合成フレームの高さ")
+    parser.add_argument("--models", nargs="+", default=["hog", "cnn"])
+    parser.add_argument("--scales", type=float, nargs="+", default=[0.25, 0.5])
+    parser.add_argument(
+        "--gallery-sizes", type=int, nargs="+", default=[0, 1000, 10000, 100000]
+    )
+    parser.add_argument("--per-person", type=int, default=5)
+    parser.add_argument("--tracker", action="store_true", help="顔追跡を有効にする")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--no-isolate", action="store_true", help="組み合わせごとにプロセスを分けない"
+    )
+    parser.add_argument("--rows-only", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--output", help="結果のJSONを書き込むファイル")
+    args = parser.parse_args()
+
+    combos = [
+        (model, scale, size)
+        for model in args.models
+        for scale in args.scales
+        for size in args.gallery_sizes
+    ]
+    rows = []
+    if args.no_isolate:
+        frames = load_frames(args.source, args.frames, args.width, args.height)
+        for model, scale, size in combos:
+            rows.append(run_one(model, scale, size, frames, args))
+    else:
+        for model, scale, size in combos:
+            result = subprocess.run(
+                child_argv(args, model, scale, size),
+                stdout=subprocess.PIPE,
+                text=True,
+                check=False,
+            )
+            if result.returncode != 0:
+                rows.append(
+                    {
+                        "model": model,
+                        "scale": scale,
+                        "gallery": size,
+                        "error": f"exit code {result.returncode}",
+                    }
+                )
+                continue
+            rows.extend(json.loads(result.stdout))
+
+    if args.rows_only:
+        print(json.dumps(rows))
+        return
+
+    report = json.dumps({"environment": environment(), "results": rows}, indent=2)
+    if args.output:
+        Path(args.output).write_text(report + "\n", encoding="utf-8")
+    print(report)
+
+
+if __name__ == "__main__":
+    main()
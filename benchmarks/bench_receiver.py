@@ -0,0 +1,158 @@
+# benchmarks/bench_receiver.py
+#
+# 疑似MJPEGサーバーを別プロセスで起動し、受信方式 (opencv / mjpeg) ごとに
+# 受信レート・CPU時間・フレーム取得時の遅延を比較するベンチマーク。
+# 本番と同じくeventletのモンキーパッチ環境で実行する。
+#
+# 実行例:
+#   python -m benchmarks.bench_receiver --cameras 1 4 --fps 30 --consume-fps 10
+
+import eventlet
+
+eventlet.monkey_patch()
+
+import argparse  # noqa: E402
+import json  # noqa: E402
+import socket  # noqa: E402
+import subprocess  # noqa: E402
+import sys  # noqa: E402
+import time  # noqa: E402
+
+import numpy as np  # noqa: E402
+
+from src.streaming.mjpeg import MjpegReceiver  # noqa: E402
+from src.streaming.receiver import StreamReceiver  # noqa: E402
+
+RECEIVERS = {"opencv": StreamReceiver, "mjpeg": MjpegReceiver}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(args) -> tuple[subprocess.Popen, str]:
+    port = free_port()
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "benchmarks.fake_mjpeg_server",
+            "--port",
+            str(port),
+            "--width",
+            str(args.width),
+            "--height",
+            str(args.height),
+            "--fps",
+            str(args.fps),
+        ],
+        stdout=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            break
+        except OSError:
+            eventlet.sleep(0.1)
+    return process, f"http://127.0.0.1:{port}/stream"
+
+
+def consume(receiver, duration: float, consume_fps: float, ages: list) -> int:
+    """認識ワーカーと同じように新しいフレームを待って借り受け、すぐに返却する"""
+    interval = 1.0 / consume_fps if consume_fps > 0 else 0.0
+    deadline = time.monotonic() + duration
+    last_seq, consumed = -1, 0
+    while time.monotonic() < deadline:
+        frame = receiver.acquire_frame(after_seq=last_seq, timeout=1.0)
+        if frame is None:
+            continue
+        with frame:
+            last_seq = frame.seq
+            ages.append((time.time() - frame.timestamp) * 1000)
+            consumed += 1
+        if interval:
+            eventlet.sleep(interval)
+    return consumed
+
+
+def run_one(kind: str, url: str, cameras: int, args) -> dict:
+    receivers = [RECEIVERS[kind](url) for _ in range(cameras)]
+    for receiver in receivers:
+        receiver.connected_event.wait(10)
+    # 接続直後のバースト (バッファ済みのフレーム) を除いて計測する
+    eventlet.sleep(1.0)
+    captured_before = sum(r.frames_captured for r in receivers)
+
+    ages: list[float] = []
+    cpu0, wall0 = time.process_time(), time.perf_counter()
+    pool = eventlet.GreenPool()
+    consumers = [
+        pool.spawn(consume, r, args.duration, args.consume_fps, ages) for r in receivers
+    ]
+    consumed = sum(c.wait() for c in consumers)
+    wall = time.perf_counter() - wall0
+    cpu = time.process_time() - cpu0
+    captured = sum(r.frames_captured for r in receivers) - captured_before
+    for receiver in receivers:
+        receiver.stop()
+
+    ages_arr = np.asarray(ages) if ages else np.zeros(1)
+    return {
+        "receiver": kind,
+        "cameras": cameras,
+        "received_fps": round(captured / wall, 1),
+        "consumed_fps": round(consumed / wall, 1),
+        "cpu_percent": round(100 * cpu / wall, 1),
+        "age_p50_ms": round(float(np.percentile(ages_arr, 50)), 2),
+        "age_p95_ms": round(float(np.percentile(ages_arr, 95)), 2),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="ストリーム受信方式のベンチマーク")
+    parser.add_argument("--receivers", nargs="+", default=list(RECEIVERS))
+    parser.add_argument("--cameras", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--fps", type=float, default=30.0, help="配信レート")
+    parser.add_argument(
+        "--consume-fps", type=float, default=10.0, help="認識側の取得レート"
+    )
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--json", action="store_true", help="結果をJSONで出力する")
+    args = parser.parse_args()
+
+    server, url = start_server(args)
+    try:
+        rows = [
+            run_one(kind, url, cameras, args)
+            for cameras in args.cameras
+            for kind in args.receivers
+        ]
+    finally:
+        server.terminate()
+        server.wait()
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+
+    header = (
+        f"{'receiver':<9}{'cameras':>8}{'recv fps':>10}{'used fps':>10}"
+        f"{'cpu[%]':>8}{'age p50':>9}{'age p95':>9}"
+    )
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        print(
+            f"{row['receiver']:<9}{row['cameras']:>8}{row['received_fps']:>10.1f}"
+            f"{row['consumed_fps']:>10.1f}{row['cpu_percent']:>8.1f}"
+            f"{row['age_p50_ms']:>9.2f}{row['age_p95_ms']:>9.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
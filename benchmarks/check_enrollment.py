@@ -0,0 +1,197 @@
+# benchmarks/check_enrollment.py
+#
+# 登録画像の代表ベクトルへの絞り込み (品質フィルタ・外れ値除去・k-メドイド + 重心) が
+# 照合精度を落とさないことを、取り置いた画像 (held-out) で確認するスクリプト。
+# 同じ学習用の画像から「全エンコーディング」と「代表ベクトル」の2つのギャラリーを作り、
+# 取り置いた画像と未登録の人物の画像で、正解率・誤受入・誤棄却・照合時間を比較する。
+# 判定方法は、共通のしきい値 (global: FACE_MATCH_THRESHOLD) と、人物ごとのしきい値 +
+# 2番目の人物との距離の差による棄却 (adaptive: FaceDB.identify) の両方で評価する。
+#
+# 実行例:
+#   python -m benchmarks.check_enrollment --synthetic --people 2000 --max-photos 40
+#   python -m benchmarks.check_enrollment --store   (FACE_DATA_DIRの埋め込みストアを使う)
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+from benchmarks.bench_index import CENTER_SCALE, ENCODING_DIM, NOISE_SCALE
+from src.config import config
+from src.recognition.enrollment import representative_vectors
+from src.recognition.face_db import STORE, FaceDB
+
+
+def synthetic_people(args, rng: np.random.Generator) -> dict[str, list]:
+    """
+    人物ごとに (エンコーディング, 品質) のリストを生成する。
+    品質の低い写真ほどノイズが大きく、一部の写真は別人の顔 (ラベル誤り) にする。
+    """
+    centers = rng.normal(0.0, CENTER_SCALE, size=(args.people, ENCODING_DIM))
+    people = {}
+    for p, center in enumerate(centers):
+        photos = []
+        for _ in range(int(rng.integers(args.min_photos, args.max_photos + 1))):
+            quality = float(rng.uniform(0.1, 1.0))
+            source = center
+            if rng.random() < args.mislabel:
+                source = centers[int(rng.integers(0, args.people))]
+            noise = NOISE_SCALE * (1.0 + 2.0 * (1.0 - quality))
+            photos.append((source + rng.normal(0.0, noise, ENCODING_DIM), quality))
+        people[f"person{p:06d}"] = photos
+    return people
+
+
+def store_people() -> dict[str, list]:
+    """埋め込みストアに保存済みの画像ごとのエンコーディングを人物ごとにまとめる"""
+    opened = STORE.open()
+    if opened is None:
+        raise SystemExit("埋め込みストアがありません。先にFaceDBを構築してください。")
+    header, matrix = opened
+    people: dict[str, list] = {}
+    for record in header["images"].values():
+        if record["row"] is None:
+            continue
+        quality = record.get("quality")
+        people.setdefault(record["person"], []).append(
+            (np.asarray(matrix[record["row"]]), 1.0 if quality is None else quality)
+        )
+    return people
+
+
+def split(people: dict[str, list], args, rng: np.random.Generator):
+    """人物を登録済み・未登録に分け、登録済みの人物の写真の一部を取り置く"""
+    names = sorted(people)
+    rng.shuffle(names)
+    num_unknown = int(len(names) * args.unknown_fraction)
+    train, probes = {}, []
+    for name in names[:num_unknown]:
+        probes.extend((encoding, None) for encoding, _ in people[name])
+    for name in names[num_unknown:]:
+        photos = people[name]
+        if len(photos) < 2:
+            train[name] = photos
+            continue
+        order = rng.permutation(len(photos))
+        held = max(1, int(len(photos) * args.holdout))
+        probes.extend((photos[i][0], name) for i in order[:held])
+        train[name] = [photos[i] for i in order[held:]]
+    return train, probes
+
+
+def evaluate(face_db: FaceDB, probes: list, batch: int, decision: str) -> dict:
+    correct = false_accept = false_reject = misidentified = known = 0
+    elapsed = 0.0
+    for start in range(0, len(probes), batch):
+        chunk = probes[start : start + batch]
+        encodings = [encoding for encoding, _ in chunk]
+        t0 = time.perf_counter()
+        if decision == "adaptive":
+            predictions = face_db.identify(encodings)
+        else:
+            predictions = [
+                candidates[0][0] if candidates else None
+                for candidates in face_db.match_many(
+                    encodings, k=1, threshold=config.FACE_MATCH_THRESHOLD
+                )
+            ]
+        elapsed += time.perf_counter() - t0
+        for (_, expected), predicted in zip(chunk, predictions):
+            known += expected is not None
+            if predicted == expected:
+                correct += 1
+            elif expected is None:
+                false_accept += 1
+            elif predicted is None:
+                false_reject += 1
+            else:
+                misidentified += 1
+    unknown = len(probes) - known
+    return {
+        "vectors": face_db.status()["vectors"],
+        "accuracy": round(correct / len(probes), 4),
+        "false_accept_rate": round(false_accept / unknown, 4) if unknown else None,
+        "false_reject_rate": round(false_reject / known, 4) if known else None,
+        "misidentification_rate": round(misidentified / known, 4) if known else None,
+        "match_us_per_probe": round(elapsed / len(probes) * 1e6, 2),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="代表ベクトルへの絞り込みの精度確認")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--synthetic", action="store_true", help="合成データを使う")
+    source.add_argument("--store", action="store_true", help="埋め込みストアを使う")
+    parser.add_argument("--people", type=int, default=1000)
+    parser.add_argument("--min-photos", type=int, default=1)
+    parser.add_argument("--max-photos", type=int, default=30)
+    parser.add_argument("--mislabel", type=float, default=0.02, help="別人の写真の割合")
+    parser.add_argument("--holdout", type=float, default=0.2, help="取り置く写真の割合")
+    parser.add_argument(
+        "--unknown-fraction", type=float, default=0.1, help="未登録にする人物の割合"
+    )
+    parser.add_argument("--max-vectors", type=int, default=config.ENROLL_MAX_VECTORS)
+    parser.add_argument("--min-quality", type=float, default=config.ENROLL_MIN_QUALITY)
+    parser.add_argument(
+        "--outlier-distance", type=float, default=config.ENROLL_OUTLIER_DISTANCE
+    )
+    parser.add_argument("--batch", type=int, default=4, help="1フレームあたりの顔数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="結果をJSONで出力する")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    people = store_people() if args.store else synthetic_people(args, rng)
+    train, probes = split(people, args, rng)
+
+    baseline = FaceDB.from_encodings(
+        {name: [encoding for encoding, _ in photos] for name, photos in train.items()}
+    )
+    reduced = {}
+    for name, photos in train.items():
+        encodings = np.asarray([encoding for encoding, _ in photos])
+        qualities = np.asarray([quality for _, quality in photos], dtype=np.float32)
+        passed = qualities >= args.min_quality
+        if not passed.any():
+            passed = np.arange(len(qualities)) == int(np.argmax(qualities))
+        reduced[name], _ = representative_vectors(
+            encodings[passed],
+            qualities[passed],
+            max_vectors=args.max_vectors,
+            outlier_distance=args.outlier_distance,
+        )
+
+    galleries = {"all": baseline, "representatives": FaceDB.from_encodings(reduced)}
+    rows = [
+        {
+            "gallery": gallery,
+            "decision": decision,
+            **evaluate(face_db, probes, args.batch, decision),
+        }
+        for gallery, face_db in galleries.items()
+        for decision in ("global", "adaptive")
+    ]
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+
+    header = (
+        f"{'gallery':<16}{'decision':<10}{'vectors':>9}{'accuracy':>10}{'FAR':>8}{'FRR':>8}"
+        f"{'misid':>8}{'us/probe':>10}"
+    )
+    print(
+        f"人物 {len(train)} 人 (未登録 {len(people) - len(train)} 人), プローブ {len(probes)} 件"
+    )
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        print(
+            f"{row['gallery']:<16}{row['decision']:<10}{row['vectors']:>9}{row['accuracy']:>10.4f}"
+            f"{row['false_accept_rate'] or 0:>8.4f}{row['false_reject_rate'] or 0:>8.4f}"
+            f"{row['misidentification_rate'] or 0:>8.4f}{row['match_us_per_probe']:>10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
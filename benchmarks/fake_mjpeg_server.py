@@ -0,0 +1,160 @@
+# benchmarks/fake_mjpeg_server.py
+#
+# Raspberry Piのカメラの代わりに、合成画像のMJPEGストリームを配信するローカルサーバー。
+# 受信処理の動作確認や、スループットのベンチマークに使う。
+#
+# 実行例:
+#   python -m benchmarks.fake_mjpeg_server --port 8080 --fps 30 --width 1280 --height 720
+#   (RASPI_STREAM_URL="http://127.0.0.1:8080/stream" として接続する)
+
+import argparse
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+import numpy as np
+
+BOUNDARY = "frame"
+
+
+def make_jpegs(
+    width: int, height: int, count: int = 30, quality: int = 80
+) -> list[bytes]:
+    """横に移動する矩形を描いた合成フレームをJPEGにエンコードしておく"""
+    rng = np.random.default_rng(0)
+    background = rng.integers(0, 64, size=(height, width, 3), dtype=np.uint8)
+    size = max(8, min(width, height) // 4)
+    jpegs = []
+    for i in range(count):
+        frame = background.copy()
+        x = int((width - size) * i / max(1, count - 1))
+        y = (height - size) // 2
+        cv2.rectangle(frame, (x, y), (x + size, y + size), (200, 180, 160), -1)
+        cv2.putText(
+            frame,
+            str(i),
+            (10, 30),
+            cv2.FONT_HERSHEY_SIMPLEX,
+            1.0,
+            (255, 255, 255),
+            2,
+        )
+        ok, encoded = cv2.imencode(
+            ".jpg", frame, [int(cv2.IMWRITE_JPEG_QUALITY), quality]
+        )
+        jpegs.append(encoded.tobytes())
+    return jpegs
+
+
+class FakeMjpegServer:
+    """
+    multipart/x-mixed-replace でJPEGを配信するHTTPサーバー。
+
+    fps: 配信レート (0の場合は送信できる限り速く送る)
+    content_length: パートにContent-Lengthヘッダを付けるか
+    max_frames: 1接続あたりの送信フレーム数 (0で無制限)。切断・再接続の確認に使う
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        width: int = 640,
+        height: int = 480,
+        fps: float = 30.0,
+        content_length: bool = True,
+        max_frames: int = 0,
+    ):
+        self.fps = fps
+        self.content_length = content_length
+        self.max_frames = max_frames
+        self.jpegs = make_jpegs(width, height)
+        self.frames_sent = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server._stream(self)
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._httpd.daemon_threads = True
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/stream"
+
+    def start(self) -> "FakeMjpegServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self) -> None:
+        self._httpd.serve_forever()
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    # --- Internal API ---
+    def _stream(self, handler: BaseHTTPRequestHandler) -> None:
+        handler.send_response(200)
+        handler.send_header(
+            "Content-Type", f"multipart/x-mixed-replace; boundary={BOUNDARY}"
+        )
+        handler.end_headers()
+        interval = 1.0 / self.fps if self.fps > 0 else 0.0
+        next_time = time.perf_counter()
+        sent = 0
+        try:
+            while self.max_frames <= 0 or sent < self.max_frames:
+                jpeg = self.jpegs[sent % len(self.jpegs)]
+                headers = f"--{BOUNDARY}\r\nContent-Type: image/jpeg\r\n"
+                if self.content_length:
+                    headers += f"Content-Length: {len(jpeg)}\r\n"
+                handler.wfile.write(headers.encode() + b"\r\n" + jpeg + b"\r\n")
+                sent += 1
+                self.frames_sent += 1
+                if interval:
+                    next_time += interval
+                    delay = next_time - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="ローカルの疑似MJPEGサーバー")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--fps", type=float, default=30.0, help="0で無制限")
+    parser.add_argument("--no-content-length", action="store_true")
+    parser.add_argument("--max-frames", type=int, default=0, help="1接続あたりの上限")
+    args = parser.parse_args()
+
+    server = FakeMjpegServer(
+        args.host,
+        args.port,
+        args.width,
+        args.height,
+        args.fps,
+        content_length=not args.no_content_length,
+        max_frames=args.max_frames,
+    )
+    print(f"配信中: {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,23 @@
+from src.config import config
+
 bind = "0.0.0.0:8001"
 workers = 1
 worker_class = "eventlet"
 loglevel = "info"
+# マスタープロセスでアプリを読み込み、モデルとFaceDBをワーカー間で共有する
+preload_app = config.PRELOAD_APP
+
+
+def when_ready(server):
+    """ワーカーをフォークする直前に、マスタープロセスでモデルとFaceDBを読み込む"""
+    if server.cfg.preload_app:
+        from src.app import preload_resources
+
+        preload_resources()
+
+
+def post_worker_init(worker):
+    """ワーカーの起動直後に、最初のリクエストを待たずにウォームアップを開始する"""
+    from src.app import start_warmup
+
+    start_warmup()
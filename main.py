@@ -9,7 +9,7 @@ import sys
 from src.app import app
 
 # クリーンアップ用の関数をインポート
-from src.camera_control import release_raspi_camera
+from src.camera_control import release_all_cameras
 
 
 # --- シグナルハンドラによる正常なシャットダウン処理 ---
@@ -21,7 +21,7 @@ def graceful_shutdown(signum, frame):
         f"シグナル {signal.Signals(signum).name} を受信。シャットダウンシーケンスを開始します..."
     )
     # このシャットダウン処理は、Gunicornのマスタープロセスで実行されます。
-    release_raspi_camera()
+    release_all_cameras()
     logging.info("アプリケーションを正常にシャットダウンしました。")
     sys.exit(0)
 
@@ -5,18 +5,32 @@ import eventlet
 
 eventlet.monkey_patch()
 
+import gc
+import hmac
+import importlib
 import logging
 import os
 from threading import Lock
 
+from eventlet import tpool
+
 # ★★★ render_template をインポート ★★★
-from flask import Flask, render_template
-from flask_socketio import SocketIO
+from flask import Flask, Response, abort, jsonify, render_template, request, url_for
+from flask_socketio import SocketIO, join_room, leave_room
 
-from src.camera_control import init_raspi_camera
+from src.camera_control import init_all_cameras
 from src.config import config
-from src.recognition.worker import face_recognition_worker
-from src.streaming.receiver import StreamReceiver
+from src.events.log import EventLog
+from src.metrics import REGISTRY
+from src.recognition.face_db import FaceDB
+from src.recognition.reloader import FaceDBReloader
+from src.startup import StartupProgress, load_models
+from src.streaming.broadcaster import FacesBroadcaster
+from src.streaming.receiver import StreamReceiver, create_receiver
+from src.streaming.restream import BOUNDARY, RestreamHub
+
+# face_recognition (dlib) に依存する認識ワーカーは、起動を遅らせないよう
+# ウォームアップの中で読み込む (src.recognition.worker)
 
 # --- グローバル変数と設定 ---
 logging.basicConfig(
@@ -27,43 +41,261 @@ logging.basicConfig(
 app = Flask(__name__, template_folder="templates", static_folder="static")
 sio = SocketIO(app, async_mode="eventlet", cors_allowed_origins="*")
 
-# ワーカーの初期化が一度だけ実行されることを保証するためのロック
-worker_setup_lock = Lock()
-worker_initialized = False
+# ウォームアップの開始が一度だけ実行されることを保証するためのロック
+warmup_lock = Lock()
+warmup_started = False
+# ウォームアップの進捗 (/ready で公開する)
+progress = StartupProgress()
+
+# カメラIDごとの設定 (設定ファイルの順序を保持する)
+cameras = {camera["id"]: camera for camera in config.CAMERA_SOURCES}
 
+# 以下は軽量なオブジェクトなので、リクエストを受け付ける前に生成しておく
+# カメラIDごとのレシーバー (ウォームアップでカメラの初期化後に登録される)
+receivers: dict[str, StreamReceiver] = {}
+# 顔データベースとその再構築を管理するオブジェクト (ギャラリーはウォームアップで構築する)
+face_db = FaceDB(autoload=False)
+face_db_reloader = FaceDBReloader(sio, face_db)
+# faces_update をクライアントに差分で配信するオブジェクト
+broadcaster = FacesBroadcaster(sio)
+# 認識結果をイベントとしてまとめてSQLiteに記録するオブジェクト
+event_log = EventLog(sio) if config.EVENT_LOG_ENABLED else None
+# 受信済みのフレームをブラウザに再配信するオブジェクト
+restream_hub = RestreamHub(sio, receivers, broadcaster)
 
-# --- ワーカープロセスの初期化 ---
-def setup_worker_resources():
-    """Gunicornの各ワーカープロセスで一度だけ実行される初期化処理"""
-    global worker_initialized
-    if worker_initialized:
+
+# --- 起動処理 ---
+def preload_resources():
+    """
+    重いモジュールの読み込み・モデルの初期化・FaceDBの構築を同期的に行う。
+    Gunicornの preload_app モードでは、ワーカーをフォークする前にマスタープロセスで呼び出し、
+    読み込んだモデルと埋め込みストアをコピーオンライトで全ワーカーに共有させる。
+    """
+    with progress.stage("imports"):
+        importlib.import_module("src.recognition.worker")
+    with progress.stage("models"):
+        load_models()
+    with progress.stage("face_db"):
+        face_db.load()
+    # 共有するオブジェクトをGCの対象から外し、参照カウント以外でページが複製されないようにする
+    gc.freeze()
+    logging.info(f"マスタープロセス {os.getpid()} でモデルとFaceDBを読み込みました。")
+
+
+def start_warmup():
+    """
+    ワーカーの起動時 (Gunicornの post_worker_init) にバックグラウンドのウォームアップを開始する。
+    最初のリクエストを待たずに始めるが、フックを使わない起動方法に備えて
+    リクエスト時にも呼び出す (2回目以降は何もしない)。
+    """
+    global warmup_started
+    if warmup_started:
         return
-    with worker_setup_lock:
-        if worker_initialized:
+    with warmup_lock:
+        if warmup_started:
             return
+        warmup_started = True
+        sio.start_background_task(warm_up)
+
 
-        logging.info(f"ワーカープロセス {os.getpid()} の初期化を開始します...")
-        init_raspi_camera()
-        stream_receiver = StreamReceiver(config.RASPI_STREAM_URL)
-        sio.start_background_task(face_recognition_worker, sio, stream_receiver)
-        logging.info(f"ワーカープロセス {os.getpid()} の初期化が完了しました。")
-        worker_initialized = True
+def warm_up():
+    """
+    ワーカープロセスの起動処理。重い処理はtpool (FaceDBの初回構築はエンコード用の
+    プロセスプール) で行うため、その間もリクエスト (/ready など) には応答できる。
+    preload_app で済ませた段階は省略する。
+    """
+    logging.info(f"ワーカープロセス {os.getpid()} のウォームアップを開始します...")
+    try:
+        if not progress.done("imports"):
+            with progress.stage("imports"):
+                tpool.execute(importlib.import_module, "src.recognition.worker")
+        if not progress.done("models"):
+            with progress.stage("models"):
+                tpool.execute(load_models)
+        if not progress.done("face_db"):
+            with progress.stage("face_db"):
+                # 構築に失敗しても空のギャラリーで認識を続ける (エラーは /admin/facedb で確認できる)
+                face_db_reloader.run()
+
+        with progress.stage("cameras"):
+            init_all_cameras()
+            for camera_id, camera in cameras.items():
+                receivers[camera_id] = create_receiver(camera["stream_url"])
+
+        with progress.stage("recognition"):
+            from src.recognition.worker import face_recognition_worker
+
+            sio.start_background_task(
+                face_recognition_worker,
+                sio,
+                receivers,
+                face_db,
+                face_db_reloader,
+                broadcaster,
+                event_log,
+            )
+    except Exception as e:
+        logging.error(f"ウォームアップに失敗しました: {e}", exc_info=True)
+        return
+    progress.ready = True
+    logging.info(f"ワーカープロセス {os.getpid()} のウォームアップが完了しました。")
 
 
 # --- ルートとSocket.IOイベントハンドラ ---
+def resolve_camera_id(camera_id: str | None) -> str:
+    """指定されたカメラIDを検証する。未指定・不明な場合は最初のカメラを返す"""
+    if camera_id in cameras:
+        return camera_id
+    return next(iter(cameras))
+
+
 @app.route("/")
 def index():
     """
-    クライアントに表示するHTMLをレンダリングする
+    クライアントに表示するHTMLをレンダリングする (?camera=<id> で表示するカメラを選択)
     """
-    # 最初のリクエスト時にワーカーの初期化をトリガー
-    setup_worker_resources()
+    # フックを使わずに起動した場合は、最初のリクエストでウォームアップを開始する
+    start_warmup()
+    camera_id = resolve_camera_id(request.args.get("camera"))
+    # 再配信を使う場合は、Raspberry Piではなくこのサーバーから映像を取得させる
+    if config.RESTREAM_FOR_VIEWERS:
+        stream_url = url_for("stream", camera=camera_id)
+    else:
+        stream_url = cameras[camera_id]["stream_url"]
+    # 枠を焼き込んだ映像の場合、クライアント側では枠を描かない
+    client_overlay = not (config.RESTREAM_FOR_VIEWERS and config.RESTREAM_ANNOTATE)
     # ★★★ `render_template` を使って外部HTMLファイルをレンダリング ★★★
-    return render_template("index.html", stream_url=config.RASPI_STREAM_URL)
+    return render_template(
+        "index.html",
+        stream_url=stream_url,
+        client_overlay=client_overlay,
+        camera_id=camera_id,
+        camera_ids=list(cameras),
+        faces_format=config.BROADCAST_FORMAT,
+    )
+
+
+@app.route("/stream")
+def stream():
+    """
+    受信済みのフレームをMJPEGで再配信する (?camera=<id>&annotate=0|1)。
+    各フレームは1回だけエンコードされ、全視聴者で共有される
+    """
+    start_warmup()
+    camera_id = resolve_camera_id(request.args.get("camera"))
+    if camera_id not in receivers:
+        # ウォームアップでカメラが初期化されるまでは配信できない
+        abort(503)
+    annotate = request.args.get("annotate")
+    if annotate is None:
+        annotate = config.RESTREAM_ANNOTATE
+    else:
+        annotate = annotate.lower() in ("true", "1", "t")
+    return Response(
+        restream_hub.stream(camera_id, annotate),
+        mimetype=f"multipart/x-mixed-replace; boundary={BOUNDARY}",
+        headers={"Cache-Control": "no-cache, private", "Pragma": "no-cache"},
+    )
+
+
+@app.route("/ready")
+def ready():
+    """ウォームアップの進捗を返す。完了するまでは503を返す (ロードバランサのヘルスチェック用)"""
+    start_warmup()
+    return jsonify(progress.status()), 200 if progress.ready else 503
+
+
+@app.route("/metrics")
+def metrics():
+    """Prometheusのテキスト形式でメトリクスを返す (取得してもワーカーは起動しない)"""
+    if not config.METRICS_ENABLED:
+        abort(404)
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
 
 
 @sio.on("connect", namespace="/live")
 def on_connect():
-    """最初のクライアント接続時にワーカーの初期化をトリガー"""
-    setup_worker_resources()
-    logging.info("クライアントが接続しました。")
+    """最初のクライアント接続時にワーカーの初期化をトリガーし、カメラのルームに参加させる"""
+    start_warmup()
+    camera_id = resolve_camera_id(request.args.get("camera"))
+    join_room(camera_id)
+    # 以降の差分を適用できるよう、現在の状態を全件送る
+    broadcaster.send_snapshot(camera_id, to=request.sid)
+    logging.info(f"クライアントが接続しました。(カメラ: {camera_id})")
+
+
+@sio.on("subscribe", namespace="/live")
+def on_subscribe(data):
+    """購読するカメラを切り替える"""
+    camera_id = resolve_camera_id((data or {}).get("camera"))
+    for other in cameras:
+        if other != camera_id:
+            leave_room(other)
+    join_room(camera_id)
+    broadcaster.send_snapshot(camera_id, to=request.sid)
+    return {"camera": camera_id}
+
+
+@sio.on("resync", namespace="/live")
+def on_resync(data):
+    """差分を適用できなくなったクライアントに、現在の状態を全件送り直す"""
+    camera_id = resolve_camera_id((data or {}).get("camera"))
+    broadcaster.send_snapshot(camera_id, to=request.sid)
+
+
+# --- 管理API ---
+def require_admin_token():
+    """管理APIのBearerトークンを検証する。トークン未設定の場合は管理APIを無効にする"""
+    if not config.ADMIN_API_TOKEN:
+        abort(404)
+    auth = request.headers.get("Authorization", "")
+    token = auth[len("Bearer ") :] if auth.startswith("Bearer ") else ""
+    # 非ASCIIの文字列はcompare_digestがTypeErrorを送出する (500になる) ため、バイト列で比較する
+    if not hmac.compare_digest(token.encode(), config.ADMIN_API_TOKEN.encode()):
+        abort(401)
+
+
+@app.route("/admin/facedb", methods=["GET"])
+def facedb_status():
+    """FaceDBの世代番号・最終構築時刻・再構築の状態を返す"""
+    require_admin_token()
+    start_warmup()
+    return jsonify(face_db_reloader.status())
+
+
+@app.route("/admin/facedb/reload", methods=["POST"])
+def facedb_reload():
+    """
+    FaceDBの再構築をバックグラウンドで開始する。
+    ?full=1 を指定するとストアを破棄して全件を再エンコードする
+    """
+    require_admin_token()
+    start_warmup()
+    full = request.args.get("full", "").lower() in ("true", "1", "t")
+    started = face_db_reloader.request(full=full)
+    return jsonify({"started": started, **face_db_reloader.status()}), 202
+
+
+@app.route("/admin/events", methods=["GET"])
+def recent_events():
+    """
+    認識イベントを新しい順に返す。
+    ?camera=<id>&person=<name>&since=<UNIX時刻>&until=<UNIX時刻>&limit=<件数> で絞り込める
+    """
+    require_admin_token()
+    if event_log is None:
+        abort(404)
+    try:
+        since = request.args.get("since", type=float)
+        until = request.args.get("until", type=float)
+        limit = min(max(int(request.args.get("limit", 100)), 1), 1000)
+    except ValueError:
+        abort(400)
+    events = event_log.recent(
+        camera=request.args.get("camera"),
+        person=request.args.get("person"),
+        since=since,
+        until=until,
+        limit=limit,
+    )
+    return jsonify({"events": events, "count": len(events)})
@@ -10,9 +10,12 @@ from src.config import config
 logger = logging.getLogger(__name__)
 
 
-def init_raspi_camera():
-    """Raspberry Piのカメラを初期化するAPIを呼び出す"""
-    url = f"{config.RASPI_API_BASE_URL}/camera/init"
+def init_raspi_camera(api_base_url: str | None = None, exit_on_failure: bool = True):
+    """
+    Raspberry Piのカメラを初期化するAPIを呼び出す。
+    exit_on_failure=Falseの場合、失敗してもプログラムを終了せずにFalseを返す
+    """
+    url = f"{api_base_url or config.RASPI_API_BASE_URL}/camera/init"
     params = {"width": config.RASPI_CAMERA_WIDTH, "height": config.RASPI_CAMERA_HEIGHT}
     try:
         logger.info(
@@ -27,12 +30,14 @@ def init_raspi_camera():
         logger.error(
             "Raspberry Pi側のサーバーが起動しているか、URLが正しいか確認してください。"
         )
+        if not exit_on_failure:
+            return False
         sys.exit(1)  # 致命的なエラーとしてプログラムを終了
 
 
-def release_raspi_camera():
+def release_raspi_camera(api_base_url: str | None = None):
     """Raspberry Piのカメラを解放するAPIを呼び出す"""
-    url = f"{config.RASPI_API_BASE_URL}/camera/release"
+    url = f"{api_base_url or config.RASPI_API_BASE_URL}/camera/release"
     try:
         logger.info(f"Raspberry Piカメラの解放を試みます... URL: {url}")
         response = requests.post(url, timeout=10)
@@ -40,3 +45,22 @@ def release_raspi_camera():
         logger.info(f"Raspberry Piカメラの解放に成功しました: {response.text}")
     except requests.exceptions.RequestException as e:
         logger.error(f"Raspberry Piカメラの解放中にエラーが発生しました: {e}")
+
+
+def init_all_cameras():
+    """
+    設定された全カメラを初期化する。
+    カメラが1台の場合は従来どおり失敗時にプログラムを終了し、
+    複数台の場合は1台の失敗で全体を止めないようにログだけを残す
+    """
+    exit_on_failure = len(config.CAMERA_SOURCES) == 1
+    for camera in config.CAMERA_SOURCES:
+        if camera.get("api_base_url"):
+            init_raspi_camera(camera["api_base_url"], exit_on_failure=exit_on_failure)
+
+
+def release_all_cameras():
+    """設定された全カメラを解放する"""
+    for camera in config.CAMERA_SOURCES:
+        if camera.get("api_base_url"):
+            release_raspi_camera(camera["api_base_url"])
@@ -1,3 +1,4 @@
+import json
 import os
 from pathlib import Path
 
@@ -22,24 +23,184 @@ class Config:
     HOST = os.getenv("HOST", "0.0.0.0")
     PORT = int(os.getenv("PORT", 5000))
     DEBUG = os.getenv("DEBUG", "False").lower() in ("true", "1", "t")
+    # Gunicornのマスタープロセスでモデルと埋め込みストアを読み込み、フォークした
+    # ワーカー間でコピーオンライトで共有する (preload_app)
+    PRELOAD_APP = os.getenv("PRELOAD_APP", "false").lower() in ("true", "1", "t")
 
     # ストリーム設定
     RASPI_API_BASE_URL = os.getenv("RASPI_API_BASE_URL")
     RASPI_STREAM_URL = os.getenv("RASPI_STREAM_URL")
-    if not RASPI_API_BASE_URL or not RASPI_STREAM_URL:
+
+    # 複数カメラ設定 (JSON配列)。未設定の場合は RASPI_* の1台のみを使う
+    # 例: [{"id": "entrance", "stream_url": "http://.../stream", "api_base_url": "http://..."}]
+    CAMERA_SOURCES = json.loads(os.getenv("CAMERA_SOURCES") or "[]")
+    if not CAMERA_SOURCES:
+        if not RASPI_API_BASE_URL or not RASPI_STREAM_URL:
+            raise ValueError(
+                "環境変数 `RASPI_API_BASE_URL` と `RASPI_STREAM_URL` の両方を設定してください。"
+            )
+        CAMERA_SOURCES = [
+            {
+                "id": "default",
+                "stream_url": RASPI_STREAM_URL,
+                "api_base_url": RASPI_API_BASE_URL,
+            }
+        ]
+    if any(not c.get("id") or not c.get("stream_url") for c in CAMERA_SOURCES):
         raise ValueError(
-            "環境変数 `RASPI_API_BASE_URL` と `RASPI_STREAM_URL` の両方を設定してください。"
+            "`CAMERA_SOURCES` の各要素には `id` と `stream_url` を設定してください。"
         )
 
     # カメラ初期化設定
     RASPI_CAMERA_WIDTH = int(os.getenv("RASPI_CAMERA_WIDTH", 640))
     RASPI_CAMERA_HEIGHT = int(os.getenv("RASPI_CAMERA_HEIGHT", 480))
 
+    # ストリーム受信設定
+    # カメラごとのフレームリングバッファのスロット数 (最小3)
+    STREAM_RING_SIZE = int(os.getenv("STREAM_RING_SIZE", 4))
+    # 新しいフレームを待つ最大時間（秒）。超えると接続状態を確認して待ち直す
+    STREAM_FRAME_TIMEOUT = float(os.getenv("STREAM_FRAME_TIMEOUT", 1.0))
+    # フレームの受信方式 (opencv: cv2.VideoCapture, mjpeg: MJPEGを直接受信して必要な分だけデコード)
+    STREAM_RECEIVER = os.getenv("STREAM_RECEIVER", "opencv").lower()
+    # mjpeg受信方式の再接続待機時間の上限（秒）。失敗するたびに倍々で延ばす
+    STREAM_RECONNECT_MAX_DELAY = float(os.getenv("STREAM_RECONNECT_MAX_DELAY", 30.0))
+    # mjpeg受信方式で、検出スケールに合わせてJPEGを縮小デコードする (true/false)
+    STREAM_REDUCED_DECODE = (
+        os.getenv("STREAM_REDUCED_DECODE", "false").lower() == "true"
+    )
+
     # 顔認識設定
     FACE_DATA_DIR = PROJECT_ROOT / os.getenv("FACE_DATA_DIR", "data/people")
+    # 顔検出モデル (hog, cnn, cascade: 軽量な検出器の候補だけをhog/cnnで確認する2段階検出)
     RECOGNITION_MODEL = os.getenv("RECOGNITION_MODEL", "hog")
-    WORKER_SLEEP_INTERVAL = float(os.getenv("WORKER_SLEEP_INTERVAL", 0.1))
+    # cascade: 候補検出に使うモデル (Haar/LBPカスケードのXML、またはYuNetのONNX)。
+    # 未設定の場合はOpenCV同梱の haarcascade_frontalface_default.xml を使う
+    CASCADE_PROPOSAL_MODEL = os.getenv("CASCADE_PROPOSAL_MODEL", "")
+    if CASCADE_PROPOSAL_MODEL:
+        CASCADE_PROPOSAL_MODEL = str(PROJECT_ROOT / CASCADE_PROPOSAL_MODEL)
+    # cascade: 候補を確認するモデル (hog, cnn)
+    CASCADE_REFINE_MODEL = os.getenv("CASCADE_REFINE_MODEL", "hog").lower()
+    # cascade: 候補の領域を確認するときの拡大回数 (1回ごとに2倍)
+    CASCADE_UPSAMPLE = int(os.getenv("CASCADE_UPSAMPLE", 2))
+    # cascade: 候補の周囲に付ける余白 (候補の大きさに対する割合)
+    CASCADE_PADDING = float(os.getenv("CASCADE_PADDING", 0.5))
+    # cascade: 候補とする顔の最小サイズ (検出画像上のピクセル数)
+    CASCADE_MIN_SIZE = int(os.getenv("CASCADE_MIN_SIZE", 20))
+    # 顔検出を行う解像度 (元の解像度に対する比率)。小さいほど高速だが小さな顔を見逃しやすい
+    DETECTION_SCALE = float(os.getenv("DETECTION_SCALE", 0.25))
+    # キャプチャから結果送信までの遅延の目標（秒）。超えると認識の頻度を下げる。0で無効
+    RECOGNITION_TARGET_LATENCY = float(os.getenv("RECOGNITION_TARGET_LATENCY", 0.5))
+    # 顔認識に使ってよいCPUの割合 (全コアに対する0〜1の値)。0で無制限
+    RECOGNITION_CPU_BUDGET = float(os.getenv("RECOGNITION_CPU_BUDGET", 0.8))
+    # 動き検出: 画素の輝度差がこの値を超えたら変化とみなす
+    MOTION_GATE_PIXEL_THRESHOLD = int(os.getenv("MOTION_GATE_PIXEL_THRESHOLD", 20))
+    # 動き検出: 変化した画素の割合がこの値以上なら認識に回す。0で動き検出を無効化
+    MOTION_GATE_AREA = float(os.getenv("MOTION_GATE_AREA", 0.005))
+    # 動きがなくても、この秒数ごとに1回は認識に回す。0の場合は動きがあるまで認識しない
+    MOTION_GATE_MAX_IDLE = float(os.getenv("MOTION_GATE_MAX_IDLE", 2.0))
+    # 全カメラで共有する顔認識の同時実行数 (0の場合はCPUコア数)
+    RECOGNITION_CONCURRENCY = int(os.getenv("RECOGNITION_CONCURRENCY", 0))
+    # 検出・照合の実行方式 (thread: tpoolのスレッド, process: ワーカープロセスのプール)
+    RECOGNITION_EXECUTOR = os.getenv("RECOGNITION_EXECUTOR", "thread").lower()
+    # processモードのワーカープロセス数 (0の場合はCPUコア数)
+    RECOGNITION_PROCESSES = int(os.getenv("RECOGNITION_PROCESSES", 0))
+    # processモードでワーカープロセスの応答を待つ最大時間（秒）。超えたら再起動する
+    RECOGNITION_PROCESS_TIMEOUT = float(os.getenv("RECOGNITION_PROCESS_TIMEOUT", 10))
+    # threadモードで複数フレームの顔をまとめてエンコード・照合する最大顔数 (1でバッチ処理しない)
+    RECOGNITION_BATCH_SIZE = int(os.getenv("RECOGNITION_BATCH_SIZE", 8))
+    # バッチに他のフレームの顔が集まるのを待つ最大時間（秒）
+    RECOGNITION_BATCH_MAX_WAIT = float(os.getenv("RECOGNITION_BATCH_MAX_WAIT", 0.01))
+    # 認識待ちのフレームが溢れたときの方針 (latest, drop_oldest, every_nth)
+    FRAME_QUEUE_POLICY = os.getenv("FRAME_QUEUE_POLICY", "latest").lower()
+    # drop_oldest / every_nth で保持する認識待ちのフレーム数 (latestは常に1)
+    FRAME_QUEUE_SIZE = int(os.getenv("FRAME_QUEUE_SIZE", 2))
+    # every_nth で認識に回すフレームの間隔 (N枚に1枚)
+    FRAME_QUEUE_EVERY_NTH = int(os.getenv("FRAME_QUEUE_EVERY_NTH", 3))
+    # キャプチャからこの秒数を過ぎたフレームは認識せずに捨てる。0で無効
+    FRAME_MAX_AGE = float(os.getenv("FRAME_MAX_AGE", 1.0))
     FACE_MATCH_THRESHOLD = float(os.getenv("FACE_MATCH_THRESHOLD", 0.5))
+    # 人物ごとのしきい値 = 登録ベクトル同士の最大距離 × この係数
+    # (FACE_MATCH_MIN_THRESHOLD〜FACE_MATCH_THRESHOLD に収める)。0の場合は全員に共通のしきい値を使う
+    FACE_MATCH_SPREAD_FACTOR = float(os.getenv("FACE_MATCH_SPREAD_FACTOR", 1.0))
+    FACE_MATCH_MIN_THRESHOLD = float(os.getenv("FACE_MATCH_MIN_THRESHOLD", 0.4))
+    # 最も近い人物と2番目に近い人物の距離の差がこの値未満の場合は、判別できないためUnknownとする
+    FACE_MATCH_MARGIN = float(os.getenv("FACE_MATCH_MARGIN", 0.05))
+    # FaceDB構築時のエンコード並列数 (0の場合はCPUコア数)
+    FACE_DB_BUILD_WORKERS = int(os.getenv("FACE_DB_BUILD_WORKERS", 0))
+    # 顔データディレクトリの変更監視間隔（秒）。0の場合は監視しない
+    FACE_DB_WATCH_INTERVAL = float(os.getenv("FACE_DB_WATCH_INTERVAL", 5.0))
+
+    # 顔登録設定
+    # 1人あたりの照合用の代表ベクトルの上限 (k-メドイド + 重心)。0の場合は絞り込まない
+    ENROLL_MAX_VECTORS = int(os.getenv("ENROLL_MAX_VECTORS", 8))
+    # 登録画像の品質スコア (0〜1) の下限。下回る画像は照合に使わない
+    ENROLL_MIN_QUALITY = float(os.getenv("ENROLL_MIN_QUALITY", 0.3))
+    # 人物内の他の画像からこの距離以上離れたエンコーディングは外れ値として除く (0で無効)
+    ENROLL_OUTLIER_DISTANCE = float(os.getenv("ENROLL_OUTLIER_DISTANCE", 0.6))
+    # 複数の顔を含む画像で、最大の顔を本人とみなすのに必要な2番目の顔との面積比
+    ENROLL_DOMINANT_FACE_RATIO = float(os.getenv("ENROLL_DOMINANT_FACE_RATIO", 1.5))
+
+    # faces_update 配信設定
+    # クライアントへの送信頻度の上限 (回/秒)。その間の認識結果は最新のものだけを送る
+    BROADCAST_MAX_RATE = float(os.getenv("BROADCAST_MAX_RATE", 10.0))
+    # 顔の位置・サイズがこのピクセル数を超えて変化した場合だけ更新を送る
+    BROADCAST_MOVE_THRESHOLD = int(os.getenv("BROADCAST_MOVE_THRESHOLD", 4))
+    # ペイロードの形式 (json, msgpack)。msgpackはバイナリで送るためサイズが小さい
+    BROADCAST_FORMAT = os.getenv("BROADCAST_FORMAT", "json").lower()
+
+    # 再配信 (/stream) 設定
+    # トップページの映像をRaspberry Piからではなく、このサーバーの /stream から取得する (true/false)
+    RESTREAM_FOR_VIEWERS = os.getenv("RESTREAM_FOR_VIEWERS", "false").lower() == "true"
+    # /stream の映像に顔の枠と名前を焼き込む (true/false)。?annotate=0|1 で上書きできる
+    RESTREAM_ANNOTATE = os.getenv("RESTREAM_ANNOTATE", "true").lower() == "true"
+    # 再配信の最大フレームレート
+    RESTREAM_MAX_FPS = float(os.getenv("RESTREAM_MAX_FPS", 15.0))
+    # 再配信のJPEG品質 (0〜100)
+    RESTREAM_JPEG_QUALITY = int(os.getenv("RESTREAM_JPEG_QUALITY", 80))
+
+    # 認識イベント記録設定
+    # 認識結果を「人物がカメラで認識された期間」のイベントとして記録する (true/false)
+    EVENT_LOG_ENABLED = os.getenv("EVENT_LOG_ENABLED", "true").lower() == "true"
+    # イベントを追記するSQLiteファイルのパス
+    EVENT_DB_PATH = PROJECT_ROOT / os.getenv("EVENT_DB_PATH", "data/events.sqlite3")
+    # この秒数以上認識されなかった場合に滞在の終わりとみなす
+    EVENT_GAP = float(os.getenv("EVENT_GAP", 5.0))
+    # 1回の滞在で認識されたフレーム数がこの値未満の場合は誤認識として記録しない
+    EVENT_MIN_FRAMES = int(os.getenv("EVENT_MIN_FRAMES", 3))
+    # 滞在がこの秒数を超えたら区切って記録する。0で区切らない
+    EVENT_MAX_DURATION = float(os.getenv("EVENT_MAX_DURATION", 600.0))
+    # 確定したイベントをまとめて書き込む間隔（秒）
+    EVENT_FLUSH_INTERVAL = float(os.getenv("EVENT_FLUSH_INTERVAL", 5.0))
+    # 未書き込みのイベントを保持する上限件数。超えた分は古いものから捨てる
+    EVENT_BUFFER_MAX = int(os.getenv("EVENT_BUFFER_MAX", 10000))
+
+    # メトリクス設定
+    # Prometheus形式のメトリクスを /metrics で公開する (true/false)
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
+    # 管理API設定 (未設定の場合、管理APIは無効)
+    ADMIN_API_TOKEN = os.getenv("ADMIN_API_TOKEN")
+
+    # 顔追跡設定
+    # 顔検出を行う間隔 (フレーム数)。1の場合は毎フレーム検出する
+    TRACK_KEYFRAME_INTERVAL = int(os.getenv("TRACK_KEYFRAME_INTERVAL", 5))
+    # キーフレームで検出結果を既存トラックに対応付けるIoUのしきい値
+    TRACK_IOU_THRESHOLD = float(os.getenv("TRACK_IOU_THRESHOLD", 0.3))
+    # テンプレートマッチングのスコアがこの値未満の場合は見失ったとみなす
+    TRACK_MIN_SCORE = float(os.getenv("TRACK_MIN_SCORE", 0.6))
+    # 連続して見失ってもよいフレーム数。超えると次のフレームで再検出する
+    TRACK_MAX_MISSES = int(os.getenv("TRACK_MAX_MISSES", 1))
+    # テンプレートの探索範囲 (ボックスサイズに対する余白の割合)
+    TRACK_SEARCH_MARGIN = float(os.getenv("TRACK_SEARCH_MARGIN", 0.5))
+    # トラックの人物名を直近の照合結果の多数決で決める際の投票数 (1の場合は最新の結果をそのまま使う)
+    TRACK_VOTE_WINDOW = int(os.getenv("TRACK_VOTE_WINDOW", 5))
+    # 同じトラックの前回照合したエンコーディングとの距離がこの値未満の場合は、前回の照合結果を再利用する (0で無効)
+    TRACK_DEDUP_DISTANCE = float(os.getenv("TRACK_DEDUP_DISTANCE", 0.1))
+
+    # 顔照合インデックス設定
+    FACE_INDEX_BACKEND = os.getenv("FACE_INDEX_BACKEND", "exact")
+    FACE_INDEX_IVF_NLIST = int(os.getenv("FACE_INDEX_IVF_NLIST", 0))
+    FACE_INDEX_IVF_NPROBE = int(os.getenv("FACE_INDEX_IVF_NPROBE", 8))
 
 
 # 設定クラスのインスタンスを作成
@@ -0,0 +1,240 @@
+# src/events/log.py
+
+from __future__ import annotations
+
+import atexit
+import logging
+import time
+import uuid
+from collections import deque
+
+from eventlet import tpool
+from flask_socketio import SocketIO
+
+from src.config import config
+from src.events.store import EventStore
+from src.metrics import EVENTS, QUEUE_DEPTH
+
+logger = logging.getLogger(__name__)
+
+
+class _Sighting:
+    """1台のカメラで1人の人物が継続して認識されている期間 (確定前のイベント)"""
+
+    __slots__ = ("person", "camera", "started_at", "last_seen", "frames")
+
+    def __init__(self, person: str, camera: str, timestamp: float):
+        self.person = person
+        self.camera = camera
+        self.started_at = timestamp
+        self.last_seen = timestamp
+        self.frames = 1
+
+    def to_event(self, event_id: str | None = None) -> dict:
+        return {
+            "event_id": event_id,
+            "person": self.person,
+            "camera": self.camera,
+            "started_at": self.started_at,
+            "ended_at": self.last_seen,
+            "frames": self.frames,
+        }
+
+
+class EventLog:
+    """
+    認識結果を「人物Xがカメラ Y で t1 から t2 まで認識された」というイベントにまとめて記録するクラス。
+
+    - observe() は送信済みの認識結果をメモリ上の滞在 (カメラ × 人物) に加えるだけで、
+      I/Oは行わない (認識ループを止めない)
+    - EVENT_GAP 秒以上認識されなかった滞在を確定し、EVENT_MIN_FRAMES フレーム未満しか
+      認識されなかったもの (一瞬の誤認識) は捨てる。EVENT_MAX_DURATION 秒を超える滞在は
+      区切って確定し、長時間の滞在もクラッシュで失われないようにする
+    - 確定したイベントはバッファに溜め、EVENT_FLUSH_INTERVAL 秒ごとにtpoolのスレッドで
+      まとめて EventStore に追記する。書き込みに失敗した場合はバッファに戻して再試行し、
+      EVENT_BUFFER_MAX 件を超えた分は古いものから捨てる
+    状態の更新はすべてeventletのグリーンスレッド上で行われるため、ロックは不要。
+    """
+
+    def __init__(
+        self,
+        sio: SocketIO,
+        store: EventStore | None = None,
+        min_frames: int | None = None,
+        gap: float | None = None,
+        max_duration: float | None = None,
+        flush_interval: float | None = None,
+        buffer_max: int | None = None,
+    ):
+        self._sio = sio
+        self._store = store or EventStore(config.EVENT_DB_PATH)
+        self.min_frames = max(1, min_frames or config.EVENT_MIN_FRAMES)
+        self.gap = gap or config.EVENT_GAP
+        self.max_duration = (
+            config.EVENT_MAX_DURATION if max_duration is None else max_duration
+        )
+        self.flush_interval = flush_interval or config.EVENT_FLUSH_INTERVAL
+        self.buffer_max = max(1, buffer_max or config.EVENT_BUFFER_MAX)
+        # (カメラID, 人物名) -> 継続中の滞在
+        self._open: dict[tuple[str, str], _Sighting] = {}
+        # 確定済みで未書き込みのイベント
+        self._buffer: deque[dict] = deque()
+        # 書き込み中のイベント (検索結果に含めるため)
+        self._inflight: list[dict] = []
+        self._started = False
+        # 統計
+        self.recorded = 0
+        self.discarded = 0
+        self.flushed = 0
+        self.dropped = 0
+
+    # --- Public API ---
+    def start(self) -> None:
+        if self._started:
+            return
+        self._started = True
+        self._sio.start_background_task(self._flush_loop)
+        # 終了時に継続中の滞在と未書き込みのイベントを書き込む
+        atexit.register(self.close)
+        EVENTS.add_callback(self._counts)
+        QUEUE_DEPTH.add_callback(lambda: [(("events",), len(self._buffer))])
+        logger.info(
+            f"認識イベントの記録を開始しました (保存先: {self._store.path}, "
+            f"書き込み間隔 {self.flush_interval} 秒)"
+        )
+
+    def observe(self, camera_id: str, faces: list[dict], timestamp: float) -> None:
+        """1フレーム分の認識結果 (timestampはフレームの受信時刻) を滞在に反映する"""
+        for person in {face["id"] for face in faces}:
+            if person == "Unknown":
+                continue
+            key = (camera_id, person)
+            sighting = self._open.get(key)
+            if sighting is not None and timestamp - sighting.last_seen > self.gap:
+                self._close(key)
+                sighting = None
+            if sighting is None:
+                self._open[key] = _Sighting(person, camera_id, timestamp)
+                continue
+            if timestamp < sighting.last_seen:
+                continue  # 追い越された古いフレーム
+            sighting.last_seen = timestamp
+            sighting.frames += 1
+            if (
+                self.max_duration > 0
+                and sighting.last_seen - sighting.started_at >= self.max_duration
+            ):
+                self._close(key)
+
+    def recent(
+        self,
+        camera: str | None = None,
+        person: str | None = None,
+        since: float | None = None,
+        until: float | None = None,
+        limit: int = 100,
+    ) -> list[dict]:
+        """
+        条件に合うイベントを終了時刻の新しい順に返す。
+        書き込み済みのイベントに、未書き込みのイベントと継続中の滞在 (open=True) を加える。
+        """
+        stored = tpool.execute(self._store.query, camera, person, since, until, limit)
+        pending = [
+            {**event, "open": False} for event in (*self._inflight, *self._buffer)
+        ] + [
+            {**sighting.to_event(), "open": True}
+            for sighting in self._open.values()
+            if sighting.frames >= self.min_frames
+        ]
+        pending_ids = {event["event_id"] for event in pending}
+        events = [
+            event
+            for event in pending
+            if (camera is None or event["camera"] == camera)
+            and (person is None or event["person"] == person)
+            and (since is None or event["ended_at"] >= since)
+            and (until is None or event["started_at"] <= until)
+        ] + [
+            {**event, "open": False}
+            for event in stored
+            if event["event_id"] not in pending_ids
+        ]
+        events.sort(key=lambda event: event["ended_at"], reverse=True)
+        return events[:limit]
+
+    def close(self) -> None:
+        """継続中の滞在をすべて確定し、未書き込みのイベントを同期的に書き込む (終了時用)"""
+        for key in list(self._open):
+            self._close(key)
+        batch = [*self._inflight, *self._buffer]
+        if not batch:
+            return
+        try:
+            self._store.append(batch)
+            self.flushed += len(self._buffer)
+            self._buffer.clear()
+            logger.info(f"終了時に認識イベント {len(batch)} 件を書き込みました。")
+        except Exception as e:
+            logger.error(f"終了時の認識イベントの書き込みに失敗しました: {e}")
+
+    # --- Internal API ---
+    def _close(self, key: tuple[str, str]) -> None:
+        sighting = self._open.pop(key)
+        if sighting.frames < self.min_frames:
+            self.discarded += 1
+            return
+        self._buffer.append(sighting.to_event(uuid.uuid4().hex))
+        self.recorded += 1
+        self._trim()
+
+    def _trim(self) -> None:
+        overflow = len(self._buffer) - self.buffer_max
+        if overflow <= 0:
+            return
+        for _ in range(overflow):
+            self._buffer.popleft()
+        self.dropped += overflow
+        logger.warning(
+            f"認識イベントのバッファが上限 ({self.buffer_max} 件) を超えたため、"
+            f"古いイベント {overflow} 件を破棄しました。"
+        )
+
+    def _expire(self, now: float) -> None:
+        """EVENT_GAP 秒以上認識されていない滞在を確定する"""
+        expired = [
+            key
+            for key, sighting in self._open.items()
+            if now - sighting.last_seen > self.gap
+        ]
+        for key in expired:
+            self._close(key)
+
+    def _flush_loop(self) -> None:
+        while True:
+            self._sio.sleep(self.flush_interval)
+            self._expire(time.time())
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self._buffer:
+            return
+        batch, self._inflight = list(self._buffer), list(self._buffer)
+        self._buffer.clear()
+        try:
+            tpool.execute(self._store.append, batch)
+        except Exception as e:
+            # 次回まとめて再試行する (event_idが一意なので、書き込まれていても重複しない)
+            logger.error(f"認識イベント {len(batch)} 件の書き込みに失敗しました: {e}")
+            self._buffer.extendleft(reversed(batch))
+            self._trim()
+        else:
+            self.flushed += len(batch)
+            logger.debug(f"認識イベント {len(batch)} 件を書き込みました。")
+        finally:
+            self._inflight = []
+
+    def _counts(self):
+        yield ("recorded",), self.recorded
+        yield ("discarded",), self.discarded
+        yield ("flushed",), self.flushed
+        yield ("dropped",), self.dropped
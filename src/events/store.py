@@ -0,0 +1,115 @@
+# src/events/store.py
+
+from __future__ import annotations
+
+import logging
+import sqlite3
+from pathlib import Path
+
+from eventlet import patcher
+
+# 書き込みと検索はtpoolのOSスレッドから行われるため、モンキーパッチされていないロックを使う
+_threading = patcher.original("threading")
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    event_id TEXT NOT NULL UNIQUE,
+    person TEXT NOT NULL,
+    camera TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    ended_at REAL NOT NULL,
+    frames INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_ended_at ON events (ended_at);
+CREATE INDEX IF NOT EXISTS events_person ON events (person, ended_at);
+"""
+
+_COLUMNS = ("event_id", "person", "camera", "started_at", "ended_at", "frames")
+
+
+class EventStore:
+    """
+    認識イベントの追記専用のSQLiteストア (WALモード)。
+
+    - イベントはまとめて1トランザクションで追記し、更新・削除はしない
+    - WALモードかつ synchronous=FULL なので、コミット済みのバッチはプロセスや
+      OSがクラッシュしても失われず、書き込み中に中断してもDBは壊れない
+    - event_id が一意なので、書き込み結果が不明なバッチを再送しても重複しない
+    - 検索はWALにより書き込みと並行して行える
+    すべてのメソッドはブロッキングするため、tpoolのスレッドから呼び出すこと。
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = _threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+
+    # --- Public API ---
+    def append(self, events: list[dict]) -> int:
+        """イベントを1トランザクションで追記し、新たに書き込んだ件数を返す"""
+        if not events:
+            return 0
+        rows = [tuple(event[column] for column in _COLUMNS) for event in events]
+        with self._lock:
+            conn = self._connect()
+            before = conn.total_changes
+            with conn:
+                conn.executemany(
+                    f"INSERT OR IGNORE INTO events ({', '.join(_COLUMNS)}) "
+                    f"VALUES ({', '.join('?' * len(_COLUMNS))})",
+                    rows,
+                )
+            return conn.total_changes - before
+
+    def query(
+        self,
+        camera: str | None = None,
+        person: str | None = None,
+        since: float | None = None,
+        until: float | None = None,
+        limit: int = 100,
+    ) -> list[dict]:
+        """
+        条件に合うイベントを終了時刻の新しい順に返す。
+        since/until は期間が重なるイベント (ended_at >= since, started_at <= until) を選ぶ。
+        """
+        clauses, params = [], []
+        for clause, value in (
+            ("camera = ?", camera),
+            ("person = ?", person),
+            ("ended_at >= ?", since),
+            ("started_at <= ?", until),
+        ):
+            if value is not None:
+                clauses.append(clause)
+                params.append(value)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            cursor = self._connect().execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM events {where} "
+                f"ORDER BY ended_at DESC LIMIT ?",
+                (*params, limit),
+            )
+            return [dict(zip(_COLUMNS, row)) for row in cursor]
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    # --- Internal API ---
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # 複数のワーカープロセスが同じファイルに書き込む場合はロックの解放を待つ
+            conn = sqlite3.connect(self.path, timeout=30.0, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=FULL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+            logger.info(f"イベントストアを開きました: {self.path}")
+        return self._conn
@@ -0,0 +1,264 @@
+# src/metrics.py
+
+from __future__ import annotations
+
+import logging
+import time
+from bisect import bisect_left
+from collections.abc import Callable, Iterable
+from contextlib import contextmanager
+
+from eventlet import patcher
+
+# 計測はtpoolのOSスレッドからも行われるため、モンキーパッチされていないロックを使う
+# (保持するのはカウンタの更新の間だけなので、グリーンスレッドを止める時間は無視できる)
+_threading = patcher.original("threading")
+
+logger = logging.getLogger(__name__)
+
+# レイテンシ用のヒストグラムの既定のバケット（秒）
+LATENCY_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+LabelValues = tuple[str, ...]
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = _threading.Lock()
+        REGISTRY.register(self)
+
+    def header(self) -> list[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+
+    def render(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """単調増加するカウンタ"""
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[LabelValues, float] = {}
+
+    def inc(self, *labelvalues: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(v)}"
+            for labels, v in values
+        ]
+
+
+class Histogram(_Metric):
+    """累積バケットのヒストグラム (observe() は二分探索と加算だけで済む)"""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # ラベル値 -> [バケットごとの件数..., +Infの件数, 合計値]
+        self._values: dict[LabelValues, list] = {}
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(labelvalues)
+            if counts is None:
+                counts = self._values[labelvalues] = [0] * (len(self.buckets) + 1) + [
+                    0.0
+                ]
+            counts[index] += 1
+            counts[-1] += value
+
+    def totals(self) -> dict[LabelValues, tuple[int, float]]:
+        """ラベル値ごとの (件数, 合計値) を返す"""
+        with self._lock:
+            return {
+                labels: (sum(counts[:-1]), counts[-1])
+                for labels, counts in self._values.items()
+            }
+
+    @contextmanager
+    def time(self, *labelvalues: str):
+        """with文のブロックの所要時間（秒）を記録する"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labelvalues)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = [(labels, list(counts)) for labels, counts in self._values.items()]
+        lines = []
+        for labels, counts in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts[:-1]):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} "
+                    f"{cumulative}"
+                )
+            suffix = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{suffix} {_format_value(counts[-1])}")
+            lines.append(f"{self.name}_count{suffix} {cumulative}")
+        return lines
+
+
+class CallbackMetric(_Metric):
+    """
+    取得時にコールバックで値を読み出すメトリクス。
+    既存の統計カウンタやキューの長さを、ホットパスに手を加えずに公開するのに使う。
+    callback は (ラベル値のタプル, 値) を返すイテラブルを返す。
+    """
+
+    def __init__(
+        self,
+        name,
+        documentation,
+        labelnames=(),
+        kind: str = "gauge",
+        callback: Callable[[], Iterable[tuple[LabelValues, float]]] | None = None,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.kind = kind
+        self._callbacks: list[Callable] = [callback] if callback else []
+
+    def add_callback(
+        self, callback: Callable[[], Iterable[tuple[LabelValues, float]]]
+    ) -> None:
+        self._callbacks.append(callback)
+
+    def render(self) -> list[str]:
+        lines = []
+        for callback in self._callbacks:
+            try:
+                for labels, value in callback():
+                    lines.append(
+                        f"{self.name}{_format_labels(self.labelnames, labels)} "
+                        f"{_format_value(value)}"
+                    )
+            except Exception as e:
+                logger.warning(f"メトリクス {self.name} の取得に失敗しました: {e}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+
+    def register(self, metric: _Metric) -> None:
+        self._metrics.append(metric)
+
+    def render(self) -> str:
+        """Prometheusのテキスト形式 (0.0.4) で全メトリクスを出力する"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.header())
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# --- 顔認識パイプラインのメトリクス ---
+STAGE_SECONDS = Histogram(
+    "face_auth_stage_seconds",
+    "Latency of each pipeline stage in seconds.",
+    ["stage"],
+)
+END_TO_END_SECONDS = Histogram(
+    "face_auth_capture_to_emit_seconds",
+    "Latency from frame capture to faces_update emit in seconds.",
+    ["camera"],
+)
+FACES_PER_FRAME = Histogram(
+    "face_auth_faces_per_frame",
+    "Number of faces reported per processed frame.",
+    buckets=(0, 1, 2, 3, 4, 6, 8, 12, 16, 32),
+)
+FRAMES = CallbackMetric(
+    "face_auth_frames_total",
+    "Frames per camera by outcome (captured, processed, dropped, static, skipped, overrun).",
+    ["camera", "outcome"],
+    kind="counter",
+)
+FRAME_QUEUE = CallbackMetric(
+    "face_auth_frame_queue_total",
+    "Frames handled by each camera's recognition queue by policy and outcome "
+    "(enqueued, dropped, skipped, expired).",
+    ["camera", "policy", "outcome"],
+    kind="counter",
+)
+EVENTS = CallbackMetric(
+    "face_auth_events_total",
+    "Recognition events by outcome (recorded, discarded, flushed, dropped).",
+    ["outcome"],
+    kind="counter",
+)
+QUEUE_DEPTH = CallbackMetric(
+    "face_auth_queue_depth",
+    "Current depth of internal work queues.",
+    ["queue"],
+)
+
+
+def _tpool_queue_depth():
+    # eventletの内部キュー (tpoolの初回使用時に作られる) の長さ
+    from eventlet import tpool
+
+    queue = getattr(tpool, "_reqq", None)
+    if queue is not None:
+        yield ("tpool",), queue.qsize()
+
+
+QUEUE_DEPTH.add_callback(_tpool_queue_depth)
@@ -0,0 +1,217 @@
+# src/recognition/batcher.py
+
+from __future__ import annotations
+
+import logging
+import time
+
+import dlib
+import face_recognition
+import numpy as np
+from eventlet import patcher
+from face_recognition import api as face_api
+
+from src.config import config
+from src.metrics import STAGE_SECONDS
+from src.recognition.detector import detect_faces, encoding_inputs
+from src.recognition.face_db import FaceDB
+
+# tpoolのOSスレッド同士で待ち合わせるため、モンキーパッチされていないthreadingを使う
+_threading = patcher.original("threading")
+
+logger = logging.getLogger(__name__)
+
+
+def encode_faces_batch(
+    images: list[np.ndarray], locations_list: list[list]
+) -> list[list[np.ndarray]]:
+    """
+    複数フレームの顔をまとめてエンコードする。
+    ランドマーク検出は顔ごとに行い、エンコーダ (ResNet) はdlibのバッチAPIで一度に実行する。
+    戻り値はフレームごとのエンコーディングのリスト。
+    """
+    shapes = []
+    for image, locations in zip(images, locations_list):
+        detections = dlib.full_object_detections()
+        for landmarks in face_api._raw_face_landmarks(image, locations, model="small"):
+            detections.append(landmarks)
+        shapes.append(detections)
+
+    descriptors = face_api.face_encoder.compute_face_descriptor(images, shapes, 1)
+    return [[np.array(d) for d in per_image] for per_image in descriptors]
+
+
+class _Request:
+    __slots__ = ("inputs", "locations", "encodings", "names", "error", "done")
+
+    def __init__(self, inputs: list[tuple[np.ndarray, list]], locations: list):
+        # エンコードする (画像, 画像上の顔の位置) の組と、検出画像上の顔の位置
+        self.inputs = inputs
+        self.locations = locations
+        self.encodings: list[np.ndarray] | None = None
+        self.names: list[str | None] | None = None
+        self.error: BaseException | None = None
+        self.done = False
+
+
+class EncodingBatcher:
+    """
+    複数フレーム (複数カメラ) の顔を短い時間窓で集め、まとめてエンコード・照合するクラス。
+
+    - 顔検出は呼び出し元のスレッドでフレームごとに行う
+    - 最初に到着したスレッドがリーダーとなり、顔が RECOGNITION_BATCH_SIZE 個集まるか
+      RECOGNITION_BATCH_MAX_WAIT 秒経つまで待ってから、集まった全フレームの顔を
+      一度にエンコードし、ギャラリーとの照合も1回の identify で行う
+      (トラックごとの多数決は、呼び出し元でこの照合結果を使って行う)
+    - 待っている間に到着したスレッドはフォロワーとして結果を受け取るだけなので、
+      専用のスレッドは不要
+    - 顔検出中の他のスレッドがいなければ待たずにすぐ実行するため、
+      負荷が低いときに遅延が増えることはない
+
+    process_frame_for_faces の recognize として渡し、tpoolのスレッドから呼び出す。
+    """
+
+    def __init__(
+        self,
+        face_db: FaceDB,
+        max_batch: int | None = None,
+        max_wait: float | None = None,
+    ):
+        self._face_db = face_db
+        self.max_batch = max(1, max_batch or config.RECOGNITION_BATCH_SIZE)
+        self.max_wait = (
+            config.RECOGNITION_BATCH_MAX_WAIT if max_wait is None else max_wait
+        )
+        self._cond = _threading.Condition()
+        self._pending: list[_Request] = []
+        self._pending_faces = 0
+        self._collecting = False
+        # 顔検出中 (まだバッチに合流していない) のスレッド数
+        self._detecting = 0
+        # dlibのバッチAPIが使えない環境では、フレームごとのエンコードに切り替える
+        self._batch_api = True
+        # 統計 (1回のエンコードあたりの平均顔数の算出用)
+        self.batches = 0
+        self.faces = 0
+
+    def __call__(
+        self, small_frame_rgb: np.ndarray, frame_bgr: np.ndarray | None = None
+    ):
+        return self.recognize(small_frame_rgb, frame_bgr)
+
+    @property
+    def mean_batch_size(self) -> float:
+        return self.faces / self.batches if self.batches else 0.0
+
+    def recognize(
+        self, small_frame_rgb: np.ndarray, frame_bgr: np.ndarray | None = None
+    ):
+        """
+        フレームから顔を検出し、バッチでエンコード・照合して
+        (顔の位置, エンコーディング, 人物名 (またはNone)) を返す。
+        frame_bgr (縮小前のフレーム) はcascadeの候補の確認と、小さな顔のエンコードに使う。
+        """
+        with self._cond:
+            self._detecting += 1
+        try:
+            with STAGE_SECONDS.time("detect"):
+                face_locations = detect_faces(small_frame_rgb, frame_bgr=frame_bgr)
+        except BaseException:
+            with self._cond:
+                self._detecting -= 1
+                self._cond.notify_all()
+            raise
+        request = _Request(
+            encoding_inputs(
+                np.ascontiguousarray(small_frame_rgb), face_locations, frame_bgr
+            ),
+            face_locations,
+        )
+
+        with self._cond:
+            self._detecting -= 1
+            self._cond.notify_all()
+            if not face_locations:
+                return [], [], []
+            self._pending.append(request)
+            self._pending_faces += len(face_locations)
+            if self._collecting:
+                # リーダーが集めている最中なら、結果が届くまで待つだけ
+                self._cond.notify_all()
+                while not request.done:
+                    self._cond.wait()
+                return self._result(request)
+
+            # リーダーとして、時間窓が閉じるかバッチが埋まるまで待つ
+            # (合流しうるスレッドがいなくなった時点で打ち切る)
+            self._collecting = True
+            started = time.monotonic()
+            deadline = started + self.max_wait
+            while self._pending_faces < self.max_batch and self._detecting > 0:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            STAGE_SECONDS.observe(time.monotonic() - started, "batch_wait")
+            batch, self._pending = self._pending, []
+            self._pending_faces = 0
+            self._collecting = False
+
+        faces = 0
+        try:
+            faces = self._run_batch(batch)
+        except Exception as e:
+            for item in batch:
+                item.error = e
+        with self._cond:
+            self.batches += 1
+            self.faces += faces
+            for item in batch:
+                item.done = True
+            self._cond.notify_all()
+        return self._result(request)
+
+    # --- Internal API ---
+    def _run_batch(self, batch: list[_Request]) -> int:
+        """バッチ内の全フレームの顔をエンコード・照合し、処理した顔の数を返す"""
+        images = [image for item in batch for image, _ in item.inputs]
+        locations_list = [locations for item in batch for _, locations in item.inputs]
+        encodings_list = None
+        encode_started = time.perf_counter()
+        if self._batch_api:
+            try:
+                encodings_list = encode_faces_batch(images, locations_list)
+            except (TypeError, AttributeError) as e:
+                logger.warning(
+                    f"dlibのバッチエンコードが使えないため、フレームごとのエンコードに切り替えます: {e}"
+                )
+                self._batch_api = False
+        if encodings_list is None:
+            encodings_list = [
+                face_recognition.face_encodings(image, locations)
+                for image, locations in zip(images, locations_list)
+            ]
+        STAGE_SECONDS.observe(time.perf_counter() - encode_started, "encode")
+
+        offset = 0
+        for item in batch:
+            per_input = encodings_list[offset : offset + len(item.inputs)]
+            item.encodings = [
+                encoding for encodings in per_input for encoding in encodings
+            ]
+            offset += len(item.inputs)
+
+        # バッチ内の全ての顔をギャラリーと一度に照合する
+        flat = [encoding for item in batch for encoding in item.encodings]
+        with STAGE_SECONDS.time("match"):
+            names = self._face_db.identify(flat)
+        offset = 0
+        for item in batch:
+            item.names = names[offset : offset + len(item.encodings)]
+            offset += len(item.encodings)
+        return len(flat)
+
+    def _result(self, request: _Request):
+        if request.error is not None:
+            raise request.error
+        return request.locations, request.encodings, request.names
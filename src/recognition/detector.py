@@ -0,0 +1,330 @@
+# src/recognition/detector.py
+
+from __future__ import annotations
+
+import logging
+from pathlib import Path
+
+import cv2
+import face_recognition
+import numpy as np
+from eventlet import patcher
+
+from src.config import config
+from src.metrics import STAGE_SECONDS
+from src.recognition.tracker import Box, box_iou
+
+# 検出はtpoolのOSスレッドから呼ばれるため、モンキーパッチされていないthreadingを使う
+_threading = patcher.original("threading")
+
+logger = logging.getLogger(__name__)
+
+# 候補検出 (Haar/LBPカスケード) のパラメータ
+# 誤検出は2段目で除かれるため、見逃しを減らすよう近傍数は小さめにする
+HAAR_SCALE_FACTOR = 1.2
+HAAR_MIN_NEIGHBORS = 3
+# 候補検出 (YuNet) のスコアの下限
+YUNET_SCORE_THRESHOLD = 0.5
+# dlibのHOG検出器が検出できる顔の大きさ (検出窓のサイズ)。2段目では、候補の顔が
+# この大きさになる解像度で縮小前のフレームから切り出し、足りない分だけ拡大する
+# (上限は CASCADE_UPSAMPLE 回)
+REFINE_FACE_SIZE = 80
+# dlibの顔エンコーダが顔を正規化する大きさ (face chipの一辺)。検出画像でこれより小さい顔は、
+# 縮小前のフレームから切り出してエンコードする
+ENCODE_FACE_SIZE = 150
+# エンコード用に切り出す顔の周囲の余白 (顔の大きさに対する割合。ランドマーク検出に使う)
+ENCODE_PADDING = 0.5
+# 2段目の結果同士がこのIoU以上重なる場合は同じ顔とみなす
+DUPLICATE_IOU = 0.5
+# CASCADE_PROPOSAL_MODEL が未設定の場合に使う、OpenCV同梱のHaarカスケード
+DEFAULT_HAAR_CASCADE = "haarcascade_frontalface_default.xml"
+
+# プロセス内で共有するカスケード検出器 (cascade_detector() の初回呼び出しで作成する)
+_detector: CascadeDetector | None = None
+_detector_lock = _threading.Lock()
+
+
+def detect_faces(
+    image_rgb: np.ndarray,
+    model: str | None = None,
+    frame_bgr: np.ndarray | None = None,
+) -> list[Box]:
+    """
+    RECOGNITION_MODEL (hog, cnn, cascade) に従って顔を検出し、
+    検出画像上の (top, right, bottom, left) のリストを返す。
+    frame_bgrに縮小前のフレームを渡すと、cascadeの2段目は候補の領域をその解像度で確認する。
+    """
+    model = model or config.RECOGNITION_MODEL
+    if model == "cascade":
+        return cascade_detector().detect(image_rgb, frame_bgr)
+    return face_recognition.face_locations(image_rgb, model=model)
+
+
+def encoding_inputs(
+    image_rgb: np.ndarray,
+    locations: list[Box],
+    frame_bgr: np.ndarray | None = None,
+) -> list[tuple[np.ndarray, list[Box]]]:
+    """
+    顔をエンコードする (画像, 画像上の顔の位置のリスト) の組を、locations と同じ顔の順で返す。
+    frame_bgr (縮小前のフレーム) がある場合、検出画像で ENCODE_FACE_SIZE に満たない
+    (遠くの) 顔は、縮小前のフレームから元の画素で切り出してエンコードする。
+    """
+    if frame_bgr is None or frame_bgr.shape[1] <= image_rgb.shape[1]:
+        return [(image_rgb, list(locations))]
+
+    height, width = image_rgb.shape[:2]
+    inputs = []
+    for box in locations:
+        top, right, bottom, left = box
+        face_size = min(bottom - top, right - left)
+        if face_size >= ENCODE_FACE_SIZE:
+            inputs.append((image_rgb, [box]))
+            continue
+        pad = int(face_size * ENCODE_PADDING)
+        region = (
+            max(0, top - pad),
+            min(width, right + pad),
+            min(height, bottom + pad),
+            max(0, left - pad),
+        )
+        crop = crop_region(image_rgb, frame_bgr, region, face_size, ENCODE_FACE_SIZE)
+        inputs.append((crop, [_to_crop(box, region, crop.shape)]))
+    return inputs
+
+
+def crop_region(
+    image_rgb: np.ndarray,
+    frame_bgr: np.ndarray | None,
+    region: Box,
+    face_size: int,
+    target_size: int,
+) -> np.ndarray:
+    """
+    検出画像上の領域をRGBで切り出す。検出画像で顔が target_size に満たない場合は、
+    縮小前のフレームから顔が target_size になる解像度 (元の解像度が上限) で切り出す。
+    """
+    top, right, bottom, left = region
+    ratio = 1.0 if frame_bgr is None else frame_bgr.shape[1] / image_rgb.shape[1]
+    if ratio <= 1.0 or face_size >= target_size:
+        return np.ascontiguousarray(image_rgb[top:bottom, left:right])
+
+    height, width = frame_bgr.shape[:2]
+    y0, y1 = max(0, int(top * ratio)), min(height, int(round(bottom * ratio)))
+    x0, x1 = max(0, int(left * ratio)), min(width, int(round(right * ratio)))
+    crop = frame_bgr[y0:y1, x0:x1]
+    scale = min(ratio, target_size / face_size)
+    if scale < ratio:
+        size = (
+            max(1, round((right - left) * scale)),
+            max(1, round((bottom - top) * scale)),
+        )
+        crop = cv2.resize(crop, size, interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(crop, cv2.COLOR_BGR2RGB)
+
+
+def cascade_detector() -> CascadeDetector:
+    """プロセス内で共有するカスケード検出器を返す (初回呼び出し時に作成する)"""
+    global _detector
+    if _detector is None:
+        with _detector_lock:
+            if _detector is None:
+                _detector = CascadeDetector()
+    return _detector
+
+
+class CascadeDetector:
+    """
+    2段階の顔検出器 (RECOGNITION_MODEL=cascade)。
+
+    1. 軽量な検出器 (OpenCVのHaar/LBPカスケード、またはDNNのYuNet) で、
+       検出画像全体から顔の候補を探す
+    2. 候補の周囲 (CASCADE_PADDING) だけを縮小前のフレームから切り出し、候補の顔が
+       HOGの検出窓の大きさになる解像度で face_recognition.face_locations
+       (CASCADE_REFINE_MODEL) で確認し、位置を補正する。縮小前のフレームでも顔が
+       小さすぎる場合は、足りない分だけ (最大 CASCADE_UPSAMPLE 回) 拡大する
+
+    高解像度で調べるのは候補の領域だけなので、画像全体をhogで調べるのに近いコストで、
+    検出画像では小さすぎて見つからない (遠い) 顔も、元の画素を使って検出できる。
+    候補がないフレームでは2段目を実行しない。
+    OpenCVの検出器はスレッドセーフではないため、スレッドごとに1つずつ作る。
+    """
+
+    def __init__(
+        self,
+        proposal_model: str | None = None,
+        refine_model: str | None = None,
+        upsample: int | None = None,
+        padding: float | None = None,
+        min_size: int | None = None,
+    ):
+        self.proposal_model = str(
+            proposal_model
+            or config.CASCADE_PROPOSAL_MODEL
+            or Path(cv2.data.haarcascades) / DEFAULT_HAAR_CASCADE
+        )
+        self.kind = "yunet" if self.proposal_model.endswith(".onnx") else "haar"
+        self.refine_model = refine_model or config.CASCADE_REFINE_MODEL
+        self.upsample = config.CASCADE_UPSAMPLE if upsample is None else upsample
+        self.padding = config.CASCADE_PADDING if padding is None else padding
+        self.min_size = max(1, min_size or config.CASCADE_MIN_SIZE)
+        self._local = _threading.local()
+        # モデルファイルの問題は、最初のフレームではなく起動時に検出する
+        self._proposer()
+        logger.info(
+            f"カスケード検出器を初期化しました (候補: {self.kind} {self.proposal_model}, "
+            f"確認: {self.refine_model} ×{2 ** self.upsample})"
+        )
+
+    # --- Public API ---
+    def detect(
+        self, image_rgb: np.ndarray, frame_bgr: np.ndarray | None = None
+    ) -> list[Box]:
+        with STAGE_SECONDS.time("propose"):
+            candidates = self.propose(image_rgb)
+        if not candidates:
+            return []
+        with STAGE_SECONDS.time("refine"):
+            return self.refine(image_rgb, candidates, frame_bgr)
+
+    def propose(self, image_rgb: np.ndarray) -> list[Box]:
+        """1段目: 軽量な検出器で顔の候補を (top, right, bottom, left) で返す"""
+        proposer = self._proposer()
+        if self.kind == "yunet":
+            height, width = image_rgb.shape[:2]
+            proposer.setInputSize((width, height))
+            _, faces = proposer.detect(cv2.cvtColor(image_rgb, cv2.COLOR_RGB2BGR))
+            rects = [] if faces is None else faces[:, :4].astype(int)
+        else:
+            gray = cv2.cvtColor(image_rgb, cv2.COLOR_RGB2GRAY)
+            rects = proposer.detectMultiScale(
+                gray,
+                scaleFactor=HAAR_SCALE_FACTOR,
+                minNeighbors=HAAR_MIN_NEIGHBORS,
+                minSize=(self.min_size, self.min_size),
+            )
+        return [
+            (int(y), int(x + w), int(y + h), int(x))
+            for x, y, w, h in rects
+            if min(w, h) >= self.min_size
+        ]
+
+    def refine(
+        self,
+        image_rgb: np.ndarray,
+        candidates: list[Box],
+        frame_bgr: np.ndarray | None = None,
+    ) -> list[Box]:
+        """
+        2段目: 余白を付けた候補の領域だけを調べ、確認できた顔を検出画像の座標で返す。
+        frame_bgr (縮小前のフレーム) があれば、小さな候補はそこから切り出して調べる。
+        """
+        found: list[Box] = []
+        for region, face_size in self._regions(image_rgb.shape, candidates):
+            crop = crop_region(
+                image_rgb, frame_bgr, region, face_size, REFINE_FACE_SIZE
+            )
+            scale_x = crop.shape[1] / (region[1] - region[3])
+            # 切り出した解像度でも顔が小さい場合は、足りない分だけ拡大する
+            upsample = 0
+            while (
+                upsample < self.upsample
+                and face_size * scale_x * 2**upsample < REFINE_FACE_SIZE
+            ):
+                upsample += 1
+            for crop_box in face_recognition.face_locations(
+                crop,
+                number_of_times_to_upsample=upsample,
+                model=self.refine_model,
+            ):
+                box = _from_crop(crop_box, region, crop.shape)
+                if all(box_iou(box, other) < DUPLICATE_IOU for other in found):
+                    found.append(box)
+        return found
+
+    # --- Internal API ---
+    def _proposer(self):
+        proposer = getattr(self._local, "proposer", None)
+        if proposer is not None:
+            return proposer
+        if self.kind == "yunet":
+            proposer = cv2.FaceDetectorYN.create(
+                self.proposal_model, "", (320, 320), YUNET_SCORE_THRESHOLD
+            )
+        else:
+            if not hasattr(cv2, "CascadeClassifier"):
+                raise RuntimeError(
+                    "このOpenCVにはCascadeClassifierがありません。"
+                    "CASCADE_PROPOSAL_MODEL にYuNetのONNXモデルを指定してください。"
+                )
+            proposer = cv2.CascadeClassifier(self.proposal_model)
+            if proposer.empty():
+                raise RuntimeError(f"カスケードを読み込めません: {self.proposal_model}")
+        self._local.proposer = proposer
+        return proposer
+
+    def _regions(self, shape: tuple, candidates: list[Box]) -> list[tuple[Box, int]]:
+        """
+        候補に余白を付けて画像内に収め、重なる領域は1つにまとめる。
+        (領域, 領域内の最も小さな候補の大きさ) のリストを返す。
+        """
+        height, width = shape[:2]
+        regions = []
+        for top, right, bottom, left in candidates:
+            pad_y = int((bottom - top) * self.padding)
+            pad_x = int((right - left) * self.padding)
+            regions.append(
+                [
+                    max(0, top - pad_y),
+                    min(width, right + pad_x),
+                    min(height, bottom + pad_y),
+                    max(0, left - pad_x),
+                    min(bottom - top, right - left),
+                ]
+            )
+        merged = True
+        while merged:
+            merged = False
+            for i in range(len(regions)):
+                for j in range(i + 1, len(regions)):
+                    a, b = regions[i], regions[j]
+                    if a[0] < b[2] and b[0] < a[2] and a[3] < b[1] and b[3] < a[1]:
+                        regions[i] = [
+                            min(a[0], b[0]),
+                            max(a[1], b[1]),
+                            max(a[2], b[2]),
+                            min(a[3], b[3]),
+                            min(a[4], b[4]),
+                        ]
+                        del regions[j]
+                        merged = True
+                        break
+                if merged:
+                    break
+        return [(tuple(region[:4]), region[4]) for region in regions]
+
+
+def _to_crop(box: Box, region: Box, crop_shape: tuple) -> Box:
+    """検出画像上のボックスを、region を切り出した画像 (大きさ crop_shape) 上の座標に変換する"""
+    top, right, bottom, left = region
+    scale_y = crop_shape[0] / (bottom - top)
+    scale_x = crop_shape[1] / (right - left)
+    return (
+        int(round((box[0] - top) * scale_y)),
+        int(round((box[1] - left) * scale_x)),
+        int(round((box[2] - top) * scale_y)),
+        int(round((box[3] - left) * scale_x)),
+    )
+
+
+def _from_crop(box: Box, region: Box, crop_shape: tuple) -> Box:
+    """region を切り出した画像 (大きさ crop_shape) 上のボックスを、検出画像上の座標に戻す"""
+    top, right, bottom, left = region
+    scale_y = crop_shape[0] / (bottom - top)
+    scale_x = crop_shape[1] / (right - left)
+    return (
+        int(round(box[0] / scale_y)) + top,
+        int(round(box[1] / scale_x)) + left,
+        int(round(box[2] / scale_y)) + top,
+        int(round(box[3] / scale_x)) + left,
+    )
@@ -0,0 +1,306 @@
+# src/recognition/dispatcher.py
+
+from __future__ import annotations
+
+import logging
+import os
+import time
+from collections.abc import Callable
+
+from eventlet import tpool
+from eventlet.queue import LightQueue
+from flask_socketio import SocketIO
+
+from src.config import config
+from src.events.log import EventLog
+from src.metrics import (
+    FACES_PER_FRAME,
+    FRAME_QUEUE,
+    FRAMES,
+    QUEUE_DEPTH,
+    STAGE_SECONDS,
+)
+from src.recognition.face_db import FaceDB
+from src.recognition.frame_queue import FrameQueue
+from src.recognition.preprocess import Preprocessor
+from src.recognition.scheduler import AdaptiveRateController, MotionGate
+from src.recognition.tracker import FaceTracker
+from src.streaming.broadcaster import FacesBroadcaster
+from src.streaming.receiver import Frame, StreamReceiver
+
+logger = logging.getLogger(__name__)
+
+# 統計情報をログに出力する間隔（秒）
+STATS_REPORT_INTERVAL = 60.0
+
+# 実行待ちの間に処理期限を過ぎたため、認識しなかったことを表す値
+EXPIRED = object()
+
+
+class CameraContext:
+    """1台のカメラの受信・追跡状態と、認識待ちのフレームのキュー"""
+
+    def __init__(self, camera_id: str, receiver: StreamReceiver):
+        self.camera_id = camera_id
+        self.receiver = receiver
+        self.tracker = FaceTracker()
+        self.motion_gate = MotionGate()
+        self.preprocessor = Preprocessor()
+        # 認識待ちのフレームは受信側から借りたまま、FRAME_QUEUE_POLICY に従って保持する
+        self.queue = FrameQueue()
+        # 取得済みの最新シーケンス番号 (これ以下のフレームは取得しない)
+        self.last_seq = -1
+        # 送信済みの最新シーケンス番号 (これより古い結果は送信しない)
+        self.emitted_seq = -1
+        # 認識実行中か、実行待ちキューに入っているか
+        self.scheduled = False
+        # 次のフレームを認識に回してよい時刻 (time.monotonic基準)
+        self.next_due = 0.0
+        # 直近のフレームに動きがあったか (CPU予算の配分対象になるか)
+        self.active = True
+        self.static = 0
+        self.processed = 0
+
+
+class RecognitionDispatcher:
+    """
+    複数カメラのフレームを、共有された有限個の認識実行枠に公平に割り当てるクラス。
+
+    - カメラごとの認識待ちのフレームは有限長のキュー (FrameQueue) に保持し、
+      溢れた分は方針 (FRAME_QUEUE_POLICY) に従って捨て、処理期限を過ぎたフレームは認識しない
+    - 実行待ちキューにはカメラごとに高々1つのエントリしか入らず、
+      処理が終わったカメラは列の末尾に戻るため、ラウンドロビンで処理される
+    - 1台のカメラが同時に使う実行枠は1つまでなので、遅いストリームが他を飢餓させない
+    - 同時実行数はカメラ台数ではなく RECOGNITION_CONCURRENCY (既定: CPUコア数) で決まる
+    - 動きのない場面のフレームは認識に回さず、認識の頻度は計測した処理時間と遅延から
+      AdaptiveRateController が決める (遅延目標とCPU予算は設定で指定する)
+    """
+
+    def __init__(
+        self,
+        sio: SocketIO,
+        face_db: FaceDB,
+        process: Callable,
+        concurrency: int | None = None,
+        recognize: Callable | None = None,
+        broadcaster: FacesBroadcaster | None = None,
+        events: EventLog | None = None,
+    ):
+        self._sio = sio
+        self._face_db = face_db
+        self._process = process
+        # 検出・照合の委譲先 (プロセスプールなど)。Noneの場合はtpoolのスレッド内で実行する
+        self._recognize = recognize
+        self._concurrency = max(
+            1, concurrency or config.RECOGNITION_CONCURRENCY or os.cpu_count() or 1
+        )
+        self._cameras: dict[str, CameraContext] = {}
+        self._ready: LightQueue = LightQueue()
+        self._rate = AdaptiveRateController()
+        self._broadcaster = broadcaster or FacesBroadcaster(sio)
+        # 認識イベントの記録先 (Noneの場合は記録しない)
+        self._events = events
+
+    # --- Public API ---
+    def add_camera(self, camera_id: str, receiver: StreamReceiver) -> None:
+        self._cameras[camera_id] = CameraContext(camera_id, receiver)
+
+    def start(self) -> None:
+        """カメラごとのフレーム取得ループと、共有の認識ループを起動する"""
+        for camera in self._cameras.values():
+            self._sio.start_background_task(self._poll_camera, camera)
+        self._check_ring_size()
+        for _ in range(self._concurrency):
+            self._sio.start_background_task(self._recognize_loop)
+        self._sio.start_background_task(self._report_loop)
+        self._broadcaster.start()
+        if self._events is not None:
+            self._events.start()
+        # 既存の統計カウンタは /metrics の取得時に読み出す (認識処理には手を加えない)
+        FRAMES.add_callback(self._frame_counts)
+        FRAME_QUEUE.add_callback(self._queue_counts)
+        QUEUE_DEPTH.add_callback(self._queue_depths)
+        logger.info(
+            f"顔認識ディスパッチャを起動しました "
+            f"(カメラ {len(self._cameras)} 台, 同時実行数 {self._concurrency})"
+        )
+
+    # --- Internal API ---
+    def _poll_camera(self, camera: CameraContext) -> None:
+        """カメラの新しいフレームを待ち、認識待ちとして登録するループ"""
+        while True:
+            # 計測値から決めた間隔が経つまでは、新しいフレームを取りに行かない
+            delay = camera.next_due - time.monotonic()
+            if delay > 0:
+                self._sio.sleep(delay)
+
+            # 新しいフレームが届くまでグリーンレットとして待機する (固定間隔のポーリングはしない)
+            frame = camera.receiver.acquire_frame(
+                after_seq=camera.last_seq, timeout=config.STREAM_FRAME_TIMEOUT
+            )
+            if frame is None:
+                continue
+            camera.last_seq = frame.seq
+
+            # 縮小画像の差分だけを見る軽い判定なので、グリーンスレッド上で直接行う
+            camera.active = camera.motion_gate.check(frame.image)
+            if not camera.active:
+                camera.static += 1
+                frame.release()
+                continue
+
+            if camera.queue.put(frame) and not camera.scheduled:
+                camera.scheduled = True
+                self._ready.put(camera)
+            camera.next_due = time.monotonic() + self._rate.interval(
+                sum(1 for c in self._cameras.values() if c.active)
+            )
+
+    def _recognize_loop(self) -> None:
+        """実行待ちのカメラを順に取り出し、CPU負荷の高い処理をtpoolにオフロードする"""
+        while True:
+            camera = self._ready.get()
+            frame = camera.queue.get()
+            try:
+                if frame is None:
+                    continue  # キュー内のフレームがすべて期限切れだった
+                # リングバッファ上のフレームをコピーせずに渡し、処理後にスロットを返却する
+                started = time.monotonic()
+                with frame:
+                    faces_data = tpool.execute(
+                        self._run_process,
+                        time.perf_counter(),
+                        frame.deadline,
+                        frame.image,
+                        self._face_db,
+                        camera.tracker,
+                        self._recognize,
+                        preprocessor=camera.preprocessor,
+                        frame_scale=frame.scale,
+                    )
+                if faces_data is EXPIRED:
+                    camera.queue.counts["expired"] += 1
+                    continue
+                service = time.monotonic() - started
+                STAGE_SECONDS.observe(service, "process")
+                camera.processed += 1
+                self._emit(camera, frame, faces_data)
+                self._rate.observe(
+                    service,
+                    time.time() - frame.timestamp,
+                    self._ready.qsize() // self._concurrency,
+                )
+            except Exception as e:
+                logger.error(
+                    f"[{camera.camera_id}] 顔認識処理で予期せぬエラー: {e}",
+                    exc_info=True,
+                )
+            finally:
+                # 処理中に新しいフレームが届いていれば、列の末尾に並び直す
+                if len(camera.queue):
+                    self._ready.put(camera)
+                else:
+                    camera.scheduled = False
+
+    def _run_process(self, submitted: float, deadline: float | None, *args, **kwargs):
+        """
+        tpoolのスレッド上で実行され、実行待ちの時間を記録してから処理を呼び出す。
+        tpoolの実行待ちの間に処理期限を過ぎた場合は、認識せずに EXPIRED を返す。
+        """
+        STAGE_SECONDS.observe(time.perf_counter() - submitted, "tpool_wait")
+        if deadline is not None and time.time() > deadline:
+            return EXPIRED
+        return self._process(*args, **kwargs)
+
+    def _emit(self, camera: CameraContext, frame: Frame, faces_data) -> None:
+        # faces_dataが空リストの場合、フロント側で枠がクリアされる
+        if faces_data is None:
+            return
+        FACES_PER_FRAME.observe(len(faces_data))
+        # 結果はフレームのシーケンス順に送信し、追い越された古い結果は捨てる
+        if frame.seq <= camera.emitted_seq:
+            return
+        camera.emitted_seq = frame.seq
+        if faces_data:
+            recognized_names = [
+                face["id"] for face in faces_data if face["id"] != "Unknown"
+            ]
+            logger.info(
+                f"[{camera.camera_id}] 検出された顔数: {len(faces_data)} "
+                f"(認識: {', '.join(recognized_names) or 'なし'})"
+            )
+        else:
+            logger.debug(f"[{camera.camera_id}] 顔は検出されませんでした。")
+
+        # 送信はブロードキャスタがカメラごとのルームに差分でまとめて行う
+        self._broadcaster.publish(
+            camera.camera_id, faces_data, captured_at=frame.timestamp
+        )
+        # イベントはメモリ上で集約するだけで、書き込みは別のグリーンスレッドで行う
+        if self._events is not None:
+            self._events.observe(camera.camera_id, faces_data, frame.timestamp)
+
+    def _frame_counts(self):
+        for camera in self._cameras.values():
+            receiver = camera.receiver
+            counts = {
+                "captured": receiver.frames_captured,
+                "overrun": receiver.frames_overrun,
+                "skipped": getattr(receiver, "frames_skipped", 0),
+                "static": camera.static,
+                "dropped": camera.queue.counts["dropped"],
+                "processed": camera.processed,
+            }
+            for outcome, value in counts.items():
+                yield (camera.camera_id, outcome), value
+
+    def _queue_counts(self):
+        for camera in self._cameras.values():
+            queue = camera.queue
+            for outcome, value in queue.counts.items():
+                yield (camera.camera_id, queue.policy, outcome), value
+
+    def _queue_depths(self):
+        yield ("ready",), self._ready.qsize()
+        yield ("frames",), sum(len(c.queue) for c in self._cameras.values())
+
+    def _check_ring_size(self) -> None:
+        """
+        キューに保持するフレームはリングバッファのスロットを占有するため、
+        受信側が書き込むスロット (最新フレームと書き込み中の分) が残るかを確認する
+        """
+        ring_size = max(3, config.STREAM_RING_SIZE)
+        for camera in self._cameras.values():
+            # キュー内のフレーム + 認識中の1枚 + 最新フレーム + 書き込み中の1枚
+            needed = camera.queue.capacity + 3
+            if needed > ring_size:
+                logger.warning(
+                    f"[{camera.camera_id}] FRAME_QUEUE_SIZE ({camera.queue.capacity}) に対して "
+                    f"STREAM_RING_SIZE ({ring_size}) が小さいため、キューが埋まると受信側で"
+                    f"フレームが読み捨てられます (STREAM_RING_SIZE を {needed} 以上にしてください)"
+                )
+
+    def _report_loop(self) -> None:
+        """カメラごとの処理状況と検出スキップ率を定期的にログへ出す"""
+        while True:
+            self._sio.sleep(STATS_REPORT_INTERVAL)
+            rate = self._rate
+            logger.info(
+                f"認識処理時間 {rate.service_time * 1000:.0f} ms, "
+                f"遅延 {rate.latency * 1000:.0f} ms, "
+                f"カメラあたりの認識間隔 {rate.interval() * 1000:.0f} ms, "
+                f"faces_update 送信 {self._broadcaster.emitted} 回 "
+                f"(変化なしで省略 {self._broadcaster.suppressed} 回)"
+            )
+            for camera in self._cameras.values():
+                tracker = camera.tracker
+                counts = camera.queue.counts
+                logger.info(
+                    f"[{camera.camera_id}] 処理 {camera.processed} フレーム, "
+                    f"破棄 {counts['dropped']} フレーム, "
+                    f"間引き {counts['skipped']} フレーム, "
+                    f"期限切れ {counts['expired']} フレーム, "
+                    f"静止スキップ {camera.static} フレーム, "
+                    f"顔検出スキップ率: {tracker.skip_ratio:.1%}, "
+                    f"照合スキップ率: {tracker.dedup_ratio:.1%}"
+                )
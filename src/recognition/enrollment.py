@@ -0,0 +1,209 @@
+# src/recognition/enrollment.py
+
+from __future__ import annotations
+
+import logging
+import math
+
+import cv2
+import numpy as np
+
+from src.config import config
+
+logger = logging.getLogger(__name__)
+
+# 品質スコアの基準値
+# 顔の短辺がこのピクセル数以上あれば、サイズのスコアを満点とする
+GOOD_FACE_SIZE = 128
+# 顔領域 (128×128に正規化) のラプラシアンの分散がこの値以上あれば、鮮明さのスコアを満点とする
+SHARPNESS_REFERENCE = 100.0
+# 鼻先の左右のずれ (両目の間隔に対する比) がこの値以上の顔は、横向きとしてスコアを0とする
+MAX_YAW_RATIO = 0.5
+# 鮮明さの計算に使う顔領域のサイズ
+SHARPNESS_PATCH = 128
+
+
+def select_enrollment_face(locations: list, dominant_ratio: float | None = None):
+    """
+    登録画像から本人の顔を選び、そのインデックスを返す。
+    顔が複数ある場合は最も大きい顔を選ぶが、2番目の顔との面積比が
+    dominant_ratio 未満の場合は本人を特定できないとしてNoneを返す。
+    """
+    if not locations:
+        return None
+    if len(locations) == 1:
+        return 0
+    if dominant_ratio is None:
+        dominant_ratio = config.ENROLL_DOMINANT_FACE_RATIO
+    areas = [(bottom - top) * (right - left) for top, right, bottom, left in locations]
+    order = sorted(range(len(areas)), key=areas.__getitem__, reverse=True)
+    if areas[order[0]] < areas[order[1]] * dominant_ratio:
+        return None
+    return order[0]
+
+
+def assess_face(image_rgb: np.ndarray, location, landmarks: dict) -> dict:
+    """
+    登録用の顔の品質を評価する。
+    サイズ (顔の短辺)・鮮明さ (ラプラシアンの分散)・向き (ランドマークから推定した左右の向き) を
+    それぞれ0〜1に正規化し、その幾何平均を総合スコア (quality) とする。
+    """
+    top, right, bottom, left = location
+    side = max(0, min(bottom - top, right - left))
+    size_score = min(1.0, side / GOOD_FACE_SIZE)
+
+    sharpness = 0.0
+    crop = image_rgb[max(0, top) : bottom, max(0, left) : right]
+    if crop.size:
+        gray = cv2.cvtColor(crop, cv2.COLOR_RGB2GRAY)
+        gray = cv2.resize(gray, (SHARPNESS_PATCH, SHARPNESS_PATCH))
+        sharpness = float(cv2.Laplacian(gray, cv2.CV_64F).var())
+    sharpness_score = min(1.0, sharpness / SHARPNESS_REFERENCE)
+
+    yaw, roll = estimate_pose(landmarks)
+    pose_score = max(0.0, 1.0 - yaw / MAX_YAW_RATIO) if yaw is not None else 1.0
+
+    quality = (size_score * sharpness_score * pose_score) ** (1 / 3)
+    return {
+        "quality": round(quality, 4),
+        "face_size": int(side),
+        "sharpness": round(sharpness, 1),
+        "yaw": round(yaw, 4) if yaw is not None else None,
+        "roll": round(roll, 1) if roll is not None else None,
+    }
+
+
+def estimate_pose(landmarks: dict) -> tuple[float | None, float | None]:
+    """
+    face_recognition.face_landmarks の結果から顔の向きを推定する。
+    yawは鼻先の両目の中点からの左右のずれを両目の間隔で割った値 (0で正面)、
+    rollは両目を結ぶ線の傾き (度)。ランドマークが足りない場合はNone。
+    """
+    left_eye = landmarks.get("left_eye")
+    right_eye = landmarks.get("right_eye")
+    nose_tip = landmarks.get("nose_tip")
+    if not left_eye or not right_eye or not nose_tip:
+        return None, None
+    left = np.mean(left_eye, axis=0)
+    right = np.mean(right_eye, axis=0)
+    nose = np.mean(nose_tip, axis=0)
+    eye_vector = right - left
+    eye_distance = float(np.hypot(*eye_vector))
+    if eye_distance == 0:
+        return None, None
+    # 鼻先を両目を結ぶ線に射影し、中点からのずれを求める (顔の傾きに影響されない)
+    offset = float(np.dot(nose - (left + right) / 2, eye_vector) / eye_distance)
+    roll = math.degrees(math.atan2(eye_vector[1], eye_vector[0]))
+    return abs(offset) / eye_distance, roll
+
+
+def representative_vectors(
+    encodings: np.ndarray,
+    qualities: np.ndarray | None = None,
+    max_vectors: int | None = None,
+    outlier_distance: float | None = None,
+) -> tuple[np.ndarray, dict]:
+    """
+    1人分のエンコーディングを、照合に使う代表ベクトル (最大 max_vectors 件) に絞り込む。
+
+    1. 3件以上ある場合、全体のメドイドから outlier_distance 以上離れたもの
+       (別人の顔や極端な撮影条件) を外れ値として除く
+    2. 残りが max_vectors 件以下ならそのまま使う
+    3. 超える場合は k-メドイド (k = max_vectors - 1) のメドイドと、
+       品質で重み付けした重心の計 max_vectors 件にする
+    戻り値は (代表ベクトルの行列, 絞り込みの内訳)。
+    """
+    if max_vectors is None:
+        max_vectors = config.ENROLL_MAX_VECTORS
+    if outlier_distance is None:
+        outlier_distance = config.ENROLL_OUTLIER_DISTANCE
+    encodings = np.asarray(encodings, dtype=np.float32)
+    n = len(encodings)
+    if qualities is None:
+        qualities = np.ones(n, dtype=np.float32)
+    summary = {"encodings": n, "outliers": 0, "vectors": n}
+    if n == 0:
+        return encodings, summary
+
+    distances = _pairwise_distances(encodings)
+    if n >= 3 and outlier_distance > 0:
+        medoid = int(np.argmin(distances.sum(axis=1)))
+        keep = distances[medoid] < outlier_distance
+        if keep.sum() >= 2:
+            summary["outliers"] = int(n - keep.sum())
+            encodings = encodings[keep]
+            qualities = qualities[keep]
+            distances = distances[np.ix_(keep, keep)]
+            n = len(encodings)
+
+    if max_vectors <= 0 or n <= max_vectors:
+        summary["vectors"] = n
+        return encodings, summary
+
+    medoids = _k_medoids(distances, qualities, max(1, max_vectors - 1))
+    weights = np.maximum(qualities, 1e-3)
+    centroid = (encodings * weights[:, None]).sum(axis=0) / weights.sum()
+    vectors = np.vstack([encodings[medoids], centroid[None, :]]).astype(np.float32)
+    summary["vectors"] = len(vectors)
+    return vectors, summary
+
+
+def identity_threshold(
+    vectors: np.ndarray,
+    spread_factor: float | None = None,
+    lower: float | None = None,
+    upper: float | None = None,
+) -> float:
+    """
+    1人分の代表ベクトルのばらつきから、その人物の照合しきい値を求める。
+    代表ベクトル同士の最大距離 × spread_factor を [lower, upper] に収めた値で、
+    写真のばらつきが小さい人物ほど厳しいしきい値になる。
+    ばらつきが分からない (代表ベクトルが1件) 場合や spread_factor が0の場合は upper を返す。
+    """
+    if spread_factor is None:
+        spread_factor = config.FACE_MATCH_SPREAD_FACTOR
+    if lower is None:
+        lower = config.FACE_MATCH_MIN_THRESHOLD
+    if upper is None:
+        upper = config.FACE_MATCH_THRESHOLD
+    if spread_factor <= 0 or len(vectors) < 2:
+        return upper
+    spread = float(_pairwise_distances(np.asarray(vectors, dtype=np.float32)).max())
+    return min(max(spread * spread_factor, min(lower, upper)), upper)
+
+
+# --- Internal API ---
+def _pairwise_distances(encodings: np.ndarray) -> np.ndarray:
+    sq = np.einsum("ij,ij->i", encodings, encodings)
+    d2 = sq[:, None] + sq[None, :] - 2.0 * (encodings @ encodings.T)
+    return np.sqrt(np.maximum(d2, 0.0))
+
+
+def _k_medoids(
+    distances: np.ndarray, qualities: np.ndarray, k: int, max_iter: int = 20
+) -> np.ndarray:
+    """
+    距離行列に対するk-メドイド (交互最適化)。
+    初期値は最も品質の高い点から始めて、既存のメドイドから最も遠い点を順に加える
+    (乱数を使わないため、同じ入力からは常に同じ代表ベクトルが選ばれる)。
+    """
+    medoids = [int(np.argmax(qualities))]
+    while len(medoids) < k:
+        nearest = distances[:, medoids].min(axis=1)
+        medoids.append(int(np.argmax(nearest)))
+    medoids = np.asarray(medoids)
+
+    for _ in range(max_iter):
+        labels = np.argmin(distances[:, medoids], axis=1)
+        updated = medoids.copy()
+        for c in range(k):
+            members = np.flatnonzero(labels == c)
+            if len(members) == 0:
+                continue
+            costs = distances[np.ix_(members, members)].sum(axis=1)
+            updated[c] = members[int(np.argmin(costs))]
+        if np.array_equal(updated, medoids):
+            break
+        medoids = updated
+    # 同一の画像が重複している場合などは、同じ点が複数回選ばれうる
+    return np.unique(medoids)
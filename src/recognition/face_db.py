@@ -1,107 +1,633 @@
 from __future__ import annotations
 
 import logging
+import os
 import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
-import face_recognition
 import numpy as np
+from eventlet import patcher
 
 from src.config import config
+from src.recognition.enrollment import (
+    assess_face,
+    identity_threshold,
+    representative_vectors,
+    select_enrollment_face,
+)
+from src.recognition.index import GalleryIndex, create_index
+from src.recognition.store import EmbeddingStore
+
+# tpoolのOSスレッドから呼ばれたかを判定するため、モンキーパッチされていないthreadingを使う
+_threading = patcher.original("threading")
 
 logger = logging.getLogger(__name__)
 
-# キャッシュファイルのパスをデータディレクトリ内に設定
-CACHE_FILE = config.FACE_DATA_DIR / "_encodings.pkl"
+# 旧形式のpickleキャッシュ (存在する場合は埋め込みストアへ自動で移行する)
+LEGACY_CACHE_FILE = config.FACE_DATA_DIR / "_encodings.pkl"
+LEGACY_CACHE_VERSION = 2
+
+# 登録画像として扱う拡張子
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+
+# dlibの顔エンコーディングの次元数
+ENCODING_DIM = 128
+
+# 埋め込みストア (float32行列 + インデックス) をデータディレクトリ内に置く
+STORE = EmbeddingStore(config.FACE_DATA_DIR, dim=ENCODING_DIM)
+
+
+class Gallery:
+    """
+    照合に使うギャラリーのスナップショット。構築後は変更せず、
+    再読み込み時は新しいインスタンスを作って参照ごと差し替える。
+    """
+
+    def __init__(
+        self,
+        people: list[dict],
+        matrix: np.ndarray,
+        generation: int,
+        enrollment: dict | None = None,
+    ):
+        # ギャラリー全体を1つの連続したfloat32行列として保持する (ストアのmemmap)
+        # offsets[p] は人物pの先頭行。探索はindex (設定で選択) に委譲する
+        self.names = [person["name"] for person in people]
+        self.matrix = matrix
+        self.offsets = np.asarray(
+            [person["offset"] for person in people], dtype=np.intp
+        )
+        # 人物ごとの行ブロックはmemmapのビューなのでコピーは発生しない
+        self.embeddings = {
+            person["name"]: matrix[
+                person["offset"] : person["offset"] + person["count"]
+            ]
+            for person in people
+        }
+        self.index: GalleryIndex = create_index(self.matrix, self.offsets)
+        # 人物ごとの照合しきい値 (登録ベクトルのばらつきから求める)
+        self.thresholds = np.asarray(
+            [identity_threshold(self.embeddings[name]) for name in self.names],
+            dtype=np.float64,
+        )
+        self.generation = generation
+        self.built_at = time.time()
+        # 登録画像から代表ベクトルへの絞り込みの内訳 (ストアから読み込んだ場合のみ)
+        self.enrollment = enrollment
 
 
 class FaceDB:
-    def __init__(self) -> None:
-        self.embeddings = {}
-        self.load()
+    def __init__(self, autoload: bool = True) -> None:
+        self._gallery = Gallery([], np.empty((0, ENCODING_DIM), np.float32), 0)
+        if autoload:
+            self.load()
+
+    @classmethod
+    def from_encodings(cls, embeddings: dict[str, np.ndarray]) -> FaceDB:
+        """
+        人物名 -> エンコーディングの配列 (N×128) からFaceDBを作る。
+        登録画像やストアは使わないため、ベンチマークなどで合成ギャラリーを使う場合に利用する
+        """
+        db = cls(autoload=False)
+        rows, people, offset = [], [], 0
+        for name, vectors in embeddings.items():
+            vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, ENCODING_DIM)
+            if len(vectors) == 0:
+                continue
+            people.append({"name": name, "offset": offset, "count": len(vectors)})
+            rows.append(vectors)
+            offset += len(vectors)
+        if rows:
+            matrix = np.ascontiguousarray(np.vstack(rows))
+        else:
+            matrix = np.empty((0, ENCODING_DIM), dtype=np.float32)
+        db._build_gallery({"people": people}, matrix)
+        return db
 
     # --- Public API ---
-    def reload(self) -> None:
-        """キャッシュを削除し、顔データベースを再構築する"""
-        if CACHE_FILE.exists():
-            CACHE_FILE.unlink()
+    @property
+    def embeddings(self) -> dict[str, np.ndarray]:
+        return self._gallery.embeddings
+
+    @property
+    def generation(self) -> int:
+        """ギャラリーの世代番号 (差し替えのたびに1増える。0は未構築)"""
+        return self._gallery.generation
+
+    def status(self) -> dict:
+        """現在のギャラリーの状態を返す"""
+        gallery = self._gallery
+        return {
+            "generation": gallery.generation,
+            "built_at": gallery.built_at if gallery.generation else None,
+            "people": len(gallery.names),
+            "vectors": len(gallery.matrix),
+            "index": gallery.index.name,
+            "thresholds": (
+                {
+                    "min": round(float(gallery.thresholds.min()), 3),
+                    "median": round(float(np.median(gallery.thresholds)), 3),
+                    "max": round(float(gallery.thresholds.max()), 3),
+                }
+                if gallery.names
+                else None
+            ),
+            "enrollment": gallery.enrollment,
+        }
+
+    def reload(self, full: bool = False) -> None:
+        """
+        顔データベースを再読み込みする。
+        通常は追加・変更された画像のみを再エンコードし、full=Trueの場合はストアを削除して全件再構築する。
+        構築中も現在のギャラリーで照合を続けられ、完了時に新しいギャラリーへ差し替わる。
+        """
+        if full:
+            STORE.remove()
+            if LEGACY_CACHE_FILE.exists():
+                LEGACY_CACHE_FILE.unlink()
         self.load()
 
+    def open_store(self) -> bool:
+        """
+        埋め込みストアに保存済みのギャラリーだけを開く (画像の走査・エンコードは行わない)。
+        ストアの構築は別のプロセスに任せ、読み取り専用で使う場合に利用する
+        """
+        opened = STORE.open()
+        if opened is None:
+            return False
+        self._build_gallery(*opened)
+        return True
+
     def match(self, enc: np.ndarray) -> str | None:
         """
         与えられた顔エンコーディングに最も一致する人物名を返す
-        しきい値以下のマッチが見つからない場合はNoneを返す
+        しきい値以下のマッチが見つからない場合や、2番目の人物と判別できない場合はNoneを返す
+        """
+        return self.identify([enc])[0]
+
+    def identify(self, encodings, margin: float | None = None) -> list[str | None]:
         """
-        best_id, best_dist = None, 1.0
-        for uid, vecs in self.embeddings.items():
-            # 1対多の距離計算
-            distances = face_recognition.face_distance(vecs, enc)
-            # 最も小さい距離を取得
-            d = distances.min()
-            if d < best_dist:
-                best_id, best_dist = uid, d
+        複数の顔エンコーディングを一括で照合し、顔ごとに人物名 (または None) を返す。
+        最も近い人物の距離がその人物のしきい値未満で、かつ2番目に近い人物との
+        距離の差が margin 以上の場合だけ、その人物と判定する (オープンセットの棄却)。
+        """
+        if margin is None:
+            margin = config.FACE_MATCH_MARGIN
+
+        gallery = self._gallery
+        probes = np.asarray(encodings, dtype=np.float64).reshape(-1, ENCODING_DIM)
+        if len(probes) == 0 or not gallery.names:
+            return [None] * len(probes)
+
+        names = []
+        for candidates in gallery.index.search(probes, 2):
+            best, distance = candidates[0] if candidates else (None, None)
+            if (
+                best is None
+                or distance >= gallery.thresholds[best]
+                or (len(candidates) > 1 and candidates[1][1] - distance < margin)
+            ):
+                names.append(None)
+            else:
+                names.append(gallery.names[best])
+        return names
 
-        return best_id if best_dist < config.FACE_MATCH_THRESHOLD else None
+    def match_many(
+        self, encodings, k: int = 1, threshold: float | None = None
+    ) -> list[list[tuple[str, float]]]:
+        """
+        複数の顔エンコーディングをギャラリー全体と一括で照合する。
+        顔ごとに、距離がしきい値未満の人物を近い順に最大k人 (人物名, 距離) で返す。
+        thresholdを省略した場合は人物ごとのしきい値を使う。
+        """
+        # 照合中に差し替えが起きても一貫した結果になるよう、参照を一度だけ読む
+        gallery = self._gallery
+        probes = np.asarray(encodings, dtype=np.float64).reshape(-1, ENCODING_DIM)
+        if len(probes) == 0 or not gallery.names:
+            return [[] for _ in range(len(probes))]
+
+        # インデックスで顔ごとの上位k人を探索し、しきい値で絞り込む
+        results = []
+        for candidates in gallery.index.search(probes, k):
+            results.append(
+                [
+                    (gallery.names[p], d)
+                    for p, d in candidates
+                    if d < (gallery.thresholds[p] if threshold is None else threshold)
+                ]
+            )
+        return results
 
     # --- Internal API---
+    def _build_gallery(self, header: dict, matrix: np.ndarray) -> None:
+        """
+        ストアのヘッダと行列から新しいギャラリーを構築し、アトミックに差し替える。
+        行列の先頭 gallery_count 行が照合用の代表ベクトルで、残りは画像ごとのエンコーディング
+        """
+        gallery_count = header.get("gallery_count", len(matrix))
+        gallery = Gallery(
+            header["people"],
+            matrix[:gallery_count],
+            self._gallery.generation + 1,
+            header.get("enrollment"),
+        )
+        self._gallery = gallery
+        logger.info(
+            f"照合用ギャラリーを構築しました (世代 {gallery.generation}, "
+            f"{len(gallery.names)} 人, {len(gallery.matrix)} ベクトル, "
+            f"インデックス: {gallery.index.name})"
+        )
+
     def load(self) -> None:
-        """キャッシュから顔データベースを読み込む。なければ構築する。"""
-        if CACHE_FILE.exists():
-            try:
-                self.embeddings = pickle.loads(CACHE_FILE.read_bytes())
-                logger.info(
-                    f"FaceDBキャッシュをロードしました ({len(self.embeddings)} 人分)"
-                )
-                return
-            except Exception as e:
-                logger.error(
-                    f"FaceDBキャッシュの読み込みに失敗しました: {e}。再構築します。"
-                )
-
-        logger.info("FaceDBを構築しています...")
+        """
+        顔データベースを差分ビルドで読み込む。
+        キャッシュ済みの画像 (パス・mtime・サイズが一致) は再エンコードせず、
+        追加・変更された画像のみをプロセスプールでエンコードする。
+        削除された画像・人物はストアから取り除かれる。
+        """
+        opened = self._open_store()
+        if opened is not None:
+            header, stored = opened
+            records = header["images"]
+        else:
+            header, stored, records = None, None, {}
+
         if not config.FACE_DATA_DIR.exists():
             logger.warning(
                 f"顔データディレクトリが見つかりません: {config.FACE_DATA_DIR}"
             )
             config.FACE_DATA_DIR.mkdir(parents=True, exist_ok=True)
 
-        for user_dir in config.FACE_DATA_DIR.iterdir():
-            if not user_dir.is_dir():
+        # 1. 現在の画像一覧とストアのインデックスを突き合わせる
+        current, pending = {}, []
+        for key, person, img_path, stat in _scan_images(config.FACE_DATA_DIR):
+            cached = records.get(key)
+            # 旧形式でスキップされた画像 (検出した顔の数の記録がない) は、複数の顔を含む画像に
+            # 対応したエンコードで一度だけ再処理する。処理中にエラーになった画像
+            # (読み込み途中のファイルなど一時的な失敗の可能性がある) は毎回再処理する
+            if (
+                cached is not None
+                and cached["mtime_ns"] == stat.st_mtime_ns
+                and cached["size"] == stat.st_size
+                and (cached["row"] is not None or "faces" in cached)
+                and "error" not in cached
+            ):
+                current[key] = cached
                 continue
+            current[key] = {
+                "person": person,
+                "mtime_ns": stat.st_mtime_ns,
+                "size": stat.st_size,
+                "row": None,
+            }
+            pending.append((key, img_path))
 
-            encodings = []
-            for img_path in user_dir.glob("*.*"):
-                if not img_path.name.lower().endswith((".png", ".jpg", ".jpeg")):
-                    continue
+        removed = records.keys() - current.keys()
+        logger.info(
+            f"FaceDBを差分ビルドしています (画像 {len(current)} 枚: "
+            f"キャッシュ済み {len(current) - len(pending)}, "
+            f"新規/変更 {len(pending)}, 削除 {len(removed)})"
+        )
 
-                try:
-                    img = face_recognition.load_image_file(img_path)
-                    locs = face_recognition.face_locations(
-                        img, model="hog"
-                    )  # hogで高速化
+        params = enrollment_params()
+        if (
+            header is not None
+            and not pending
+            and not removed
+            and (header.get("enrollment") or {}).get("params") == params
+        ):
+            # 変更がなければストアの行列をそのままmemmapで使う
+            self._build_gallery(header, stored)
+            return
 
-                    if len(locs) != 1:
-                        logger.warning(
-                            f"画像 '{img_path.relative_to(config.PROJECT_ROOT)}' には顔が{len(locs)}個検出されたため、スキップします。"
-                        )
-                        continue
+        # 2. 新規・変更された画像だけをエンコード (品質の評価結果は画像レコードに残す)
+        new_encodings = {}
+        if pending:
+            for key, enc, info in self._encode_images(pending):
+                current[key].update(info)
+                if enc is not None:
+                    new_encodings[key] = enc
 
-                    enc = face_recognition.face_encodings(img, locs)[0]
-                    encodings.append(enc)
-                    logger.info(
-                        f"エンコード完了: {img_path.relative_to(config.PROJECT_ROOT)}"
-                    )
+        # 3. 人物ごとに代表ベクトルを選んで連続した行ブロックに並べ、
+        #    その後ろに画像ごとのエンコーディングを置いた行列をストアに書き込む
+        #    (絞り込みの設定を変えても再エンコードせずに組み直せる)
+        def vector_of(key: str, record: dict) -> np.ndarray | None:
+            if key in new_encodings:
+                return new_encodings[key]
+            if record["row"] is not None:
+                return stored[record["row"]]
+            return None  # 顔が検出できなかった画像 (再エンコードしない)
 
-                except Exception as e:
-                    logger.error(f"画像 '{img_path.name}' の処理中にエラー: {e}")
-
-            if encodings:
-                self.embeddings[user_dir.name] = np.vstack(encodings)
+        matrix, people, current, enrollment = _pack_rows(
+            (key, record, vector_of(key, record))
+            for key, record in sorted(current.items())
+        )
 
+        logger.info(
+            f"登録画像 {enrollment['images']} 枚 (エンコード済み {enrollment['encodings']} 件) から "
+            f"代表ベクトル {enrollment['vectors']} 件を選びました "
+            f"(低品質で除外 {enrollment['low_quality']} 件, 外れ値 {enrollment['outliers']} 件)"
+        )
         try:
-            CACHE_FILE.write_bytes(pickle.dumps(self.embeddings))
+            STORE.write(
+                matrix,
+                people,
+                current,
+                gallery_count=enrollment["vectors"],
+                enrollment=enrollment,
+            )
             logger.info(
-                f"FaceDBを構築し、キャッシュを保存しました ({len(self.embeddings)} 人分)"
+                f"埋め込みストアを保存しました ({len(people)} 人, "
+                f"代表ベクトル {enrollment['vectors']} 件 + "
+                f"エンコーディング {enrollment['encodings']} 件)"
             )
         except Exception as e:
-            logger.error(f"FaceDBキャッシュの保存に失敗しました: {e}")
+            logger.error(f"埋め込みストアの保存に失敗しました: {e}")
+            self._build_gallery(
+                {"people": people, "gallery_count": enrollment["vectors"]}, matrix
+            )
+            return
+
+        opened = STORE.open()
+        if opened is None:
+            self._build_gallery(
+                {"people": people, "gallery_count": enrollment["vectors"]}, matrix
+            )
+            return
+        self._build_gallery(*opened)
+
+    def _open_store(self) -> tuple[dict, np.ndarray] | None:
+        """埋め込みストアを開く。旧形式のpickleキャッシュがあれば移行する"""
+        opened = STORE.open()
+        if opened is not None:
+            header, matrix = opened
+            logger.info(
+                f"埋め込みストアを開きました ({len(header['images'])} 枚分, "
+                f"{len(matrix)} ベクトル)"
+            )
+            return opened
+        if LEGACY_CACHE_FILE.exists():
+            return self._migrate_legacy_cache()
+        return None
+
+    def _migrate_legacy_cache(self) -> tuple[dict, np.ndarray] | None:
+        """pickleキャッシュ (画像単位の形式、または最初期の人物単位の形式) を埋め込みストアへ移行する"""
+        try:
+            data = pickle.loads(LEGACY_CACHE_FILE.read_bytes())
+        except Exception as e:
+            logger.error(
+                f"pickleキャッシュの読み込みに失敗しました: {e}。再構築します。"
+            )
+            data = None
+
+        if not isinstance(data, dict):
+            LEGACY_CACHE_FILE.unlink()
+            return None
+        if data.get("version") == LEGACY_CACHE_VERSION:
+            matrix, people, images, enrollment = _pack_rows(
+                (key, record, record.get("encoding"))
+                for key, record in sorted(data["images"].items())
+            )
+        else:
+            # 最初期の形式 (人物名 -> 行列) は画像との対応が分からないため、
+            # 保存されたベクトルをそのまま代表ベクトルとして移行する (画像ごとの行は持たない)。
+            # 画像は続く差分ビルドでエンコードし直す (完了するまでストアには移行したベクトルが残る)
+            matrix, people, images, enrollment = _legacy_rows(data)
+        try:
+            STORE.write(
+                matrix,
+                people,
+                images,
+                gallery_count=enrollment["vectors"],
+                enrollment=enrollment,
+            )
+        except Exception as e:
+            logger.error(f"埋め込みストアへの移行に失敗しました: {e}。再構築します。")
+            return None
+        LEGACY_CACHE_FILE.unlink()
+        logger.info(
+            f"pickleキャッシュを埋め込みストアへ移行しました "
+            f"({len(people)} 人, {len(images)} 枚分)"
+        )
+        return STORE.open()
+
+    def _encode_images(self, pending: list[tuple[str, Path]]):
+        """画像をエンコードし、(キー, エンコーディング or None, 品質などの情報) を順に返す"""
+        workers = build_workers()
+        if workers > 1 and _offloaded():
+            # eventlet下では、tpoolのOSスレッドからプロセスプールを起動すると
+            # 管理スレッドが動かずにハングするため、直列でエンコードする
+            logger.info(
+                "バックグラウンドのスレッドで構築しているため、直列でエンコードします。"
+            )
+            workers = 1
+        workers = max(1, min(workers, len(pending)))
+        paths = [str(img_path) for _, img_path in pending]
+
+        started = time.perf_counter()
+        if workers == 1:
+            results = map(_encode_image, paths)
+            executor = None
+        else:
+            executor = ProcessPoolExecutor(max_workers=workers)
+            results = executor.map(_encode_image, paths, chunksize=4)
+
+        try:
+            for (key, _), (enc, info, message) in zip(pending, results):
+                if message:
+                    logger.warning(f"画像 '{key}' {message}")
+                else:
+                    logger.info(f"エンコード完了: {key} (品質 {info['quality']:.2f})")
+                yield key, enc, info
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        elapsed = time.perf_counter() - started
+        logger.info(
+            f"{len(pending)} 枚のエンコードが完了しました "
+            f"({elapsed:.1f} 秒, {len(pending) / max(elapsed, 1e-6):.1f} 枚/秒, "
+            f"ワーカー {workers})"
+        )
+
+
+def build_workers() -> int:
+    """登録画像のエンコードに使うプロセス数 (FACE_DB_BUILD_WORKERS、0の場合はCPUコア数)"""
+    return config.FACE_DB_BUILD_WORKERS or os.cpu_count() or 1
+
+
+def scan_signature(data_dir: Path | None = None) -> int:
+    """登録画像の一覧 (パス・mtime・サイズ) から変更検知用のシグネチャを計算する"""
+    data_dir = data_dir or config.FACE_DATA_DIR
+    if not data_dir.exists():
+        return 0
+    return hash(
+        tuple(
+            (key, stat.st_mtime_ns, stat.st_size)
+            for key, _, _, stat in _scan_images(data_dir)
+        )
+    )
+
+
+def enrollment_params() -> dict:
+    """代表ベクトルの選び方を決める設定 (変わった場合は再エンコードせずに行列を組み直す)"""
+    return {
+        "max_vectors": config.ENROLL_MAX_VECTORS,
+        "min_quality": config.ENROLL_MIN_QUALITY,
+        "outlier_distance": config.ENROLL_OUTLIER_DISTANCE,
+    }
+
+
+def _pack_rows(entries) -> tuple[np.ndarray, list[dict], dict, dict]:
+    """
+    (キー, 画像レコード, エンコーディング or None) の列から、ストアの行列・人物オフセット・
+    行番号付きの画像レコード・代表ベクトルへの絞り込みの内訳を組み立てる。
+    行列は「人物ごとに連続した代表ベクトルの行ブロック」の後ろに
+    「画像ごとのエンコーディング」を並べたもので、照合には前者だけを使う。
+    entriesはキー (人物名/ファイル名) 順に並んでいる必要がある。
+    """
+    params = enrollment_params()
+    encodings, images = [], {}
+    # 人物名 -> [(エンコーディングの行番号, 品質)]
+    per_person: dict[str, list[tuple[int, float]]] = {}
+    for key, record, vec in entries:
+        record = {k: v for k, v in record.items() if k != "encoding"}
+        record["row"] = None
+        if vec is not None:
+            record["row"] = len(encodings)
+            encodings.append(vec)
+            # 品質を評価していない (旧形式の) 画像は基準を満たすものとして扱う
+            quality = record.get("quality")
+            per_person.setdefault(record["person"], []).append(
+                (record["row"], 1.0 if quality is None else quality)
+            )
+        images[key] = record
+
+    if encodings:
+        encoding_matrix = np.vstack(encodings).astype(np.float32)
+    else:
+        encoding_matrix = np.empty((0, ENCODING_DIM), dtype=np.float32)
+
+    blocks, people = [], []
+    summary = {
+        "params": params,
+        "people": len(per_person),
+        "images": len(images),
+        "encodings": len(encodings),
+        "low_quality": 0,
+        "outliers": 0,
+        "vectors": 0,
+    }
+    offset = 0
+    for name, rows in per_person.items():
+        indices = np.asarray([row for row, _ in rows], dtype=np.intp)
+        qualities = np.asarray([quality for _, quality in rows], dtype=np.float32)
+        passed = qualities >= params["min_quality"]
+        if not passed.any():
+            # 基準を満たす画像がない人物は、最も品質の高い1枚だけで登録する
+            logger.warning(
+                f"'{name}' の登録画像はすべて品質の基準を下回っています。"
+                f"最も品質の高い1枚 (品質 {qualities.max():.2f}) を使います。"
+            )
+            passed = np.arange(len(qualities)) == int(np.argmax(qualities))
+        summary["low_quality"] += int((~passed).sum())
+        vectors, detail = representative_vectors(
+            encoding_matrix[indices[passed]],
+            qualities[passed],
+            max_vectors=params["max_vectors"],
+            outlier_distance=params["outlier_distance"],
+        )
+        summary["outliers"] += detail["outliers"]
+        people.append({"name": name, "offset": offset, "count": len(vectors)})
+        blocks.append(vectors)
+        offset += len(vectors)
+
+    summary["vectors"] = offset
+    # 画像レコードの行番号は、代表ベクトルの後ろに置いたエンコーディングを指す
+    for record in images.values():
+        if record["row"] is not None:
+            record["row"] += offset
+    matrix = np.vstack(blocks + [encoding_matrix]).astype(np.float32)
+    return matrix, people, images, summary
+
+
+def _legacy_rows(embeddings: dict) -> tuple[np.ndarray, list[dict], dict, dict]:
+    """最初期のpickleキャッシュ (人物名 -> 行列) から、代表ベクトルだけのストアの行列を組み立てる"""
+    blocks, people, offset = [], [], 0
+    for name, vectors in sorted(embeddings.items()):
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, ENCODING_DIM)
+        if len(vectors) == 0:
+            continue
+        people.append({"name": name, "offset": offset, "count": len(vectors)})
+        blocks.append(vectors)
+        offset += len(vectors)
+    if blocks:
+        matrix = np.ascontiguousarray(np.vstack(blocks))
+    else:
+        matrix = np.empty((0, ENCODING_DIM), dtype=np.float32)
+    summary = {
+        "people": len(people),
+        "images": 0,
+        "encodings": 0,
+        "low_quality": 0,
+        "outliers": 0,
+        "vectors": offset,
+    }
+    return matrix, people, {}, summary
+
+
+def _offloaded() -> bool:
+    """eventletのモンキーパッチ下で、メインスレッド以外 (tpoolのOSスレッド) から呼ばれたか"""
+    return (
+        patcher.is_monkey_patched("thread")
+        and _threading.current_thread() is not _threading.main_thread()
+    )
+
+
+def _scan_images(data_dir: Path):
+    """登録画像を走査し、(キー, 人物名, パス, stat) を順に返す"""
+    for user_dir in sorted(data_dir.iterdir()):
+        if not user_dir.is_dir():
+            continue
+        for img_path in sorted(user_dir.glob("*.*")):
+            if not img_path.name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            try:
+                stat = img_path.stat()
+            except OSError as e:
+                logger.error(f"画像 '{img_path.name}' の情報を取得できません: {e}")
+                continue
+            yield f"{user_dir.name}/{img_path.name}", user_dir.name, img_path, stat
+
+
+def _encode_image(path: str) -> tuple[np.ndarray | None, dict, str | None]:
+    """
+    1枚の登録画像をエンコードする (プロセスプールのワーカーで実行される)。
+    戻り値は (エンコーディング, 検出した顔の数と品質の評価, スキップ理由)。
+    処理中のエラーでは顔の数の代わりにエラー内容を返し、次回の読み込みで再処理させる。
+    顔が複数ある場合は最も大きい顔を本人とみなし、同程度の大きさの顔が並んでいる場合はスキップする。
+    """
+    # dlibのモデル読み込みは重いため、実際にエンコードする場合にのみ読み込む
+    import face_recognition
+
+    try:
+        img = face_recognition.load_image_file(path)
+        locs = face_recognition.face_locations(img, model="hog")  # hogで高速化
+        info = {"faces": len(locs)}
+        if not locs:
+            return None, info, "には顔が検出されなかったため、スキップします。"
+        index = select_enrollment_face(locs)
+        if index is None:
+            return (
+                None,
+                info,
+                f"には同程度の大きさの顔が{len(locs)}個あり、本人を特定できないため、スキップします。",
+            )
+        location = locs[index]
+        landmarks = face_recognition.face_landmarks(img, [location])[0]
+        info.update(assess_face(img, location, landmarks))
+        return face_recognition.face_encodings(img, [location])[0], info, None
+    except Exception as e:
+        return None, {"error": str(e)}, f"の処理中にエラー: {e}"
@@ -0,0 +1,95 @@
+# src/recognition/frame_queue.py
+
+from __future__ import annotations
+
+import logging
+import time
+from collections import deque
+
+from src.config import config
+from src.streaming.receiver import Frame
+
+logger = logging.getLogger(__name__)
+
+# 認識待ちのフレームが溢れたときの方針
+# latest: 最新の1枚だけを保持する (古いフレームは新しいフレームで置き換える)
+# drop_oldest: FRAME_QUEUE_SIZE 枚まで保持し、溢れたら最も古いフレームを捨てる
+# every_nth: N枚に1枚だけを受け付け、FRAME_QUEUE_SIZE 枚まで保持する (溢れたら最も古いものを捨てる)
+POLICIES = ("latest", "drop_oldest", "every_nth")
+
+# 統計カウンタの種類
+# enqueued: 受け付けた, dropped: 溢れて捨てた, skipped: every_nthで間引いた,
+# expired: 処理期限を過ぎたため認識せずに捨てた
+OUTCOMES = ("enqueued", "dropped", "skipped", "expired")
+
+
+class FrameQueue:
+    """
+    1台のカメラの、受信から認識までの間の有限長のフレームキュー。
+
+    受け付けたフレームには処理期限 (キャプチャ時刻 + FRAME_MAX_AGE 秒) を設定し、
+    取り出すときに期限を過ぎたフレームは認識せずに捨てる。負荷がCPUの処理能力を
+    超えても、キューの長さと期限によって受信から結果送信までの遅延に上限ができる。
+    フレームはリングバッファのスロットを借りたまま保持する (コピーしない) ため、
+    保持できる枚数は実質的に STREAM_RING_SIZE で制限される。
+    グリーンスレッドからのみ操作するため、ロックは不要。
+    """
+
+    def __init__(
+        self,
+        policy: str | None = None,
+        capacity: int | None = None,
+        every_nth: int | None = None,
+        max_age: float | None = None,
+    ):
+        self.policy = (policy or config.FRAME_QUEUE_POLICY).lower()
+        if self.policy not in POLICIES:
+            raise ValueError(
+                f"不明なフレームキューの方針です: {self.policy} "
+                f"(指定できる値: {', '.join(POLICIES)})"
+            )
+        self.capacity = (
+            1
+            if self.policy == "latest"
+            else max(1, capacity or config.FRAME_QUEUE_SIZE)
+        )
+        self.every_nth = max(1, every_nth or config.FRAME_QUEUE_EVERY_NTH)
+        self.max_age = config.FRAME_MAX_AGE if max_age is None else max_age
+        self._frames: deque[Frame] = deque()
+        self._arrivals = 0
+        self.counts = dict.fromkeys(OUTCOMES, 0)
+
+    def __len__(self) -> int:
+        return len(self._frames)
+
+    # --- Public API ---
+    def put(self, frame: Frame) -> bool:
+        """
+        フレームを方針に従ってキューに入れる。受け付けなかった場合はフレームを返却してFalseを返す。
+        """
+        self._arrivals += 1
+        if self.policy == "every_nth" and (self._arrivals - 1) % self.every_nth:
+            frame.release()
+            self.counts["skipped"] += 1
+            return False
+
+        if self.max_age > 0:
+            frame.deadline = frame.timestamp + self.max_age
+        if len(self._frames) >= self.capacity:
+            self._frames.popleft().release()
+            self.counts["dropped"] += 1
+        self._frames.append(frame)
+        self.counts["enqueued"] += 1
+        return True
+
+    def get(self, now: float | None = None) -> Frame | None:
+        """処理期限を過ぎたフレームを捨てながら、次に認識するフレームを取り出す"""
+        now = time.time() if now is None else now
+        while self._frames:
+            frame = self._frames.popleft()
+            if frame.deadline is not None and now > frame.deadline:
+                frame.release()
+                self.counts["expired"] += 1
+                continue
+            return frame
+        return None
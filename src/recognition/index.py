@@ -0,0 +1,257 @@
+# src/recognition/index.py
+
+from __future__ import annotations
+
+import logging
+import math
+
+import numpy as np
+
+from src.config import config
+
+logger = logging.getLogger(__name__)
+
+
+class GalleryIndex:
+    """
+    FaceDBのギャラリー行列に対する近傍探索インデックスの基底クラス。
+    行列は人物ごとに連続した行ブロックで並んでいる前提 (offsets[p] が人物pの先頭行)。
+    """
+
+    name = "base"
+
+    def __init__(self, matrix: np.ndarray, offsets: np.ndarray) -> None:
+        self._matrix = matrix
+        self._offsets = np.asarray(offsets, dtype=np.intp)
+        self._num_people = len(self._offsets)
+        self._labels = np.repeat(
+            np.arange(self._num_people, dtype=np.intp),
+            np.diff(np.append(self._offsets, len(matrix))),
+        )
+
+    def search(self, probes: np.ndarray, k: int) -> list[list[tuple[int, float]]]:
+        """
+        各プローブについて距離の近い順に上位k人の (人物インデックス, 距離) を返す。
+        距離はface_recognition.face_distanceと同じくfloat64のユークリッド距離。
+        """
+        raise NotImplementedError
+
+    def _person_rows(self, p: int) -> np.ndarray:
+        """人物pの登録ベクトル (行ブロック) を返す"""
+        start = self._offsets[p]
+        end = self._offsets[p + 1] if p + 1 < self._num_people else len(self._matrix)
+        return self._matrix[start:end]
+
+
+class BruteForceIndex(GalleryIndex):
+    """全登録ベクトルとの距離を1回の行列積で計算する厳密なインデックス"""
+
+    name = "exact"
+
+    # float32で計算した二乗距離の誤差の上限の目安 (エンコーディングのノルムは1程度)
+    FLOAT32_SLACK = 1e-4
+
+    def __init__(self, matrix: np.ndarray, offsets: np.ndarray) -> None:
+        super().__init__(matrix, offsets)
+        self._sq_norms = np.einsum("ij,ij->i", matrix, matrix)
+
+    def search(self, probes: np.ndarray, k: int) -> list[list[tuple[int, float]]]:
+        if len(probes) == 0 or self._num_people == 0:
+            return [[] for _ in range(len(probes))]
+
+        # 1. 全顔 x 全登録ベクトルの距離を1回の行列積で計算
+        #    |a - b|^2 = |a|^2 + |b|^2 - 2ab
+        probes32 = probes.astype(np.float32)
+        sq_dists = (
+            np.einsum("ij,ij->i", probes32, probes32)[:, None]
+            + self._sq_norms[None, :]
+            - 2.0 * (probes32 @ self._matrix.T)
+        )
+        np.maximum(sq_dists, 0.0, out=sq_dists)
+
+        # 2. 人物ごとの最小距離 (人物の行は連続しているのでreduceatで集約できる)
+        person_dists = np.minimum.reduceat(sq_dists, self._offsets, axis=1)
+
+        # 3. 上位k人の候補を抽出する。float32の丸め誤差で僅差の順位が入れ替わりうるため、
+        #    k番目との差が FLOAT32_SLACK 以内の人物も候補に残す
+        k = max(1, min(k, self._num_people))
+        if k < self._num_people:
+            kth = np.partition(person_dists, k - 1, axis=1)[:, k - 1 : k]
+            within = person_dists <= kth + self.FLOAT32_SLACK
+        else:
+            within = np.ones(person_dists.shape, dtype=bool)
+
+        results = []
+        for probe, mask in zip(probes, within):
+            # 候補人物のみfloat64で厳密な距離を再計算し、face_distanceと同じ値で上位k人を決める。
+            # 同距離の場合は登録順を優先する (従来のmatchと同じ挙動)
+            scored = [
+                (float(np.linalg.norm(self._person_rows(p) - probe, axis=1).min()), p)
+                for p in np.flatnonzero(mask)
+            ]
+            scored.sort(key=lambda item: item[0])
+            results.append([(int(p), d) for d, p in scored[:k]])
+        return results
+
+
+class IVFIndex(GalleryIndex):
+    """
+    IVF (Inverted File) 方式の近似インデックス。
+    登録ベクトルをk-meansでnlist個のクラスタに分割し、探索時はプローブに近い
+    nprobe個のクラスタに属するベクトルだけを走査する。
+    """
+
+    name = "ivf"
+
+    # k-meansの学習に使うクラスタあたりの最大サンプル数と反復回数
+    TRAIN_SAMPLES_PER_LIST = 64
+    TRAIN_ITERATIONS = 10
+    # 距離計算をまとめて行う行数 (一時メモリの上限を抑えるため)
+    CHUNK_ROWS = 8192
+
+    def __init__(
+        self,
+        matrix: np.ndarray,
+        offsets: np.ndarray,
+        nlist: int = 0,
+        nprobe: int = 8,
+        seed: int = 0,
+    ) -> None:
+        super().__init__(matrix, offsets)
+        n = len(matrix)
+        if nlist <= 0:
+            # 一般的な目安: クラスタ数 ≈ 4√N
+            nlist = int(4 * math.sqrt(n)) if n else 1
+        self.nlist = max(1, min(nlist, n)) if n else 1
+        self.nprobe = max(1, min(nprobe, self.nlist))
+
+        self._centroids = np.empty((0, matrix.shape[1]), dtype=np.float32)
+        self._list_offsets = np.zeros(1, dtype=np.intp)
+        if n == 0:
+            self._ivf_matrix = matrix
+            self._ivf_labels = self._labels
+            return
+
+        rng = np.random.default_rng(seed)
+        self._centroids = self._train(matrix, rng)
+        assign = self._assign(matrix, self._centroids)
+
+        # クラスタ順に行を並べ替え、各リストを連続領域として走査できるようにする
+        order = np.argsort(assign, kind="stable")
+        self._ivf_matrix = np.ascontiguousarray(matrix[order])
+        self._ivf_labels = self._labels[order]
+        counts = np.bincount(assign, minlength=self.nlist)
+        self._list_offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.intp)
+
+    def search(self, probes: np.ndarray, k: int) -> list[list[tuple[int, float]]]:
+        if len(probes) == 0 or self._num_people == 0:
+            return [[] for _ in range(len(probes))]
+
+        # 1. 全プローブと全セントロイドの距離から、走査するクラスタを選ぶ
+        probes32 = probes.astype(np.float32)
+        centroid_dists = self._sq_distances(probes32, self._centroids)
+        if self.nprobe < self.nlist:
+            probed = np.argpartition(centroid_dists, self.nprobe - 1, axis=1)
+            probed = probed[:, : self.nprobe]
+        else:
+            probed = np.broadcast_to(np.arange(self.nlist), centroid_dists.shape)
+
+        results = []
+        for probe, lists in zip(probes, probed):
+            # 2. 選ばれたクラスタの行だけを集めて厳密距離を計算
+            rows = np.concatenate(
+                [
+                    np.arange(self._list_offsets[c], self._list_offsets[c + 1])
+                    for c in lists
+                ]
+            )
+            if len(rows) == 0:
+                results.append([])
+                continue
+            dists = np.linalg.norm(self._ivf_matrix[rows] - probe, axis=1)
+            labels = self._ivf_labels[rows]
+
+            # 3. 人物ごとの最小距離を求めて上位k人を抽出
+            order = np.lexsort((labels, dists))
+            sorted_labels = labels[order]
+            _, first = np.unique(sorted_labels, return_index=True)
+            first.sort()
+            first = first[:k]
+            results.append(
+                [(int(sorted_labels[i]), float(dists[order[i]])) for i in first]
+            )
+        return results
+
+    # --- Internal API ---
+    def _train(self, matrix: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+        """サンプリングした登録ベクトルでk-meansを行い、セントロイドを返す"""
+        n = len(matrix)
+        sample_size = min(n, self.nlist * self.TRAIN_SAMPLES_PER_LIST)
+        sample = matrix[rng.choice(n, size=sample_size, replace=False)]
+        centroids = sample[rng.choice(sample_size, size=self.nlist, replace=False)]
+        centroids = centroids.astype(np.float32, copy=True)
+
+        for _ in range(self.TRAIN_ITERATIONS):
+            assign = self._assign(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            counts = np.bincount(assign, minlength=self.nlist)
+            filled = counts > 0
+            centroids[filled] = sums[filled] / counts[filled, None]
+            # 空クラスタはランダムなサンプルで再初期化する
+            empty = np.flatnonzero(~filled)
+            if len(empty):
+                centroids[empty] = sample[rng.choice(sample_size, size=len(empty))]
+        return centroids
+
+    def _assign(self, vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        """各ベクトルを最も近いセントロイドに割り当てる (チャンク単位で計算)"""
+        assign = np.empty(len(vectors), dtype=np.intp)
+        for start in range(0, len(vectors), self.CHUNK_ROWS):
+            chunk = vectors[start : start + self.CHUNK_ROWS]
+            assign[start : start + len(chunk)] = self._sq_distances(
+                chunk, centroids
+            ).argmin(axis=1)
+        return assign
+
+    @staticmethod
+    def _sq_distances(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+        """aの各行とbの各行の二乗ユークリッド距離の行列を返す"""
+        sq = (
+            np.einsum("ij,ij->i", a, a)[:, None]
+            + np.einsum("ij,ij->i", b, b)[None, :]
+            - 2.0 * (a @ b.T)
+        )
+        return np.maximum(sq, 0.0, out=sq)
+
+
+# 設定値 FACE_INDEX_BACKEND で選択できるバックエンド
+INDEX_BACKENDS = {
+    BruteForceIndex.name: BruteForceIndex,
+    IVFIndex.name: IVFIndex,
+}
+
+
+def create_index(
+    matrix: np.ndarray, offsets: np.ndarray, backend: str | None = None
+) -> GalleryIndex:
+    """設定に従ってギャラリーインデックスを構築する"""
+    backend = (backend or config.FACE_INDEX_BACKEND).lower()
+    if backend not in INDEX_BACKENDS:
+        logger.warning(
+            f"不明なインデックスバックエンド '{backend}' が指定されました。exactを使用します。"
+        )
+        backend = BruteForceIndex.name
+
+    if backend == IVFIndex.name:
+        index = IVFIndex(
+            matrix,
+            offsets,
+            nlist=config.FACE_INDEX_IVF_NLIST,
+            nprobe=config.FACE_INDEX_IVF_NPROBE,
+        )
+        logger.info(
+            f"IVFインデックスを構築しました (nlist={index.nlist}, nprobe={index.nprobe})"
+        )
+        return index
+    return BruteForceIndex(matrix, offsets)
@@ -0,0 +1,83 @@
+# src/recognition/preprocess.py
+
+from __future__ import annotations
+
+import logging
+
+import cv2
+import numpy as np
+
+from src.config import config
+
+logger = logging.getLogger(__name__)
+
+
+def reduced_decode_factor(scale: float) -> int:
+    """
+    検出スケールに対して、JPEGを縮小デコードできる最大の縮小率 (1, 2, 4, 8) を返す。
+    縮小デコードした画像が検出スケールより小さくならないように選ぶ。
+    """
+    factor = 1
+    for candidate in (2, 4, 8):
+        if 1.0 / candidate >= scale - 1e-6:
+            factor = candidate
+    return factor
+
+
+class Preprocessor:
+    """
+    顔検出用の前処理 (縮小・色変換) を行うクラス。
+
+    - 検出スケール (DETECTION_SCALE) は元の解像度に対する比率で指定する
+    - 受信時に縮小デコード済みのフレームは、残りの倍率だけ縮小する (不要なら縮小しない)
+    - 出力先のバッファを使い回し (dst=)、フレームごとの配列の確保を避ける
+
+    返すバッファは次の呼び出しで上書きされるため、1台のカメラにつき1インスタンスを使い、
+    同時に複数スレッドから呼び出さないこと。
+    """
+
+    def __init__(self, scale: float | None = None):
+        self.scale = scale or config.DETECTION_SCALE
+        self._resized: np.ndarray | None = None
+        self._rgb: np.ndarray | None = None
+        self._gray: np.ndarray | None = None
+
+    def __call__(
+        self, frame_bgr: np.ndarray, frame_scale: float = 1.0, gray: bool = False
+    ):
+        return self.prepare(frame_bgr, frame_scale, gray)
+
+    def prepare(
+        self, frame_bgr: np.ndarray, frame_scale: float = 1.0, gray: bool = False
+    ) -> tuple[np.ndarray, np.ndarray | None, float]:
+        """
+        フレームを検出スケールのRGB画像 (とグレースケール画像) に変換する。
+        frame_scale: 入力フレームの元の解像度に対する比率 (縮小デコード済みなら1未満)
+        戻り値は (RGB画像, グレースケール画像またはNone, 元の解像度に対する実際の比率)。
+        """
+        height, width = frame_bgr.shape[:2]
+        factor = self.scale / frame_scale
+        source = frame_bgr
+        effective_scale = frame_scale
+        if factor < 1.0:
+            size = (max(1, round(width * factor)), max(1, round(height * factor)))
+            self._resized = self._buffer(self._resized, (size[1], size[0], 3))
+            cv2.resize(frame_bgr, size, dst=self._resized)
+            source = self._resized
+            effective_scale = frame_scale * size[0] / width
+
+        self._rgb = self._buffer(self._rgb, source.shape)
+        cv2.cvtColor(source, cv2.COLOR_BGR2RGB, dst=self._rgb)
+        small_gray = None
+        if gray:
+            self._gray = self._buffer(self._gray, source.shape[:2])
+            cv2.cvtColor(source, cv2.COLOR_BGR2GRAY, dst=self._gray)
+            small_gray = self._gray
+        return self._rgb, small_gray, effective_scale
+
+    # --- Internal API ---
+    @staticmethod
+    def _buffer(buffer: np.ndarray | None, shape: tuple) -> np.ndarray:
+        if buffer is None or buffer.shape != tuple(shape):
+            return np.empty(shape, dtype=np.uint8)
+        return buffer
@@ -0,0 +1,280 @@
+# src/recognition/process_pool.py
+
+from __future__ import annotations
+
+import logging
+import multiprocessing
+import os
+from multiprocessing.connection import Connection
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+from eventlet import patcher
+
+from src.config import config
+from src.recognition.face_db import FaceDB
+
+# tpoolのOSスレッドから安全に待てるよう、モンキーパッチされていないqueue・os・selectを使う
+_queue = patcher.original("queue")
+_os = patcher.original("os")
+_select = patcher.original("select")
+
+logger = logging.getLogger(__name__)
+
+# ワーカープロセスの起動 (dlibの読み込みなど) を待つ最大時間（秒）
+STARTUP_TIMEOUT = 120
+
+
+class _BlockingConnection(Connection):
+    """
+    モンキーパッチされていないos.read/writeで読み書きする、親プロセス側のパイプの端。
+    eventletのos.read/writeはtpoolのOSスレッドからは待てず、相手のプロセスが
+    終了していても例外にならずにブロックし続けるため、通常のConnectionは使えない。
+    """
+
+    _read = _os.read
+    _write = _os.write
+
+    def __init__(self, conn: Connection):
+        fd = _os.dup(conn.fileno())
+        conn.close()
+        _os.set_blocking(fd, True)
+        super().__init__(fd)
+
+    def poll(self, timeout: float = 0.0) -> bool:
+        poller = _select.poll()
+        poller.register(self.fileno(), _select.POLLIN)
+        return bool(poller.poll(timeout * 1000))
+
+
+class _WorkerProcess:
+    """
+    1つの認識用ワーカープロセスと、親プロセスとの通信路・共有メモリ。
+    フレーム (と縮小前のフレーム) は共有メモリに書き込み、パイプではその名前と形状、
+    親プロセスのギャラリーの世代だけを送る。
+    """
+
+    def __init__(self, ctx, index: int):
+        self._ctx = ctx
+        self.index = index
+        self._shm: SharedMemory | None = None
+        self._conn = None
+        self._process = None
+        self._ready = False
+        self._spawn()
+
+    def run(
+        self, frame: np.ndarray, source: np.ndarray | None = None, generation: int = 0
+    ):
+        """
+        フレームを共有メモリ経由でワーカーに渡し、(顔の位置, エンコーディング, 人物名) を受け取る。
+        generationが前回と変わっていれば、ワーカーは照合の前にストアを開き直す。
+        """
+        nbytes = frame.nbytes + (source.nbytes if source is not None else 0)
+        if self._shm is None or self._shm.size < nbytes:
+            self._resize(nbytes)
+
+        view = np.ndarray(frame.shape, dtype=frame.dtype, buffer=self._shm.buf)
+        view[...] = frame
+        source_shape = None
+        if source is not None:
+            source_shape = source.shape
+            view = np.ndarray(
+                source.shape,
+                dtype=source.dtype,
+                buffer=self._shm.buf,
+                offset=frame.nbytes,
+            )
+            view[...] = source
+        del view
+        try:
+            if not self._process.is_alive():
+                raise EOFError(f"終了コード {self._process.exitcode}")
+            if not self._ready:
+                self._wait_ready()
+            self._conn.send(
+                (
+                    self._shm.name,
+                    frame.shape,
+                    frame.dtype.str,
+                    source_shape,
+                    generation,
+                )
+            )
+            # 応答しなくなったワーカーも再起動できるよう、待ち時間に上限を設ける
+            if not self._conn.poll(config.RECOGNITION_PROCESS_TIMEOUT):
+                raise TimeoutError(
+                    f"{config.RECOGNITION_PROCESS_TIMEOUT} 秒以内に応答がありません"
+                )
+            status, payload = self._conn.recv()
+        except (EOFError, OSError) as e:
+            logger.error(
+                f"認識ワーカープロセス {self.index} との通信に失敗しました: {e}。再起動します。"
+            )
+            self.close()
+            self._spawn()
+            raise RuntimeError("認識ワーカープロセスとの通信に失敗しました") from e
+
+        if status != "ok":
+            raise RuntimeError(f"認識ワーカープロセスでエラー: {payload}")
+        return payload
+
+    def close(self) -> None:
+        if self._conn is not None:
+            if self._process is not None and self._process.is_alive():
+                try:
+                    self._conn.send(None)
+                except OSError:
+                    pass
+            self._conn.close()
+            self._conn = None
+        if self._process is not None:
+            self._process.join(timeout=5)
+            if self._process.is_alive():
+                self._process.kill()
+                self._process.join(timeout=5)
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+    # --- Internal API ---
+    def _wait_ready(self) -> None:
+        """ワーカープロセスの起動完了の通知を待つ"""
+        if not self._conn.poll(STARTUP_TIMEOUT):
+            raise TimeoutError(f"{STARTUP_TIMEOUT} 秒以内に起動しませんでした")
+        self._conn.recv()
+        self._ready = True
+
+    def _spawn(self) -> None:
+        parent_conn, child_conn = self._ctx.Pipe()
+        self._process = self._ctx.Process(
+            target=_worker_main,
+            args=(child_conn,),
+            name=f"face-recognition-{self.index}",
+            daemon=True,
+        )
+        self._process.start()
+        child_conn.close()
+        self._conn = _BlockingConnection(parent_conn)
+        self._ready = False
+
+    def _resize(self, nbytes: int) -> None:
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+        self._shm = SharedMemory(create=True, size=nbytes)
+
+
+class ProcessRecognitionPool:
+    """
+    顔の検出・エンコード・照合をワーカープロセスのプールで実行するクラス。
+    dlibはGILを一部しか解放しないため、スレッドではなくプロセスで並列化する。
+
+    - 各ワーカーは埋め込みストアからFaceDBを読み取り専用で開いて照合する。親プロセスの
+      ギャラリーの世代をフレームごとに受け取り、変わっていれば (ホットリロード) 開き直す
+    - トラックごとの多数決は、ワーカーの照合結果を使って親プロセスで行う
+    - フレームはpickleせず、ワーカーごとの共有メモリ領域を介して渡す
+    - 異常終了したワーカーや RECOGNITION_PROCESS_TIMEOUT 秒以内に応答しないワーカーは、
+      そのフレームをエラーにして再起動する
+    - run() はブロッキングかつスレッドセーフで、tpoolのスレッドから呼び出す
+    """
+
+    def __init__(self, face_db: FaceDB, processes: int | None = None):
+        self._face_db = face_db
+        self._size = max(
+            1, processes or config.RECOGNITION_PROCESSES or os.cpu_count() or 1
+        )
+        self._workers: list[_WorkerProcess] = []
+        self._idle = _queue.Queue()
+
+    def start(self) -> ProcessRecognitionPool:
+        # eventletでパッチされた親プロセスの状態を引き継がないようspawnで起動する
+        ctx = multiprocessing.get_context("spawn")
+        for index in range(self._size):
+            worker = _WorkerProcess(ctx, index)
+            self._workers.append(worker)
+            self._idle.put(worker)
+        logger.info(f"認識用プロセスプールを起動しました (プロセス数 {self._size})")
+        return self
+
+    def __call__(
+        self, small_frame_rgb: np.ndarray, frame_bgr: np.ndarray | None = None
+    ):
+        return self.run(small_frame_rgb, frame_bgr)
+
+    def run(self, small_frame_rgb: np.ndarray, frame_bgr: np.ndarray | None = None):
+        """
+        空いているワーカーで検出・エンコード・照合を行い、
+        (顔の位置, エンコーディング, 人物名 (またはNone)) を返す。
+        frame_bgr (縮小前のフレーム, uint8) を渡した場合はcascadeの候補の確認に使われる。
+        """
+        worker = self._idle.get()
+        try:
+            return worker.run(
+                np.ascontiguousarray(small_frame_rgb),
+                frame_bgr,
+                self._face_db.generation,
+            )
+        finally:
+            self._idle.put(worker)
+
+    def close(self) -> None:
+        for worker in self._workers:
+            worker.close()
+        self._workers.clear()
+
+
+def _worker_main(conn) -> None:
+    """ワーカープロセスのメインループ"""
+    # 循環importを避けるため、子プロセス側でのみ読み込む
+    from src.recognition.worker import detect_and_recognize
+
+    face_db = FaceDB(autoload=False)
+    # 最後にストアを開いたときの親プロセスのギャラリーの世代
+    opened_generation = None
+    shm: SharedMemory | None = None
+    # 読み込みが済んだことを通知する (以降の応答は RECOGNITION_PROCESS_TIMEOUT で監視される)
+    conn.send(("ready", None))
+
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+
+        name, shape, dtype, source_shape, generation = message
+        try:
+            # 親プロセスのギャラリーが差し替わっていれば、ストアを開き直す
+            # (開けなかった場合は今のギャラリーで照合し、次のフレームで再試行する)
+            if generation != opened_generation and face_db.open_store():
+                opened_generation = generation
+
+            if shm is None or shm.name != name:
+                if shm is not None:
+                    shm.close()
+                # spawnで起動した子プロセスは親とresource_trackerを共有するため、
+                # 共有メモリの登録・削除は親プロセス側だけで管理される
+                shm = SharedMemory(name=name)
+
+            frame = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+            source = None
+            if source_shape is not None:
+                source = np.ndarray(
+                    source_shape, dtype=np.uint8, buffer=shm.buf, offset=frame.nbytes
+                )
+            try:
+                locations, encodings, names = detect_and_recognize(
+                    frame, face_db, source
+                )
+            finally:
+                # 共有メモリを閉じられるよう、バッファへの参照を残さない
+                del frame, source
+            conn.send(("ok", ([tuple(loc) for loc in locations], encodings, names)))
+        except Exception as e:
+            conn.send(("error", repr(e)))
+
+    if shm is not None:
+        shm.close()
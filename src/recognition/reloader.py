@@ -0,0 +1,118 @@
+# src/recognition/reloader.py
+
+import logging
+import time
+
+from eventlet import tpool
+from flask_socketio import SocketIO
+
+from src.recognition.face_db import FaceDB, build_workers, scan_signature
+
+logger = logging.getLogger(__name__)
+
+
+class FaceDBReloader:
+    """
+    FaceDBの再構築をバックグラウンドで実行するクラス。
+    重い再構築はtpoolで行い、完了時にFaceDB側でギャラリーがアトミックに差し替わるため、
+    再構築中も顔認識ループはブロックされずに現在のギャラリーで照合を続ける。
+    (tpoolのOSスレッドからはプロセスプールを起動できないため、エンコードは直列になる)
+    状態の更新はすべてeventletのグリーンスレッド上で行われるため、ロックは不要。
+    """
+
+    def __init__(self, sio: SocketIO, face_db: FaceDB):
+        self._sio = sio
+        self._face_db = face_db
+        self._running = False
+        # 実行中に要求が来た場合は、完了後にもう一度だけ再構築する
+        self._rerun = False
+        self._rerun_full = False
+        self.last_started_at: float | None = None
+        self.last_finished_at: float | None = None
+        self.last_error: str | None = None
+
+    # --- Public API ---
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    def request(self, full: bool = False) -> bool:
+        """
+        再構築を要求する (非同期)。既に実行中の場合は完了後に再実行を予約し、Falseを返す。
+        """
+        if self._running:
+            self._rerun = True
+            self._rerun_full = self._rerun_full or full
+            return False
+        self._running = True
+        self._sio.start_background_task(self._run, full)
+        return True
+
+    def run(self, full: bool = False) -> None:
+        """
+        再構築を実行し、完了まで待つ (呼び出し元のグリーンスレッドをブロックする)。
+        起動時の初回構築に使う。エンコードを並列に行える場合は、preload_app と同じく
+        呼び出し元のグリーンスレッドで構築する (tpoolからはプロセスプールを起動できないため)。
+        エンコードの完了を待つ間は他のグリーンスレッド (/ready など) が動く。
+        """
+        while self._running:
+            self._sio.sleep(0.1)
+        self._running = True
+        self._run(full, offload=build_workers() <= 1)
+
+    def watch(self, interval: float) -> None:
+        """顔データディレクトリを定期的に走査し、変更があれば再構築を要求する"""
+        logger.info(f"顔データディレクトリの監視を開始しました (間隔: {interval} 秒)")
+        signature = tpool.execute(scan_signature)
+        while True:
+            self._sio.sleep(interval)
+            try:
+                current = tpool.execute(scan_signature)
+            except Exception as e:
+                logger.error(f"顔データディレクトリの走査中にエラー: {e}")
+                continue
+            if current != signature:
+                signature = current
+                logger.info("顔データディレクトリの変更を検知しました。再構築します。")
+                self.request()
+
+    def status(self) -> dict:
+        """FaceDBと再構築処理の状態を返す"""
+        return {
+            **self._face_db.status(),
+            "reloading": self._running,
+            "last_started_at": self.last_started_at,
+            "last_finished_at": self.last_finished_at,
+            "last_error": self.last_error,
+        }
+
+    # --- Internal API ---
+    def _run(self, full: bool, offload: bool = True) -> None:
+        try:
+            while True:
+                self.last_started_at = time.time()
+                logger.info(
+                    f"FaceDBの再構築を開始します (全件: {'はい' if full else 'いいえ'})"
+                )
+                try:
+                    if offload:
+                        tpool.execute(self._face_db.reload, full)
+                    else:
+                        self._face_db.reload(full)
+                    self.last_error = None
+                    logger.info(
+                        f"FaceDBの再構築が完了しました (世代 {self._face_db.generation})"
+                    )
+                except Exception as e:
+                    self.last_error = str(e)
+                    logger.error(f"FaceDBの再構築に失敗しました: {e}", exc_info=True)
+                self.last_finished_at = time.time()
+
+                if not self._rerun:
+                    break
+                full = self._rerun_full
+                self._rerun = self._rerun_full = False
+                # 実行中に届いた要求による再構築はtpoolで行う
+                offload = True
+        finally:
+            self._running = False
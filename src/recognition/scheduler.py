@@ -0,0 +1,156 @@
+# src/recognition/scheduler.py
+
+from __future__ import annotations
+
+import logging
+import os
+import time
+
+import cv2
+import numpy as np
+
+from src.config import config
+
+logger = logging.getLogger(__name__)
+
+# 動き検出に使う縮小画像の幅 (高さはアスペクト比から決める)
+MOTION_GATE_WIDTH = 64
+
+# 処理間隔の上限（秒）と、遅延目標を満たしているときに間隔を縮める割合
+MAX_INTERVAL = 2.0
+INTERVAL_DECAY = 0.9
+# 遅延目標を超えたときに間隔を広げる倍率
+INTERVAL_BACKOFF = 1.5
+# 処理時間・遅延の指数移動平均の重み
+EWMA_ALPHA = 0.2
+
+
+class MotionGate:
+    """
+    縮小グレースケール画像の差分で、前回認識に回したフレームから変化があったかを判定するクラス。
+    静止した場面 (誰もいない廊下など) のフレームを顔認識に回さないために使う。
+    1台のカメラにつき1インスタンスを使う。
+    """
+
+    def __init__(
+        self,
+        pixel_threshold: int | None = None,
+        area_threshold: float | None = None,
+        max_idle: float | None = None,
+    ):
+        self.pixel_threshold = (
+            config.MOTION_GATE_PIXEL_THRESHOLD
+            if pixel_threshold is None
+            else pixel_threshold
+        )
+        self.area_threshold = (
+            config.MOTION_GATE_AREA if area_threshold is None else area_threshold
+        )
+        self.max_idle = config.MOTION_GATE_MAX_IDLE if max_idle is None else max_idle
+        # 比較対象 (最後に通過させたフレーム) と、作業用バッファ
+        self._reference: np.ndarray | None = None
+        self._small: np.ndarray | None = None
+        self._gray: np.ndarray | None = None
+        self._last_pass = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.area_threshold > 0
+
+    def check(self, frame_bgr: np.ndarray, now: float | None = None) -> bool:
+        """フレームを認識に回すべき (動きがある、または一定時間経過した) 場合にTrueを返す"""
+        if not self.enabled:
+            return True
+        now = time.monotonic() if now is None else now
+
+        height, width = frame_bgr.shape[:2]
+        size = (MOTION_GATE_WIDTH, max(1, round(MOTION_GATE_WIDTH * height / width)))
+        if self._small is None or self._small.shape[1::-1] != size:
+            self._small = np.empty((size[1], size[0], 3), dtype=np.uint8)
+            self._gray = np.empty((size[1], size[0]), dtype=np.uint8)
+            self._reference = None
+        cv2.resize(frame_bgr, size, dst=self._small, interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(self._small, cv2.COLOR_BGR2GRAY, dst=self._gray)
+
+        if self._reference is not None:
+            changed = np.count_nonzero(
+                cv2.absdiff(self._gray, self._reference) > self.pixel_threshold
+            )
+            moving = changed >= self.area_threshold * self._gray.size
+            idle_expired = self.max_idle > 0 and now - self._last_pass >= self.max_idle
+            if not moving and not idle_expired:
+                return False
+
+        # 通過したフレームを次の比較対象にする (少しずつの変化も累積して検知できる)
+        if self._reference is None:
+            self._reference = np.empty_like(self._gray)
+        self._reference, self._gray = self._gray, self._reference
+        self._last_pass = now
+        return True
+
+
+class AdaptiveRateController:
+    """
+    計測した認識処理時間と遅延から、カメラごとの認識の最小間隔を決めるクラス。
+
+    - CPU予算: 処理時間の移動平均から、全カメラ合計の認識がCPUコアの
+      RECOGNITION_CPU_BUDGET 割を超えないような間隔を下限とする
+    - 遅延目標: フレームのキャプチャから結果送信までの遅延が
+      RECOGNITION_TARGET_LATENCY を超えるか、実行待ちが溜まったら間隔を広げ、
+      目標内に収まっていれば下限に向けて少しずつ縮める (AIMD)
+    状態の更新はeventletのグリーンスレッド上でのみ行うため、ロックは不要。
+    """
+
+    def __init__(
+        self,
+        target_latency: float | None = None,
+        cpu_budget: float | None = None,
+        cores: int | None = None,
+    ):
+        self.target_latency = (
+            config.RECOGNITION_TARGET_LATENCY
+            if target_latency is None
+            else target_latency
+        )
+        self.cpu_budget = (
+            config.RECOGNITION_CPU_BUDGET if cpu_budget is None else cpu_budget
+        )
+        self.cores = cores or os.cpu_count() or 1
+        self.service_time = 0.0
+        self.latency = 0.0
+        self._interval = 0.0
+
+    def interval(self, active_cameras: int = 1) -> float:
+        """1台のカメラが次のフレームを認識に回すまでの最小間隔（秒）"""
+        return max(self._interval, self._budget_interval(active_cameras))
+
+    def observe(self, service_time: float, latency: float, backlog: int = 0) -> None:
+        """
+        1フレーム分の計測値を反映する。
+        service_time: 認識処理にかかった時間, latency: キャプチャから送信までの時間,
+        backlog: 同時実行数を超えて実行待ちになっている認識の周回数
+        """
+        if self.service_time == 0.0:
+            self.service_time, self.latency = service_time, latency
+        else:
+            self.service_time += EWMA_ALPHA * (service_time - self.service_time)
+            self.latency += EWMA_ALPHA * (latency - self.latency)
+
+        overloaded = backlog > 0 or (
+            self.target_latency > 0 and self.latency > self.target_latency
+        )
+        if overloaded:
+            self._interval = min(
+                MAX_INTERVAL,
+                max(self._interval, self.service_time) * INTERVAL_BACKOFF,
+            )
+        else:
+            self._interval *= INTERVAL_DECAY
+
+    # --- Internal API ---
+    def _budget_interval(self, active_cameras: int) -> float:
+        if self.cpu_budget <= 0:
+            return 0.0
+        return (
+            max(1, active_cameras) * self.service_time / (self.cpu_budget * self.cores)
+        )
@@ -0,0 +1,208 @@
+# src/recognition/store.py
+
+from __future__ import annotations
+
+import fcntl
+import json
+import logging
+import os
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# ストアの形式識別子とバージョン (互換性のない変更を行う場合はバージョンを上げる)
+STORE_FORMAT = "face-auth-embeddings"
+STORE_VERSION = 1
+
+# 格納するエンコーディングを生成したモデル
+MODEL_NAME = "dlib_face_recognition_resnet_model_v1"
+
+
+class EmbeddingStore:
+    """
+    顔エンコーディングのディスク上のストア。
+
+    - ``<name>.<build_id>.f32``: float32の行列 (行優先, 人物ごとに連続した行ブロック)
+    - ``<name>.json``: ヘッダ (形式・バージョン・モデル名・次元数) と
+      人物ごとのオフセット、画像ごとの行番号を持つインデックス
+
+    行列はnp.memmapで読み取り専用に開くため、複数のワーカープロセスが
+    OSのページキャッシュを共有できる。書き込みは一時ファイルに書いてからrenameする。
+    ヘッダの置き換えがコミットポイントとなり、途中で中断しても古いストアが残る。
+    複数のプロセスが同時に書き込んでも参照中の行列を消さないよう、書き込み・削除は
+    ロックファイルの排他ロック、読み込み (ヘッダからmemmapまで) は共有ロックで保護する。
+    """
+
+    def __init__(self, directory: Path, name: str = "_embeddings", dim: int = 128):
+        self.directory = Path(directory)
+        self.name = name
+        self.dim = dim
+        self.header_path = self.directory / f"{name}.json"
+        self.lock_path = self.directory / f".{name}.lock"
+
+    # --- Public API ---
+    def exists(self) -> bool:
+        return self.header_path.exists()
+
+    def open(self) -> tuple[dict, np.ndarray] | None:
+        """
+        ストアを開き、(ヘッダ, 読み取り専用の行列) を返す。
+        存在しない・壊れている・互換性がない場合はNoneを返す。
+        """
+        if not self.header_path.exists():
+            return None
+        with self._lock(fcntl.LOCK_SH):
+            return self._open()
+
+    def write(
+        self,
+        matrix: np.ndarray,
+        people: list[dict],
+        images: dict,
+        gallery_count: int | None = None,
+        enrollment: dict | None = None,
+    ) -> None:
+        """
+        行列とインデックスをアトミックに書き込む。
+        people: [{"name", "offset", "count"}], images: {キー: {"person", "mtime_ns", "size", "row", ...}}
+        gallery_count: 照合に使う先頭の行数 (省略時は全行)。残りの行は画像ごとのエンコーディング
+        enrollment: 代表ベクトルへの絞り込みの設定と内訳
+        """
+        matrix = np.ascontiguousarray(matrix, dtype=np.float32).reshape(-1, self.dim)
+        # 他のプロセスの書き込みの後始末 (3.) で、コミット前の行列を消されないよう、
+        # 行列の書き込みから古い行列の削除までを排他ロックで保護する
+        with self._lock(fcntl.LOCK_EX):
+            self._write(matrix, people, images, gallery_count, enrollment)
+
+    def remove(self) -> None:
+        """ストアを削除する"""
+        with self._lock(fcntl.LOCK_EX):
+            if self.header_path.exists():
+                self.header_path.unlink()
+            self._remove_matrices()
+
+    # --- Internal API ---
+    def _write(
+        self,
+        matrix: np.ndarray,
+        people: list[dict],
+        images: dict,
+        gallery_count: int | None,
+        enrollment: dict | None,
+    ) -> None:
+        matrix_name = f"{self.name}.{uuid.uuid4().hex}.f32"
+
+        # 1. 行列を一時ファイルに書き、fsyncしてから最終名にrenameする
+        self._atomic_write(self.directory / matrix_name, matrix.tobytes())
+
+        # 2. ヘッダを置き換える (ここがコミットポイント)
+        header = {
+            "format": STORE_FORMAT,
+            "version": STORE_VERSION,
+            "model": MODEL_NAME,
+            "dim": self.dim,
+            "dtype": "float32",
+            "count": len(matrix),
+            "gallery_count": len(matrix) if gallery_count is None else gallery_count,
+            "matrix": matrix_name,
+            "created_at": time.time(),
+            "people": people,
+            "images": images,
+            "enrollment": enrollment,
+        }
+        self._atomic_write(
+            self.header_path,
+            json.dumps(header, ensure_ascii=False).encode("utf-8"),
+        )
+
+        # 3. 参照されなくなった古い行列ファイルを削除する
+        #    (既にmemmapしているプロセスはunlink後もマッピングを使い続けられる)
+        self._remove_matrices(keep=matrix_name)
+
+    @contextmanager
+    def _lock(self, operation: int):
+        """ストアのロックファイルをflockでロックする (operation: fcntl.LOCK_SH / LOCK_EX)"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with open(self.lock_path, "a") as f:
+            fcntl.flock(f.fileno(), operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def _open(self) -> tuple[dict, np.ndarray] | None:
+        # ロックを待つ間に削除された場合
+        if not self.header_path.exists():
+            return None
+        try:
+            header = json.loads(self.header_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError) as e:
+            logger.error(f"埋め込みストアのヘッダを読み込めません: {e}")
+            return None
+
+        if header.get("format") != STORE_FORMAT:
+            logger.warning("埋め込みストアの形式が不明です。再構築します。")
+            return None
+        if header.get("version") != STORE_VERSION:
+            logger.warning(
+                f"埋め込みストアのバージョンが異なります "
+                f"(ファイル: {header.get('version')}, 期待値: {STORE_VERSION})。再構築します。"
+            )
+            return None
+        if header.get("model") != MODEL_NAME or header.get("dim") != self.dim:
+            logger.warning(
+                f"埋め込みストアのモデルが異なります "
+                f"({header.get('model')}, dim={header.get('dim')})。再構築します。"
+            )
+            return None
+
+        count = int(header["count"])
+        if count == 0:
+            return header, np.empty((0, self.dim), dtype=np.float32)
+
+        matrix_path = self.directory / header["matrix"]
+        expected = count * self.dim * np.dtype(np.float32).itemsize
+        try:
+            actual = matrix_path.stat().st_size
+        except OSError as e:
+            logger.error(f"埋め込み行列ファイルが見つかりません: {e}")
+            return None
+        if actual != expected:
+            logger.error(
+                f"埋め込み行列ファイルのサイズが不正です "
+                f"({actual} バイト, 期待値: {expected} バイト)。再構築します。"
+            )
+            return None
+
+        matrix = np.memmap(
+            matrix_path, dtype=np.float32, mode="r", shape=(count, self.dim)
+        )
+        return header, matrix
+
+    def _atomic_write(self, path: Path, data: bytes) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=f".{path.name}.")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def _remove_matrices(self, keep: str | None = None) -> None:
+        for path in self.directory.glob(f"{self.name}.*.f32"):
+            if path.name == keep:
+                continue
+            try:
+                path.unlink()
+            except OSError as e:
+                logger.warning(f"古い埋め込み行列ファイルを削除できません: {e}")
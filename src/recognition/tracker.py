@@ -0,0 +1,288 @@
+# src/recognition/tracker.py
+
+from __future__ import annotations
+
+import logging
+from collections import Counter, deque
+from itertools import count
+from typing import TYPE_CHECKING
+
+import cv2
+import numpy as np
+
+from src.config import config
+
+if TYPE_CHECKING:
+    from src.recognition.face_db import FaceDB
+
+logger = logging.getLogger(__name__)
+
+# 顔の位置は face_recognition と同じ (top, right, bottom, left) 形式で扱う
+Box = tuple[int, int, int, int]
+
+
+def box_iou(a: Box, b: Box) -> float:
+    """2つの (top, right, bottom, left) ボックスのIoUを返す"""
+    top, bottom = max(a[0], b[0]), min(a[2], b[2])
+    left, right = max(a[3], b[3]), min(a[1], b[1])
+    inter = max(0, bottom - top) * max(0, right - left)
+    if inter == 0:
+        return 0.0
+    area_a = (a[2] - a[0]) * (a[1] - a[3])
+    area_b = (b[2] - b[0]) * (b[1] - b[3])
+    return inter / float(area_a + area_b - inter)
+
+
+class Track:
+    """
+    1人分の追跡状態。人物名は直近の照合結果 (votes) の多数決で決め、
+    キーフレーム以外では人物名を保持したまま位置だけを更新する。
+    """
+
+    __slots__ = (
+        "track_id",
+        "box",
+        "name",
+        "template",
+        "misses",
+        "votes",
+        "encoding",
+        "label",
+        "generation",
+    )
+
+    def __init__(
+        self, track_id: int, box: Box, template: np.ndarray, vote_window: int = 1
+    ):
+        self.track_id = track_id
+        self.box = box
+        self.name = "Unknown"
+        self.template = template
+        self.misses = 0
+        self.votes: deque[str] = deque(maxlen=max(1, vote_window))
+        # 最後に照合したエンコーディング・その照合結果・その時のギャラリーの世代番号
+        self.encoding: np.ndarray | None = None
+        self.label = "Unknown"
+        self.generation = 0
+
+    def vote(self, name: str) -> None:
+        """照合結果を投票に加え、現在の人物名より票の多い人物名があれば切り替える"""
+        self.votes.append(name)
+        counts = Counter(self.votes)
+        best, votes = counts.most_common(1)[0]
+        if votes > counts[self.name]:
+            self.name = best
+
+
+class FaceTracker:
+    """
+    検出→追跡パイプラインの追跡段。
+    キーフレームでは顔検出の結果をIoUで既存トラックに対応付けてから (update)、
+    トラックごとにエンコーディングを照合して人物名を決め (identify)、
+    それ以外のフレームではテンプレートマッチングでボックスを伝播させる。
+    トラックを見失った場合は次のフレームを強制的にキーフレームにする。
+    1台のカメラにつき1インスタンスを使い、同時に複数スレッドから呼び出さないこと。
+    """
+
+    def __init__(
+        self,
+        keyframe_interval: int | None = None,
+        iou_threshold: float | None = None,
+        min_score: float | None = None,
+        max_misses: int | None = None,
+        search_margin: float | None = None,
+        vote_window: int | None = None,
+        dedup_distance: float | None = None,
+    ):
+        self.keyframe_interval = max(
+            1, keyframe_interval or config.TRACK_KEYFRAME_INTERVAL
+        )
+        self.iou_threshold = (
+            config.TRACK_IOU_THRESHOLD if iou_threshold is None else iou_threshold
+        )
+        self.min_score = config.TRACK_MIN_SCORE if min_score is None else min_score
+        self.max_misses = config.TRACK_MAX_MISSES if max_misses is None else max_misses
+        self.search_margin = (
+            config.TRACK_SEARCH_MARGIN if search_margin is None else search_margin
+        )
+        self.vote_window = max(1, vote_window or config.TRACK_VOTE_WINDOW)
+        self.dedup_distance = (
+            config.TRACK_DEDUP_DISTANCE if dedup_distance is None else dedup_distance
+        )
+
+        self.tracks: list[Track] = []
+        self._ids = count(1)
+        self._since_keyframe = 0
+        self._lost = False
+        # 統計 (検出スキップ率の算出用)
+        self.frames = 0
+        self.keyframes = 0
+        # 統計 (照合を省略できた顔の割合の算出用)
+        self.faces = 0
+        self.deduplicated = 0
+
+    # --- Public API ---
+    @property
+    def skip_ratio(self) -> float:
+        """顔検出を省略できたフレームの割合"""
+        return 1.0 - self.keyframes / self.frames if self.frames else 0.0
+
+    @property
+    def dedup_ratio(self) -> float:
+        """キーフレームの顔のうち、前回とほぼ同じエンコーディングのため照合を省略できた割合"""
+        return self.deduplicated / self.faces if self.faces else 0.0
+
+    def needs_keyframe(self) -> bool:
+        """次のフレームで顔検出を行うべきかを返す"""
+        return (
+            not self.tracks
+            or self._lost
+            or self._since_keyframe >= self.keyframe_interval - 1
+        )
+
+    def track(self, gray: np.ndarray) -> bool:
+        """
+        非キーフレームで既存トラックの位置を更新する。
+        トラックを見失った (キーフレームが必要になった) 場合はFalseを返す。
+        """
+        alive = []
+        for track in self.tracks:
+            box, score = self._match_template(gray, track)
+            if score >= self.min_score:
+                track.box = box
+                track.misses = 0
+                alive.append(track)
+                continue
+            track.misses += 1
+            if track.misses <= self.max_misses:
+                alive.append(track)  # 一時的な見失いは位置を据え置いて許容する
+            else:
+                self._lost = True
+
+        self.tracks = alive
+        if self._lost:
+            return False
+        self.frames += 1
+        self._since_keyframe += 1
+        return True
+
+    def update(self, gray: np.ndarray, boxes: list[Box]) -> list[Track]:
+        """
+        キーフレームの検出結果でトラックを更新し (IoUによる貪欲な対応付け)、
+        検出ごとに対応するトラックを検出と同じ順序で返す。
+        """
+        pairs = sorted(
+            (
+                (box_iou(track.box, box), t, d)
+                for t, track in enumerate(self.tracks)
+                for d, box in enumerate(boxes)
+            ),
+            reverse=True,
+        )
+        matched_tracks, matched_dets, tracks = set(), set(), []
+        detected: list[Track | None] = [None] * len(boxes)
+        for iou, t, d in pairs:
+            if iou < self.iou_threshold:
+                break
+            if t in matched_tracks or d in matched_dets:
+                continue
+            matched_tracks.add(t)
+            matched_dets.add(d)
+            track = self.tracks[t]
+            track.box, track.misses = boxes[d], 0
+            track.template = self._crop(gray, boxes[d])
+            tracks.append(track)
+            detected[d] = track
+
+        # 対応の取れなかった検出は新しいトラックになり、
+        # 対応の取れなかった既存トラックはキーフレームで見つからなかったので破棄する
+        for d, box in enumerate(boxes):
+            if d not in matched_dets:
+                track = Track(
+                    next(self._ids), box, self._crop(gray, box), self.vote_window
+                )
+                tracks.append(track)
+                detected[d] = track
+
+        self.tracks = tracks
+        self._lost = False
+        self._since_keyframe = 0
+        self.frames += 1
+        self.keyframes += 1
+        return detected
+
+    def identify(
+        self,
+        tracks: list[Track],
+        encodings: list[np.ndarray],
+        face_db: FaceDB,
+        names: list[str | None] | None = None,
+    ) -> None:
+        """
+        キーフレームのエンコーディングで各トラックの人物名を更新する。
+        前回照合したエンコーディングとの距離が TRACK_DEDUP_DISTANCE 未満の顔は照合を省略して
+        前回の照合結果を再利用し、残りはまとめて照合する。いずれも結果を投票に加え、
+        直近 TRACK_VOTE_WINDOW 回の多数決で人物名を決める。
+        (省略した顔も投票に加えないと、照合した顔 = 前回と大きく異なる崩れた顔に票が偏る)
+        namesを渡した場合 (認識の実行方式が複数フレームをまとめて照合済みの場合) は照合せず、
+        省略しなかった顔にその結果を使う。
+        """
+        generation = face_db.generation
+        pending = []
+        for index, (track, encoding) in enumerate(zip(tracks, encodings)):
+            if track.generation != generation:
+                # ギャラリーが差し替わった場合は、古いギャラリーでの照合結果を使わない
+                track.votes.clear()
+                track.encoding = None
+                track.generation = generation
+            if (
+                track.encoding is not None
+                and np.linalg.norm(encoding - track.encoding) < self.dedup_distance
+            ):
+                self.deduplicated += 1
+                track.vote(track.label)
+                continue
+            pending.append(index)
+        self.faces += len(tracks)
+        if not pending:
+            return
+
+        if names is None:
+            matched = face_db.identify([encodings[index] for index in pending])
+        else:
+            matched = [names[index] for index in pending]
+        for index, name in zip(pending, matched):
+            track = tracks[index]
+            track.encoding, track.label = encodings[index], name or "Unknown"
+            track.vote(track.label)
+
+    # --- Internal API ---
+    @staticmethod
+    def _crop(gray: np.ndarray, box: Box) -> np.ndarray:
+        top, right, bottom, left = box
+        return gray[max(top, 0) : bottom, max(left, 0) : right].copy()
+
+    def _match_template(self, gray: np.ndarray, track: Track) -> tuple[Box, float]:
+        """トラック周辺の探索窓でテンプレートマッチングを行い、(新しいボックス, スコア) を返す"""
+        top, right, bottom, left = track.box
+        th, tw = track.template.shape[:2]
+        if th < 4 or tw < 4:
+            return track.box, -1.0
+
+        my = int(th * self.search_margin)
+        mx = int(tw * self.search_margin)
+        y0, y1 = max(top - my, 0), min(bottom + my, gray.shape[0])
+        x0, x1 = max(left - mx, 0), min(right + mx, gray.shape[1])
+        window = gray[y0:y1, x0:x1]
+        if window.shape[0] < th or window.shape[1] < tw:
+            return track.box, -1.0
+
+        scores = cv2.matchTemplate(window, track.template, cv2.TM_CCOEFF_NORMED)
+        _, score, _, (dx, dy) = cv2.minMaxLoc(scores)
+        new_top, new_left = y0 + dy, x0 + dx
+        return (
+            new_top,
+            new_left + (right - left),
+            new_top + (bottom - top),
+            new_left,
+        ), score
@@ -1,103 +1,195 @@
 # src/recognition/worker.py
 
 import logging
+from collections.abc import Callable
 
 import cv2
 import face_recognition
-from eventlet import tpool
 from flask_socketio import SocketIO
 
 from src.config import config
+from src.events.log import EventLog
+from src.metrics import STAGE_SECONDS
+from src.recognition.batcher import EncodingBatcher
+from src.recognition.detector import detect_faces, encoding_inputs
+from src.recognition.dispatcher import RecognitionDispatcher
 from src.recognition.face_db import FaceDB
+from src.recognition.preprocess import Preprocessor
+from src.recognition.process_pool import ProcessRecognitionPool
+from src.recognition.reloader import FaceDBReloader
+from src.recognition.tracker import FaceTracker
+from src.streaming.broadcaster import FacesBroadcaster
 from src.streaming.receiver import StreamReceiver
 
 logger = logging.getLogger(__name__)
 
 
-def process_frame_for_faces(frame_bgr: cv2.Mat, face_db: FaceDB):
+def detect_and_encode(small_frame_rgb, frame_bgr=None):
+    """
+    縮小フレームから顔を検出・エンコードする。
+    frame_bgr (縮小前のフレーム) はcascadeの候補の確認と、小さな顔のエンコードに使う。
+    戻り値は (縮小フレーム上の顔の位置のリスト, エンコーディングのリスト)。
+    照合はトラックとの対応付けの後に行う (同じ顔の照合を省略できるようにするため)。
+    """
+    with STAGE_SECONDS.time("detect"):
+        face_locations = detect_faces(small_frame_rgb, frame_bgr=frame_bgr)
+    if not face_locations:
+        return [], []
+
+    with STAGE_SECONDS.time("encode"):
+        face_encodings = [
+            encoding
+            for image, locations in encoding_inputs(
+                small_frame_rgb, face_locations, frame_bgr
+            )
+            for encoding in face_recognition.face_encodings(image, locations)
+        ]
+    return face_locations, face_encodings
+
+
+def detect_and_recognize(small_frame_rgb, face_db: FaceDB, frame_bgr=None):
+    """
+    縮小フレームから顔を検出・エンコードし、ギャラリーと照合する (プロセスプールのワーカー用)。
+    戻り値は (顔の位置のリスト, エンコーディングのリスト, 人物名 (またはNone) のリスト)。
+    """
+    face_locations, face_encodings = detect_and_encode(small_frame_rgb, frame_bgr)
+    if not face_locations:
+        return [], [], []
+    # 検出された顔をギャラリー全体と一括で照合する
+    with STAGE_SECONDS.time("match"):
+        names = face_db.identify(face_encodings)
+    return face_locations, face_encodings, names
+
+
+def process_frame_for_faces(
+    frame_bgr: cv2.Mat,
+    face_db: FaceDB,
+    tracker: FaceTracker | None = None,
+    recognize: Callable | None = None,
+    preprocessor: Preprocessor | None = None,
+    frame_scale: float = 1.0,
+):
     """
     1フレーム分の画像処理と顔認識を行う、CPU負荷の高い関数。
     この関数全体がtpoolで実行されることで、メインループのブロッキングを防ぐ。
+    trackerを渡した場合、キーフレーム以外は顔検出を省略してトラックの位置だけを更新し、
+    キーフレームではトラックごとの照合結果の多数決で人物名を決める。
+    recognizeを渡した場合、検出・エンコード・照合をその関数 (例: プロセスプール) に委譲し、
+    トラックの多数決にはその照合結果を使う。
+    preprocessorを渡した場合、その出力バッファを使い回す (カメラごとに1つ渡すこと)。
+    frame_scaleは入力フレームの元の解像度に対する比率 (縮小デコード済みの場合は1未満)。
     """
     if frame_bgr is None:
         return None
 
-    # 1. 画像の前処理
-    small_frame_rgb = cv2.cvtColor(
-        cv2.resize(frame_bgr, (0, 0), fx=0.25, fy=0.25), cv2.COLOR_BGR2RGB
-    )
-
-    # 2. 顔の位置特定とエンコード
-    face_locations = face_recognition.face_locations(
-        small_frame_rgb, model=config.RECOGNITION_MODEL
-    )
-    if not face_locations:
-        return []  # 顔がなければ空のリストを返す
-
-    face_encodings = face_recognition.face_encodings(small_frame_rgb, face_locations)
-
-    # 3. 検出された顔のマッチング
-    faces_data = []
-    for (top, right, bottom, left), face_encoding in zip(
-        face_locations, face_encodings
-    ):
-        name = face_db.match(face_encoding) or "Unknown"
-        faces_data.append(
-            {
-                "id": name,
-                "x": int(left * 4),
-                "y": int(top * 4),
-                "w": int((right - left) * 4),
-                "h": int((bottom - top) * 4),
-            }
+    # 1. 画像の前処理 (検出スケールへの縮小と色変換)
+    if preprocessor is None:
+        preprocessor = Preprocessor()
+    with STAGE_SECONDS.time("preprocess"):
+        small_frame_rgb, small_gray, scale = preprocessor.prepare(
+            frame_bgr, frame_scale, gray=tracker is not None
         )
 
-    return faces_data
-
-
-def face_recognition_worker(sio: SocketIO, stream_receiver: StreamReceiver):
+    # 2. 非キーフレームでは追跡のみを行う (見失った場合は検出にフォールバック)
+    if tracker is not None and not tracker.needs_keyframe():
+        with STAGE_SECONDS.time("track"):
+            tracked = tracker.track(small_gray)
+        if tracked:
+            return [
+                _to_face_data(track.box, track.name, scale, track.track_id)
+                for track in tracker.tracks
+            ]
+
+    # 3. 顔の位置特定・エンコード
+    # (cascadeは候補の領域を縮小前のフレームで確認するため、元のフレームも渡す。
+    #  委譲先がプロセスプールの場合、内訳は計測できないので全体を "recognize" として記録する)
+    source_bgr = frame_bgr if config.RECOGNITION_MODEL == "cascade" else None
+    names = None
+    if recognize is not None:
+        with STAGE_SECONDS.time("recognize"):
+            face_locations, face_encodings, names = recognize(
+                small_frame_rgb, source_bgr
+            )
+    else:
+        face_locations, face_encodings = detect_and_encode(small_frame_rgb, source_bgr)
+
+    # 4. ギャラリーとの照合 (委譲先で照合済みでなければここで行う。
+    #    追跡する場合はトラックに対応付けてから、トラックごとの多数決で人物名を決める)
+    if tracker is not None:
+        with STAGE_SECONDS.time("track"):
+            tracks = tracker.update(small_gray, face_locations)
+        with STAGE_SECONDS.time("match"):
+            tracker.identify(tracks, face_encodings, face_db, names)
+        return [
+            _to_face_data(track.box, track.name, scale, track.track_id)
+            for track in tracker.tracks
+        ]
+
+    if names is None:
+        with STAGE_SECONDS.time("match"):
+            names = face_db.identify(face_encodings)
+    return [
+        _to_face_data(box, name or "Unknown", scale)
+        for box, name in zip(face_locations, names)
+    ]
+
+
+def _to_face_data(box, name: str, scale: float, track_id: int | None = None) -> dict:
+    """検出スケール上の (top, right, bottom, left) を元解像度のクライアント向けデータに変換する"""
+    top, right, bottom, left = box
+    face = {
+        "id": name,
+        "x": int(round(left / scale)),
+        "y": int(round(top / scale)),
+        "w": int(round((right - left) / scale)),
+        "h": int(round((bottom - top) / scale)),
+    }
+    if track_id is not None:
+        face["track"] = track_id
+    return face
+
+
+def face_recognition_worker(
+    sio: SocketIO,
+    receivers: dict[str, StreamReceiver],
+    face_db: FaceDB,
+    reloader: FaceDBReloader,
+    broadcaster: FacesBroadcaster | None = None,
+    events: EventLog | None = None,
+):
     """
-    顔認識ワーカー。フレームを取得し、重い処理をtpoolにオフロードする。
+    顔認識ワーカー。FaceDBを準備し、全カメラのフレームを共有の認識実行枠に割り当てる。
+    重い処理はディスパッチャ経由でtpoolにオフロードされる。
     """
     logger.info("顔認識ワーカーを起動しました。")
 
-    # FaceDBの初期化を同期的に行う
-    logger.info("FaceDBの準備を開始します...")
-    face_db = FaceDB()
-    logger.info("FaceDBの準備が完了しました。")
-
-    logger.info("ストリームへの接続を待っています...")
-    while not stream_receiver.connected_event.wait(timeout=5):
-        logger.warning("まだストリームに接続できません...")
-    logger.info("ストリーム接続完了。顔認識ループを開始します。")
-
-    while True:
-        # eventletのグリーンレットに制御を渡し、他のI/O処理を妨げない
-        sio.sleep(config.WORKER_SLEEP_INTERVAL)
-
-        try:
-            # フレーム取得
-            frame = stream_receiver.get_frame()
-            if frame is None:
-                continue
-
-            # CPU負荷の高い処理をtpoolにオフロード
-            faces_data = tpool.execute(process_frame_for_faces, frame, face_db)
-
-            # ★★★ faces_dataがNoneでない限り、常にemitするよう修正 ★★★
-            # faces_dataが空リストの場合、フロント側で枠がクリアされる
-            if faces_data is not None:
-                if faces_data:
-                    recognized_names = [
-                        face["id"] for face in faces_data if face["id"] != "Unknown"
-                    ]
-                    logger.info(
-                        f"検出された顔数: {len(faces_data)} (認識: {', '.join(recognized_names) or 'なし'})"
-                    )
-                else:
-                    logger.debug("顔は検出されませんでした。")
-
-                sio.emit("faces_update", {"faces": faces_data}, namespace="/live")
-
-        except Exception as e:
-            logger.error(f"顔認識処理ループで予期せぬエラー: {e}", exc_info=True)
+    # FaceDBの初回構築を待つ (並列にエンコードできる場合はこのグリーンスレッドで、それ以外はtpoolで構築する)
+    # ウォームアップやpreload_appで構築済みの場合は省略する
+    if face_db.generation == 0:
+        logger.info("FaceDBの準備を開始します...")
+        reloader.run()
+        logger.info("FaceDBの準備が完了しました。")
+
+    # 登録画像の追加・変更を監視し、バックグラウンドで再構築する
+    if config.FACE_DB_WATCH_INTERVAL > 0:
+        sio.start_background_task(reloader.watch, config.FACE_DB_WATCH_INTERVAL)
+
+    # プロセスプールモードでは、検出・エンコード・照合をGILの外のワーカープロセスで行う
+    # スレッドモードでは、同時に処理中の複数フレームの顔をまとめてエンコード・照合できる
+    recognize = None
+    if config.RECOGNITION_EXECUTOR == "process":
+        recognize = ProcessRecognitionPool(face_db).start()
+    elif config.RECOGNITION_BATCH_SIZE > 1:
+        recognize = EncodingBatcher(face_db)
+
+    dispatcher = RecognitionDispatcher(
+        sio,
+        face_db,
+        process_frame_for_faces,
+        recognize=recognize,
+        broadcaster=broadcaster,
+        events=events,
+    )
+    for camera_id, receiver in receivers.items():
+        dispatcher.add_camera(camera_id, receiver)
+    dispatcher.start()
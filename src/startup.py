@@ -0,0 +1,77 @@
+# src/startup.py
+
+from __future__ import annotations
+
+import logging
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from src.config import config
+
+logger = logging.getLogger(__name__)
+
+# 起動処理の段階 (実行順)
+STAGES = ("imports", "models", "face_db", "cameras", "recognition")
+
+
+class StartupProgress:
+    """
+    ワーカーの起動処理 (ウォームアップ) の進捗を記録するクラス。
+    /ready で公開し、すべての段階が完了するまでは準備中として扱う。
+    状態の更新はeventletのグリーンスレッド (またはフォーク前のマスタープロセス) で行う。
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.ready = False
+        self.error: str | None = None
+        self._stages: dict[str, dict] = {name: {"state": "pending"} for name in STAGES}
+
+    @contextmanager
+    def stage(self, name: str):
+        """with文のブロックを起動処理の1段階として実行し、状態と所要時間を記録する"""
+        info = self._stages[name] = {"state": "running"}
+        started = time.perf_counter()
+        logger.info(f"起動処理 '{name}' を開始します...")
+        try:
+            yield
+        except BaseException as e:
+            info["state"] = "failed"
+            info["error"] = str(e)
+            self.error = f"{name}: {e}"
+            raise
+        else:
+            info["state"] = "done"
+        finally:
+            info["seconds"] = round(time.perf_counter() - started, 3)
+        logger.info(f"起動処理 '{name}' が完了しました ({info['seconds']} 秒)")
+
+    def done(self, name: str) -> bool:
+        return self._stages[name]["state"] == "done"
+
+    def status(self) -> dict:
+        return {
+            "ready": self.ready,
+            "uptime": round(time.time() - self.started_at, 3),
+            "error": self.error,
+            "stages": {name: dict(info) for name, info in self._stages.items()},
+        }
+
+
+def load_models(model: str | None = None) -> None:
+    """
+    face_recognition (dlibの検出・ランドマーク・エンコーダのモデル) を読み込み、
+    小さな画像で一度ずつ推論して初回呼び出し時の初期化を済ませる。
+    モデルはimport時にメモリへ読み込まれるため、preload_appのマスタープロセスで呼べば
+    フォーク後の各ワーカーとコピーオンライトで共有される。
+    """
+    import face_recognition
+
+    from src.recognition.detector import detect_faces
+
+    image = np.zeros((64, 64, 3), dtype=np.uint8)
+    # cascadeの場合は候補検出器のモデルもここで読み込む (モデルファイルの問題は起動時に分かる)
+    detect_faces(image, model=model or config.RECOGNITION_MODEL)
+    face_recognition.face_encodings(image, [(8, 56, 56, 8)])
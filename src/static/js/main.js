@@ -1,12 +1,18 @@
 document.addEventListener("DOMContentLoaded", () => {
+  const container = document.getElementById("video-container");
+  const overlay = document.getElementById("overlay");
+  const video = document.getElementById("video-stream");
+  // 表示中のカメラID。サーバー側ではカメラごとのルームで配信される
+  const cameraId = container.dataset.camera;
+  // サーバー側で枠を焼き込んだ映像を表示している場合は、枠を描かない
+  const drawOverlay = container.dataset.overlay !== "false";
+
   // WebSocketを優先的に使用する設定でサーバーに接続
   const socket = io("/live", {
     transports: ["websocket"],
+    query: { camera: cameraId },
   });
 
-  const overlay = document.getElementById("overlay");
-  const video = document.getElementById("video-stream");
-
   socket.on("connect", () => console.log("認証サーバーに接続しました。"));
   socket.on("disconnect", () =>
     console.log("認証サーバーから切断されました。")
@@ -15,36 +21,82 @@ document.addEventListener("DOMContentLoaded", () => {
     console.error("接続エラー:", err);
   });
 
-  socket.on("faces_update", (data) => {
-    console.log("受信データ:", data);
+  // 表示中の顔 (キー: 追跡ID -> [キー, x, y, w, h, 人物名]) と、適用済みの状態のバージョン
+  const faces = new Map();
+  let version = null;
+  // 顔ごとの枠のDOM要素 (キー -> 要素)。差分で変わった枠だけを更新する
+  const boxes = new Map();
+
+  socket.on("faces_update", (payload) => {
+    // msgpack形式の場合はバイナリで届く
+    const data =
+      payload instanceof ArrayBuffer
+        ? MessagePack.decode(new Uint8Array(payload))
+        : payload;
+    if (data.camera && data.camera !== cameraId) {
+      return;
+    }
+
+    if (data.base === null) {
+      // スナップショット: 状態を置き換える
+      faces.clear();
+    } else if (data.base !== version) {
+      // 差分の基準が手元の状態と合わない (取りこぼした) 場合は全件を要求する
+      version = null;
+      socket.emit("resync", { camera: cameraId });
+      return;
+    }
+    data.add.forEach((face) => faces.set(face[0], face));
+    data.update.forEach((face) => faces.set(face[0], face));
+    data.remove.forEach((key) => faces.delete(key));
+    version = data.version;
+
     // requestAnimationFrameを使ってスムーズな描画を行う
-    requestAnimationFrame(() => {
-      overlay.innerHTML = "";
-      if (!video.naturalWidth || video.naturalWidth === 0) {
-        // 映像の元サイズが取得できない場合は描画しない
-        return;
+    requestAnimationFrame(render);
+  });
+
+  function render() {
+    if (!drawOverlay) {
+      return;
+    }
+    if (!video.naturalWidth || video.naturalWidth === 0) {
+      // 映像の元サイズが取得できない場合は描画しない
+      return;
+    }
+    // 映像の表示サイズと元サイズの比率を計算
+    const scaleX = video.clientWidth / video.naturalWidth;
+    const scaleY = video.clientHeight / video.naturalHeight;
+
+    // 消えた顔の枠を削除する
+    boxes.forEach((box, key) => {
+      if (!faces.has(key)) {
+        box.remove();
+        boxes.delete(key);
       }
-      // 映像の表示サイズと元サイズの比率を計算
-      const scaleX = video.clientWidth / video.naturalWidth;
-      const scaleY = video.clientHeight / video.naturalHeight;
+    });
 
-      data.faces.forEach((face) => {
-        const box = document.createElement("div");
+    faces.forEach(([key, x, y, w, h, name]) => {
+      let box = boxes.get(key);
+      if (!box) {
+        box = document.createElement("div");
         box.className = "face-box";
-        box.style.left = `${face.x * scaleX}px`;
-        box.style.top = `${face.y * scaleY}px`;
-        box.style.width = `${face.w * scaleX}px`;
-        box.style.height = `${face.h * scaleY}px`;
-
         const label = document.createElement("div");
         label.className = "face-label";
-        label.textContent = face.id;
-
         box.appendChild(label);
         overlay.appendChild(box);
-      });
+        boxes.set(key, box);
+      }
+      box.style.left = `${x * scaleX}px`;
+      box.style.top = `${y * scaleY}px`;
+      box.style.width = `${w * scaleX}px`;
+      box.style.height = `${h * scaleY}px`;
+      box.firstChild.textContent = name;
     });
-  });
+  }
+
+  // 映像の読み込み完了時や表示サイズの変更時にも枠の位置を合わせ直す
+  video.addEventListener("load", () => requestAnimationFrame(render));
+  window.addEventListener("resize", () => requestAnimationFrame(render));
 
   video.onerror = () => {
     console.error("映像ストリームの読み込みに失敗しました。");
@@ -0,0 +1,195 @@
+# src/streaming/broadcaster.py
+
+from __future__ import annotations
+
+import logging
+import time
+
+from flask_socketio import SocketIO
+
+from src.config import config
+from src.metrics import END_TO_END_SECONDS, STAGE_SECONDS
+
+try:
+    import msgpack
+except ImportError:  # msgpackはオプション (未インストールの場合はJSONで送る)
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+# 顔1件は [キー, x, y, w, h, 人物名] の配列で送る (キーは追跡ID)
+KEY, X, Y, W, H, NAME = range(6)
+
+
+def _face_key(face: dict, index: int) -> int:
+    """差分の対応付けに使うキー。追跡IDがない場合はフレーム内の順番 (負の値) を使う"""
+    track = face.get("track")
+    return track if track is not None else -(index + 1)
+
+
+class _CameraState:
+    """1台のカメラについて、クライアントに送信済みの状態と未送信の最新状態"""
+
+    __slots__ = ("sent", "latest", "version", "dirty", "captured_at")
+
+    def __init__(self):
+        # キー -> [キー, x, y, w, h, 人物名]
+        self.sent: dict[int, list] = {}
+        self.latest: dict[int, list] = {}
+        self.version = 0
+        self.dirty = False
+        # latest の元になったフレームの受信時刻 (time.time基準)
+        self.captured_at: float | None = None
+
+
+class FacesBroadcaster:
+    """
+    faces_update をカメラごとのルームに差分で配信するクラス。
+
+    - 認識結果は publish() で受け取るだけで、送信は BROADCAST_MAX_RATE (回/秒) の
+      送信ループでまとめて行う (その間の結果は最新のものだけが残る)
+    - 送信済みの状態との差分 (追加・BROADCAST_MOVE_THRESHOLD ピクセル以上の移動や
+      人物名の変化・削除) だけを送り、差分がなければ何も送らない
+    - ペイロードはルームごとに1回だけシリアライズされ、全クライアントで共有される
+    - 差分には直前のバージョン (base) を付け、クライアントの状態と合わない場合は
+      クライアントからの resync 要求に対して全件 (スナップショット) を送り直す
+    状態の更新はすべてeventletのグリーンスレッド上で行われるため、ロックは不要。
+    """
+
+    def __init__(
+        self,
+        sio: SocketIO,
+        namespace: str = "/live",
+        max_rate: float | None = None,
+        move_threshold: int | None = None,
+        payload_format: str | None = None,
+    ):
+        self._sio = sio
+        self._namespace = namespace
+        self.max_rate = max_rate or config.BROADCAST_MAX_RATE
+        self.move_threshold = (
+            config.BROADCAST_MOVE_THRESHOLD
+            if move_threshold is None
+            else move_threshold
+        )
+        self.payload_format = payload_format or config.BROADCAST_FORMAT
+        if self.payload_format == "msgpack" and msgpack is None:
+            logger.warning(
+                "msgpackがインストールされていないため、faces_updateをJSONで送信します。"
+            )
+            self.payload_format = "json"
+        self._cameras: dict[str, _CameraState] = {}
+        self._started = False
+        # 統計 (送信回数と、差分がなく省略した回数)
+        self.emitted = 0
+        self.suppressed = 0
+
+    # --- Public API ---
+    def start(self) -> None:
+        if not self._started:
+            self._started = True
+            self._sio.start_background_task(self._flush_loop)
+
+    def publish(
+        self, camera_id: str, faces: list[dict], captured_at: float | None = None
+    ) -> None:
+        """
+        カメラの最新の認識結果を登録する (送信は送信ループで行う)。
+        captured_atを渡すと、受信から送信までの遅延をメトリクスに記録する。
+        """
+        state = self._state(camera_id)
+        state.latest = {
+            _face_key(face, i): [
+                _face_key(face, i),
+                face["x"],
+                face["y"],
+                face["w"],
+                face["h"],
+                face["id"],
+            ]
+            for i, face in enumerate(faces)
+        }
+        state.captured_at = captured_at
+        state.dirty = True
+
+    def latest_faces(self, camera_id: str) -> list[list]:
+        """カメラの最新の認識結果 ([キー, x, y, w, h, 人物名] のリスト) を返す"""
+        state = self._cameras.get(camera_id)
+        return list(state.latest.values()) if state is not None else []
+
+    def send_snapshot(self, camera_id: str, to: str) -> None:
+        """クライアントに送信済みの全件を送り、差分を適用できる状態にする"""
+        state = self._state(camera_id)
+        self._emit(
+            camera_id,
+            state.version,
+            None,
+            list(state.sent.values()),
+            [],
+            [],
+            to=to,
+        )
+
+    # --- Internal API ---
+    def _state(self, camera_id: str) -> _CameraState:
+        state = self._cameras.get(camera_id)
+        if state is None:
+            state = self._cameras[camera_id] = _CameraState()
+        return state
+
+    def _flush_loop(self) -> None:
+        interval = 1.0 / self.max_rate
+        while True:
+            self._sio.sleep(interval)
+            for camera_id, state in self._cameras.items():
+                if state.dirty:
+                    state.dirty = False
+                    self._flush(camera_id, state)
+
+    def _flush(self, camera_id: str, state: _CameraState) -> None:
+        added, updated = [], []
+        for key, face in state.latest.items():
+            previous = state.sent.get(key)
+            if previous is None:
+                added.append(face)
+            elif self._changed(previous, face):
+                updated.append(face)
+        removed = [key for key in state.sent if key not in state.latest]
+
+        if not (added or updated or removed):
+            self.suppressed += 1
+            return
+
+        # 閾値未満の移動は送らず、送信済みの位置を基準に累積で判定する
+        for face in added + updated:
+            state.sent[face[KEY]] = face
+        for key in removed:
+            del state.sent[key]
+        base = state.version
+        state.version += 1
+        self._emit(
+            camera_id, state.version, base, added, updated, removed, to=camera_id
+        )
+        if state.captured_at is not None:
+            END_TO_END_SECONDS.observe(time.time() - state.captured_at, camera_id)
+
+    def _changed(self, previous: list, face: list) -> bool:
+        if previous[NAME] != face[NAME]:
+            return True
+        threshold = self.move_threshold
+        return any(abs(previous[i] - face[i]) > threshold for i in (X, Y, W, H))
+
+    def _emit(self, camera_id, version, base, added, updated, removed, to) -> None:
+        payload = {
+            "camera": camera_id,
+            "version": version,
+            "base": base,
+            "add": added,
+            "update": updated,
+            "remove": removed,
+        }
+        with STAGE_SECONDS.time("emit"):
+            if self.payload_format == "msgpack":
+                payload = msgpack.packb(payload)
+            self._sio.emit("faces_update", payload, namespace=self._namespace, to=to)
+        self.emitted += 1
@@ -0,0 +1,313 @@
+# src/streaming/mjpeg.py
+
+from __future__ import annotations
+
+import logging
+import random
+import re
+import threading
+import time
+from typing import Optional
+
+import cv2
+import numpy as np
+import requests
+from eventlet import tpool
+from requests.adapters import HTTPAdapter
+
+from src.config import config
+from src.metrics import STAGE_SECONDS
+from src.recognition.preprocess import reduced_decode_factor
+from src.streaming.receiver import Frame, StreamReceiver
+
+logger = logging.getLogger(__name__)
+
+# JPEGの開始・終了マーカー (境界が分からないストリームからフレームを切り出すのに使う)
+JPEG_SOI = b"\xff\xd8"
+JPEG_EOI = b"\xff\xd9"
+# 縮小デコード時に使うimreadフラグ
+REDUCED_COLOR_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+# 1回の読み込みの最大バイト数
+MJPEG_CHUNK_SIZE = 64 * 1024
+# 再接続の初回待機時間（秒）。失敗するたびに倍にし、STREAM_RECONNECT_MAX_DELAY で頭打ちにする
+RECONNECT_INITIAL_DELAY = 0.5
+
+_BOUNDARY_PATTERN = re.compile(rb'boundary="?([^";]+)"?', re.IGNORECASE)
+_CONTENT_LENGTH_PATTERN = re.compile(rb"content-length:\s*(\d+)", re.IGNORECASE)
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def shared_session() -> requests.Session:
+    """全カメラで共有するHTTPセッション (接続プール) を返す"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=32, pool_maxsize=4)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+
+class MultipartJpegParser:
+    """
+    multipart/x-mixed-replace 形式のMJPEGストリームから、JPEGのバイト列を切り出すクラス。
+    パートのContent-Lengthがあればそれを使い、なければ次の境界までを1フレームとする。
+    境界が分からない場合は、JPEGの開始・終了マーカーで切り出す。
+    """
+
+    def __init__(self, boundary: Optional[bytes] = None):
+        self._buffer = bytearray()
+        self._delimiter = b"--" + boundary.lstrip(b"-") if boundary else None
+
+    @staticmethod
+    def boundary_from_content_type(content_type: str) -> Optional[bytes]:
+        match = _BOUNDARY_PATTERN.search(content_type.encode("latin-1"))
+        return match.group(1).strip() if match else None
+
+    def feed(self, chunk: bytes) -> list[bytes]:
+        """受信したデータを追加し、完結したJPEGのリストを返す"""
+        self._buffer += chunk
+        frames = []
+        while True:
+            jpeg = self._next_part() if self._delimiter else self._next_markers()
+            if jpeg is None:
+                return frames
+            if jpeg:
+                frames.append(jpeg)
+
+    # --- Internal API ---
+    def _next_part(self) -> Optional[bytes]:
+        buffer = self._buffer
+        start = buffer.find(self._delimiter)
+        if start < 0:
+            # 境界の一部が末尾に来ている可能性があるので、その分だけ残す
+            del buffer[: max(0, len(buffer) - len(self._delimiter))]
+            return None
+        header_end = buffer.find(b"\r\n\r\n", start)
+        if header_end < 0:
+            del buffer[:start]
+            return None
+        body_start = header_end + 4
+
+        match = _CONTENT_LENGTH_PATTERN.search(buffer, start, header_end)
+        if match:
+            body_end = body_start + int(match.group(1))
+            if len(buffer) < body_end:
+                del buffer[:start]
+                return None
+            next_start = body_end
+        else:
+            body_end = buffer.find(self._delimiter, body_start)
+            if body_end < 0:
+                del buffer[:start]
+                return None
+            next_start = body_end
+            # 境界の直前の改行はパートの本体に含めない
+            while body_end > body_start and buffer[body_end - 1] in b"\r\n":
+                body_end -= 1
+
+        jpeg = bytes(buffer[body_start:body_end])
+        del buffer[:next_start]
+        return jpeg
+
+    def _next_markers(self) -> Optional[bytes]:
+        buffer = self._buffer
+        start = buffer.find(JPEG_SOI)
+        if start < 0:
+            del buffer[: max(0, len(buffer) - 1)]
+            return None
+        end = buffer.find(JPEG_EOI, start + 2)
+        if end < 0:
+            del buffer[:start]
+            return None
+        jpeg = bytes(buffer[start : end + 2])
+        del buffer[: end + 2]
+        return jpeg
+
+
+class MjpegReceiver(StreamReceiver):
+    """
+    Raspberry PiのMJPEGストリームをHTTPで直接受信するレシーバー。
+
+    - 受信ループはeventletのグリーンスレッドで動き、全カメラが同じイベントループ (hub) と
+      共有のHTTP接続プールを使う (カメラごとにOSスレッドやFFmpegを起動しない)
+    - 受信時にはJPEGのバイト列を保持するだけでデコードしない。
+      acquire_frame() で実際に使われるフレームだけを (必要なら縮小して) デコードする。
+      デコードはtpoolのスレッドで行い、その間も他のカメラやクライアントの処理を止めない
+    - 切断時は指数バックオフ (ジッタ付き) で再接続する
+    StreamReceiverと同じインターフェースを持つ。
+    """
+
+    def __init__(
+        self,
+        stream_url: str,
+        ring_size: Optional[int] = None,
+        reduced_decode: Optional[bool] = None,
+        session: Optional[requests.Session] = None,
+    ):
+        if reduced_decode is None:
+            reduced_decode = config.STREAM_REDUCED_DECODE
+        # JPEGを縮小デコードする倍率 (1, 2, 4, 8)
+        self._reduction = (
+            reduced_decode_factor(config.DETECTION_SCALE) if reduced_decode else 1
+        )
+        self._session = session or shared_session()
+        # 受信済みで未デコードの最新JPEG
+        self._jpeg: Optional[bytes] = None
+        self._jpeg_seq = -1
+        self._jpeg_timestamp = 0.0
+        # 統計 (受信したがデコードされなかったフレーム数、壊れていたフレーム数)
+        self.frames_skipped = 0
+        self.frames_corrupt = 0
+        self.reconnects = 0
+        super().__init__(stream_url, ring_size)
+
+    # --- Public API ---
+    @property
+    def latest_seq(self) -> int:
+        return self._jpeg_seq
+
+    @property
+    def latest_jpeg(self) -> tuple[int, Optional[bytes]]:
+        """最新フレームの (シーケンス番号, JPEGのバイト列) をデコードせずに返す"""
+        with self._cond:
+            return self._jpeg_seq, self._jpeg
+
+    def acquire_frame(
+        self, after_seq: int = -1, timeout: Optional[float] = None
+    ) -> Optional[Frame]:
+        with self._cond:
+            if not self._cond.wait_for(
+                lambda: self._jpeg_seq > after_seq, timeout=timeout
+            ):
+                return None
+            if not self.connected_event.is_set():
+                return None
+            latest = self._latest
+            if latest is not None and latest.seq == self._jpeg_seq:
+                # 他のコンシューマが既にデコードしたフレームを共有する
+                return self._lend(latest)
+            jpeg, seq, timestamp = self._jpeg, self._jpeg_seq, self._jpeg_timestamp
+
+        with STAGE_SECONDS.time("decode"):
+            image = tpool.execute(
+                cv2.imdecode,
+                np.frombuffer(jpeg, np.uint8),
+                REDUCED_COLOR_FLAGS[self._reduction],
+            )
+        if image is None:
+            self.frames_corrupt += 1
+            return None
+
+        with self._cond:
+            latest = self._latest
+            if latest is not None and latest.seq == seq:
+                # デコード中に他のコンシューマが同じフレームを格納していれば、それを共有する
+                return self._lend(latest)
+        slot = self._acquire_write_slot()
+        if slot is None:
+            self.frames_overrun += 1
+            return None
+        with self._cond:
+            slot.image = image
+            slot.seq = seq
+            slot.timestamp = timestamp
+            slot.scale = 1.0 / self._reduction
+            if self._latest is None or seq > self._latest.seq:
+                self._latest = slot
+            return self._lend(slot)
+
+    def get_frame(self) -> Optional[np.ndarray]:
+        frame = self.acquire_frame(timeout=0)
+        if frame is None:
+            return None
+        with frame:
+            return frame.image.copy()
+
+    # --- Internal API ---
+    def _capture_loop(self):
+        """切断されるたびに指数バックオフで再接続しながら受信を続けるループ"""
+        delay = RECONNECT_INITIAL_DELAY
+        while not self._stopped.is_set():
+            received = False
+            try:
+                received = self._receive()
+            except requests.RequestException as e:
+                logger.warning(
+                    f"ストリームの受信に失敗しました: {self._stream_url} ({e})"
+                )
+            except Exception as e:
+                logger.error(f"キャプチャループで例外発生: {e}", exc_info=True)
+            self.connected_event.clear()
+            if self._stopped.is_set():
+                return
+
+            # フレームを受信できた接続の後は、待機時間を初期値に戻す
+            if received:
+                delay = RECONNECT_INITIAL_DELAY
+            wait = delay * random.uniform(0.5, 1.0)
+            logger.info(f"{wait:.1f}秒後に再接続します: {self._stream_url}")
+            self._stopped.wait(wait)
+            delay = min(delay * 2, config.STREAM_RECONNECT_MAX_DELAY)
+            self.reconnects += 1
+
+    def _receive(self) -> bool:
+        """1回の接続でストリームを受信する。1フレーム以上受信できた場合はTrueを返す"""
+        received = False
+        with self._session.get(
+            self._stream_url, stream=True, timeout=(5, 10)
+        ) as response:
+            response.raise_for_status()
+            parser = MultipartJpegParser(
+                MultipartJpegParser.boundary_from_content_type(
+                    response.headers.get("Content-Type", "")
+                )
+            )
+            logger.info(
+                f"ストリームに接続成功: {self._stream_url} "
+                f"(デコード倍率 1/{self._reduction})"
+            )
+            self.connected_event.set()
+
+            # 届いた分だけを待たずに受け取る (固定サイズで読むと、
+            # 次のフレームのデータが届くまで1フレーム分遅れる)
+            raw = response.raw
+            while not self._stopped.is_set():
+                chunk = raw.read1(MJPEG_CHUNK_SIZE)
+                if not chunk:
+                    break
+                frames = parser.feed(chunk)
+                if frames:
+                    self._store_jpeg(frames[-1], skipped=len(frames) - 1)
+                    received = True
+
+        logger.warning("ストリームが終了しました。再接続を試みます。")
+        return received
+
+    def _store_jpeg(self, jpeg: bytes, skipped: int = 0) -> None:
+        """
+        受信したJPEGを最新フレームとして保持する。
+        skippedは同じチャンクで受信したが、より新しいフレームがあったため捨てたフレーム数
+        """
+        with self._cond:
+            self.frames_captured += 1 + skipped
+            # 置き換えられる前のフレームが一度もデコードされていなければ、スキップとして数える
+            if self._jpeg is not None and self._latest_decoded_seq() != self._jpeg_seq:
+                skipped += 1
+            self.frames_skipped += skipped
+            self._jpeg = jpeg
+            self._jpeg_seq = self._seq
+            self._jpeg_timestamp = time.time()
+            self._seq += 1
+            self._cond.notify_all()
+
+    def _latest_decoded_seq(self) -> int:
+        return self._latest.seq if self._latest is not None else -1
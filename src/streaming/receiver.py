@@ -8,166 +8,211 @@ from typing import Optional
 import cv2
 import numpy as np
 
+from src.config import config
+
 logger = logging.getLogger(__name__)
 
 
+class _FrameSlot:
+    """リングバッファの1スロット。フレーム画像のバッファを再利用する"""
+
+    __slots__ = ("image", "seq", "timestamp", "scale", "readers")
+
+    def __init__(self):
+        self.image: Optional[np.ndarray] = None
+        self.seq = -1
+        self.timestamp = 0.0
+        # カメラ本来の解像度に対する比率 (縮小デコードした場合は1未満)
+        self.scale = 1.0
+        # このスロットを参照中のコンシューマ数 (0になるまで上書きしない)
+        self.readers = 0
+
+
+class Frame:
+    """
+    StreamReceiverから貸し出されるフレーム。
+    imageはリングバッファ上の読み取り専用ビューで、コピーは発生しない。
+    使い終わったら release() (またはwith文) でスロットを返却すること。
+    """
+
+    __slots__ = ("image", "seq", "timestamp", "scale", "deadline", "_slot", "_receiver")
+
+    def __init__(self, receiver: "StreamReceiver", slot: _FrameSlot):
+        self._receiver = receiver
+        self._slot = slot
+        self.image = slot.image.view()
+        self.image.flags.writeable = False
+        self.seq = slot.seq
+        self.timestamp = slot.timestamp
+        self.scale = slot.scale
+        # 認識パイプラインが設定する処理期限 (time.time基準)。過ぎたフレームは認識しない
+        self.deadline: Optional[float] = None
+
+    def release(self) -> None:
+        if self._slot is not None:
+            self._receiver._release(self._slot)
+            self._slot = None
+
+    def __enter__(self) -> "Frame":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+
 class StreamReceiver:
     """
     バックグラウンドスレッドでMJPEGストリームを受信し、最新フレームを管理するクラス
+
+    フレームは事前に確保したリングバッファのスロットへ直接デコードされ、
+    各スロットは単調増加するシーケンス番号とキャプチャ時刻を持つ。
+    コンシューマは acquire_frame() で「シーケンス番号Nより新しいフレーム」を待って借り受ける。
     """
 
-    def __init__(self, stream_url: str):
+    def __init__(self, stream_url: str, ring_size: Optional[int] = None):
         self._stream_url = stream_url
-        self._frame: Optional[np.ndarray] = None
-        self._lock = threading.Lock()
+        self._slots = [
+            _FrameSlot() for _ in range(max(3, ring_size or config.STREAM_RING_SIZE))
+        ]
+        self._latest: Optional[_FrameSlot] = None
+        self._next_index = 0
+        self._seq = 0
+        self._cond = threading.Condition()
         self.connected_event = threading.Event()
+        self._stopped = threading.Event()
+        # 統計 (貸し出し中でスロットが空かずに捨てたフレーム数)
+        self.frames_captured = 0
+        self.frames_overrun = 0
         self._thread = threading.Thread(target=self._capture_loop, daemon=True)
         self._thread.start()
         logger.info("StreamReceiverスレッドを開始しました。")
 
     def _capture_loop(self):
         """ストリームから継続的にフレームをキャプチャするループ"""
-        while True:
+        while not self._stopped.is_set():
             try:
-                cap = cv2.VideoCapture(self._stream_url, cv2.CAP_FFMPEG)
-                if not cap.isOpened():
-                    logger.error(
-                        f"ストリームを開けません: {self._stream_url}。5秒後に再試行します..."
-                    )
-                    self.connected_event.clear()
-                    time.sleep(5)
-                    continue
-
-                logger.info(f"ストリームに接続成功: {self._stream_url}")
-                self.connected_event.set()
-
-                while True:
-                    success, frame = cap.read()
-                    if not success:
-                        logger.warning(
-                            "ストリームの読み込みに失敗しました。再接続を試みます。"
-                        )
-                        self.connected_event.clear()
-                        break
-
-                    with self._lock:
-                        self._frame = frame
-                    # CPU負荷を少し下げるための短い待機
-                    time.sleep(0.01)
-
+                self._capture_opencv()
             except Exception as e:
                 logger.error(f"キャプチャループで例外発生: {e}。5秒後に再試行します...")
                 self.connected_event.clear()
-                time.sleep(5)
+                self._stopped.wait(5)
+
+    def _capture_opencv(self):
+        """OpenCV (FFmpeg) でストリームを開き、切断されるまでフレームを読み込む"""
+        cap = cv2.VideoCapture(self._stream_url, cv2.CAP_FFMPEG)
+        if not cap.isOpened():
+            logger.error(
+                f"ストリームを開けません: {self._stream_url}。5秒後に再試行します..."
+            )
+            self.connected_event.clear()
+            self._stopped.wait(5)
+            return
+
+        logger.info(f"ストリームに接続成功: {self._stream_url}")
+        self.connected_event.set()
+
+        try:
+            while not self._stopped.is_set():
+                slot = self._acquire_write_slot()
+                if slot is None:
+                    # 全スロットが貸し出し中の場合は、デコードせずに読み捨てる
+                    success = cap.grab()
+                    self.frames_overrun += 1
+                else:
+                    # スロットのバッファに直接デコードする (形状が変われば再確保される)
+                    success, image = cap.read(slot.image)
+                    if success:
+                        slot.image = image
+                        self._publish(slot, 1.0)
+
+                if not success:
+                    logger.warning(
+                        "ストリームの読み込みに失敗しました。再接続を試みます。"
+                    )
+                    self.connected_event.clear()
+                    return
+
+                # eventlet環境ではこのスレッドもグリーンスレッドなので、
+                # 固定の待機ではなく制御を一度だけ他のグリーンスレッドに譲る
+                time.sleep(0)
+        finally:
+            cap.release()
+
+    # --- Public API ---
+    @property
+    def latest_seq(self) -> int:
+        """最新フレームのシーケンス番号 (まだフレームがない場合は-1)"""
+        latest = self._latest
+        return latest.seq if latest is not None else -1
+
+    def acquire_frame(
+        self, after_seq: int = -1, timeout: Optional[float] = None
+    ) -> Optional[Frame]:
+        """
+        シーケンス番号がafter_seqより新しい最新フレームを借り受ける。
+        timeout秒以内に新しいフレームが届かない場合、または未接続の場合はNoneを返す
+        """
+        with self._cond:
+            if not self._cond.wait_for(
+                lambda: self._latest is not None and self._latest.seq > after_seq,
+                timeout=timeout,
+            ):
+                return None
+            if not self.connected_event.is_set():
+                return None
+            return self._lend(self._latest)
+
+    def stop(self) -> None:
+        """受信ループを停止する (ループは次のフレームの受信後に終了する)"""
+        self._stopped.set()
+        self.connected_event.clear()
 
     def get_frame(self) -> Optional[np.ndarray]:
-        """最新のフレームをスレッドセーフに取得する"""
+        """最新のフレームのコピーをスレッドセーフに取得する (コピーが必要な呼び出し元向け)"""
         if not self.connected_event.is_set():
             return None
-        with self._lock:
-            return self._frame.copy() if self._frame is not None else None
-
-
-# src/recognition/worker.py
-
-import logging
-
-import cv2
-import face_recognition
-from eventlet import tpool
-from flask_socketio import SocketIO
-
-from src.config import config
-from src.recognition.face_db import FaceDB
-from src.streaming.receiver import StreamReceiver
-
-logger = logging.getLogger(__name__)
-
-
-def process_frame_for_faces(frame_bgr: cv2.Mat, face_db: FaceDB):
-    """
-    1フレーム分の画像処理と顔認識を行う、CPU負荷の高い関数。
-    この関数全体がtpoolで実行されることで、メインループのブロッキングを防ぐ。
-    """
-    if frame_bgr is None:
+        with self._cond:
+            latest = self._latest
+            return latest.image.copy() if latest is not None else None
+
+    # --- Internal API ---
+    def _acquire_write_slot(self) -> Optional[_FrameSlot]:
+        """次に書き込むスロットを選ぶ。最新フレームと貸し出し中のスロットは避ける"""
+        with self._cond:
+            for _ in range(len(self._slots)):
+                slot = self._slots[self._next_index]
+                self._next_index = (self._next_index + 1) % len(self._slots)
+                if slot is not self._latest and slot.readers == 0:
+                    # 書き込み中に貸し出されないよう、一時的に無効化しておく
+                    slot.seq = -1
+                    return slot
         return None
 
-    # 1. 画像の前処理
-    small_frame_rgb = cv2.cvtColor(
-        cv2.resize(frame_bgr, (0, 0), fx=0.25, fy=0.25), cv2.COLOR_BGR2RGB
-    )
-
-    # 2. 顔の位置特定とエンコード
-    face_locations = face_recognition.face_locations(
-        small_frame_rgb, model=config.RECOGNITION_MODEL
-    )
-    if not face_locations:
-        return []  # 顔がなければ空のリストを返す
-
-    face_encodings = face_recognition.face_encodings(small_frame_rgb, face_locations)
-
-    # 3. 検出された顔のマッチング
-    faces_data = []
-    for (top, right, bottom, left), face_encoding in zip(
-        face_locations, face_encodings
-    ):
-        name = face_db.match(face_encoding) or "Unknown"
-        faces_data.append(
-            {
-                "id": name,
-                "x": int(left * 4),
-                "y": int(top * 4),
-                "w": int((right - left) * 4),
-                "h": int((bottom - top) * 4),
-            }
-        )
-
-    return faces_data
-
-
-def face_recognition_worker(sio: SocketIO, stream_receiver: StreamReceiver):
-    """
-    顔認識ワーカー。フレームを取得し、重い処理をtpoolにオフロードする。
-    """
-    logger.info("顔認識ワーカーを起動しました。")
-
-    # FaceDBの初期化を同期的に行う
-    logger.info("FaceDBの準備を開始します...")
-    face_db = FaceDB()
-    logger.info("FaceDBの準備が完了しました。")
-
-    logger.info("ストリームへの接続を待っています...")
-    while not stream_receiver.connected_event.wait(timeout=5):
-        logger.warning("まだストリームに接続できません...")
-    logger.info("ストリーム接続完了。顔認識ループを開始します。")
-
-    while True:
-        # eventletのグリーンレットに制御を渡し、他のI/O処理を妨げない
-        sio.sleep(config.WORKER_SLEEP_INTERVAL)
-
-        try:
-            # フレーム取得
-            frame = stream_receiver.get_frame()
-            if frame is None:
-                continue
-
-            # CPU負荷の高い処理をtpoolにオフロード
-            faces_data = tpool.execute(process_frame_for_faces, frame, face_db)
-
-            # ★★★ faces_dataがNoneでない限り、常にemitするよう修正 ★★★
-            # faces_dataが空リストの場合、フロント側で枠がクリアされる
-            if faces_data is not None:
-                if faces_data:
-                    recognized_names = [
-                        face["id"] for face in faces_data if face["id"] != "Unknown"
-                    ]
-                    logger.info(
-                        f"検出された顔数: {len(faces_data)} (認識: {', '.join(recognized_names) or 'なし'})"
-                    )
-                else:
-                    logger.debug("顔は検出されませんでした。")
-
-                sio.emit("faces_update", {"faces": faces_data}, namespace="/live")
-
-        except Exception as e:
-            logger.error(f"顔認識処理ループで予期せぬエラー: {e}", exc_info=True)
+    def _publish(self, slot: _FrameSlot, scale: float) -> None:
+        with self._cond:
+            slot.seq = self._seq
+            slot.timestamp = time.time()
+            slot.scale = scale
+            self._seq += 1
+            self._latest = slot
+            self.frames_captured += 1
+            self._cond.notify_all()
+
+    def _lend(self, slot: _FrameSlot) -> Frame:
+        """スロットを貸し出す (self._condを保持した状態で呼び出すこと)"""
+        slot.readers += 1
+        return Frame(self, slot)
+
+    def _release(self, slot: _FrameSlot) -> None:
+        with self._cond:
+            slot.readers -= 1
+
+
+def create_receiver(stream_url: str) -> StreamReceiver:
+    """設定 (STREAM_RECEIVER) に応じたレシーバーを作成する"""
+    if config.STREAM_RECEIVER == "mjpeg":
+        # 循環importを避けるため、使う場合にのみ読み込む
+        from src.streaming.mjpeg import MjpegReceiver
+
+        return MjpegReceiver(stream_url)
+    return StreamReceiver(stream_url)
@@ -0,0 +1,212 @@
+# src/streaming/restream.py
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from collections.abc import Callable, Iterator
+from functools import partial
+
+import cv2
+import numpy as np
+from eventlet import tpool
+from flask_socketio import SocketIO
+
+from src.config import config
+from src.streaming.broadcaster import FacesBroadcaster
+from src.streaming.receiver import StreamReceiver
+
+logger = logging.getLogger(__name__)
+
+BOUNDARY = "frame"
+
+# 焼き込む枠の色 (BGR)。未登録の顔は赤、登録済みの顔は緑で描く
+KNOWN_COLOR = (80, 200, 80)
+UNKNOWN_COLOR = (60, 60, 220)
+
+
+def encode_annotated(
+    image: np.ndarray, faces: list[list], scale: float, quality: int
+) -> bytes:
+    """
+    フレームに顔の枠と名前を描き込み、JPEGにエンコードする (tpoolで実行する)。
+    faces の座標は元の解像度なので、フレームの縮小率 (scale) に合わせて変換する。
+    cv2.putTextはASCII以外の文字を描けないため、日本語の名前は表示が崩れる。
+    """
+    canvas = image.copy() if faces else image
+    for _key, x, y, w, h, name in faces:
+        left, top = int(x * scale), int(y * scale)
+        right, bottom = int((x + w) * scale), int((y + h) * scale)
+        color = UNKNOWN_COLOR if name == "Unknown" else KNOWN_COLOR
+        cv2.rectangle(canvas, (left, top), (right, bottom), color, 2)
+        cv2.putText(
+            canvas,
+            name,
+            (left, max(top - 6, 12)),
+            cv2.FONT_HERSHEY_SIMPLEX,
+            0.5,
+            color,
+            1,
+            cv2.LINE_AA,
+        )
+    ok, encoded = cv2.imencode(".jpg", canvas, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+    if not ok:
+        raise RuntimeError("JPEGエンコードに失敗しました")
+    return encoded.tobytes()
+
+
+class _Channel:
+    """
+    1台のカメラ (と枠の焼き込み有無) ごとの配信チャンネル。
+    視聴者がいる間だけエンコードループが動き、1フレームにつき1回だけJPEGにして
+    全視聴者で共有する。視聴者は常に最新のJPEGだけを受け取るため、
+    送信が遅いクライアントはバッファを溜めずにフレームを飛ばす。
+    """
+
+    def __init__(
+        self,
+        sio: SocketIO,
+        receiver: StreamReceiver,
+        faces_source: Callable[[], list[list]] | None,
+        max_fps: float,
+        quality: int,
+    ):
+        self._sio = sio
+        self._receiver = receiver
+        self._faces_source = faces_source
+        self._interval = 1.0 / max_fps if max_fps > 0 else 0.0
+        self._quality = quality
+        self._cond = threading.Condition()
+        self._jpeg: bytes | None = None
+        self._seq = -1
+        self._viewers = 0
+        self._running = False
+        # 統計 (エンコード回数)
+        self.encoded = 0
+
+    @property
+    def viewers(self) -> int:
+        return self._viewers
+
+    def subscribe(self) -> Iterator[bytes]:
+        """multipart/x-mixed-replace のパートを生成するジェネレータ (視聴者1人分)"""
+        with self._cond:
+            self._viewers += 1
+            if not self._running:
+                self._running = True
+                self._sio.start_background_task(self._encode_loop)
+        try:
+            last = -1
+            while True:
+                with self._cond:
+                    if not self._cond.wait_for(
+                        lambda: self._seq > last, timeout=config.STREAM_FRAME_TIMEOUT
+                    ):
+                        continue
+                    jpeg, last = self._jpeg, self._seq
+                yield (
+                    f"--{BOUNDARY}\r\nContent-Type: image/jpeg\r\n"
+                    f"Content-Length: {len(jpeg)}\r\n\r\n"
+                ).encode() + jpeg + b"\r\n"
+        finally:
+            with self._cond:
+                self._viewers -= 1
+
+    # --- Internal API ---
+    def _encode_loop(self) -> None:
+        logger.info("再配信のエンコードを開始しました。")
+        last = -1
+        while True:
+            with self._cond:
+                if self._viewers == 0:
+                    self._running = False
+                    logger.info(
+                        "視聴者がいなくなったため、再配信のエンコードを停止しました。"
+                    )
+                    return
+
+            started = time.monotonic()
+            try:
+                jpeg, seq = self._next_jpeg(last)
+            except Exception as e:
+                logger.error(f"再配信のエンコードで例外発生: {e}", exc_info=True)
+                self._sio.sleep(1.0)
+                continue
+            if jpeg is not None:
+                last = seq
+                self.encoded += 1
+                with self._cond:
+                    self._jpeg = jpeg
+                    self._seq += 1
+                    self._cond.notify_all()
+
+            # 最大フレームレートを超えないように待つ
+            delay = self._interval - (time.monotonic() - started)
+            if delay > 0:
+                self._sio.sleep(delay)
+
+    def _next_jpeg(self, last: int) -> tuple[bytes | None, int]:
+        # 枠を描かない場合、受信したJPEGをそのまま流せるなら再エンコードしない
+        if self._faces_source is None and hasattr(self._receiver, "latest_jpeg"):
+            seq, jpeg = self._receiver.latest_jpeg
+            if seq > last and jpeg is not None:
+                return jpeg, seq
+            self._sio.sleep(0.01)
+            return None, last
+
+        frame = self._receiver.acquire_frame(
+            after_seq=last, timeout=config.STREAM_FRAME_TIMEOUT
+        )
+        if frame is None:
+            return None, last
+        with frame:
+            faces = self._faces_source() if self._faces_source is not None else []
+            jpeg = tpool.execute(
+                encode_annotated, frame.image, faces, frame.scale, self._quality
+            )
+            return jpeg, frame.seq
+
+
+class RestreamHub:
+    """
+    受信済みのフレームを /stream でブラウザに再配信するクラス。
+    閲覧者が増えてもRaspberry Pi側の負荷は増えず、焼き込んだ枠は
+    サーバー側で認識した結果と同期する。
+    """
+
+    def __init__(
+        self,
+        sio: SocketIO,
+        receivers: dict[str, StreamReceiver],
+        broadcaster: FacesBroadcaster,
+    ):
+        self._sio = sio
+        self._receivers = receivers
+        self._broadcaster = broadcaster
+        self._channels: dict[tuple[str, bool], _Channel] = {}
+
+    def stream(self, camera_id: str, annotate: bool) -> Iterator[bytes]:
+        key = (camera_id, annotate)
+        channel = self._channels.get(key)
+        if channel is None:
+            faces_source = None
+            if annotate:
+                faces_source = partial(self._broadcaster.latest_faces, camera_id)
+            channel = self._channels[key] = _Channel(
+                self._sio,
+                self._receivers[camera_id],
+                faces_source,
+                config.RESTREAM_MAX_FPS,
+                config.RESTREAM_JPEG_QUALITY,
+            )
+        return channel.subscribe()
+
+    def status(self) -> dict:
+        return {
+            f"{camera_id}{'/annotated' if annotate else ''}": {
+                "viewers": channel.viewers,
+                "encoded": channel.encoded,
+            }
+            for (camera_id, annotate), channel in self._channels.items()
+        }
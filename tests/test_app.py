@@ -0,0 +1,33 @@
+# tests/test_app.py
+
+import pytest
+from werkzeug.exceptions import Unauthorized
+
+from src import app as app_module
+from src.config import config
+
+TOKEN = "secret-token"
+
+
+@pytest.fixture(autouse=True)
+def admin_token(monkeypatch):
+    monkeypatch.setattr(config, "ADMIN_API_TOKEN", TOKEN)
+
+
+def _check(authorization: str) -> None:
+    headers = {"Authorization": authorization}
+    with app_module.app.test_request_context(headers=headers):
+        app_module.require_admin_token()
+
+
+def test_valid_token_is_accepted():
+    _check(f"Bearer {TOKEN}")
+
+
+@pytest.mark.parametrize(
+    "authorization",
+    ["", "Bearer wrong", f"Basic {TOKEN}", "Bearer tökén".encode().decode("latin-1")],
+)
+def test_invalid_token_is_rejected_with_401(authorization):
+    with pytest.raises(Unauthorized):
+        _check(authorization)
@@ -0,0 +1,55 @@
+# tests/test_detector.py
+
+import numpy as np
+import pytest
+
+pytest.importorskip("face_recognition")
+
+from src.recognition import detector  # noqa: E402
+from src.recognition.detector import ENCODE_FACE_SIZE, encoding_inputs  # noqa: E402
+
+# 元の解像度に対する検出画像の比率 (縮小前のフレームは検出画像の4倍)
+RATIO = 4
+
+
+def _frames():
+    rng = np.random.default_rng(0)
+    frame_bgr = rng.integers(0, 256, (720, 1280, 3), dtype=np.uint8)
+    image_rgb = np.ascontiguousarray(frame_bgr[::RATIO, ::RATIO, ::-1])
+    return image_rgb, frame_bgr
+
+
+def test_without_frame_encodes_on_the_detection_image():
+    image_rgb, _ = _frames()
+    locations = [(10, 40, 40, 10), (50, 90, 90, 50)]
+    inputs = encoding_inputs(image_rgb, locations)
+    assert len(inputs) == 1
+    assert inputs[0][0] is image_rgb
+    assert inputs[0][1] == locations
+
+
+def test_small_faces_are_cropped_from_the_full_frame():
+    image_rgb, frame_bgr = _frames()
+    small = (20, 50, 50, 20)
+    large = (0, ENCODE_FACE_SIZE + 10, ENCODE_FACE_SIZE, 10)
+    inputs = encoding_inputs(image_rgb, [small, large], frame_bgr)
+
+    # 顔の順序は検出結果と同じで、大きな顔は検出画像のままエンコードする
+    assert len(inputs) == 2
+    assert inputs[1][0] is image_rgb and inputs[1][1] == [large]
+
+    crop, (box,) = inputs[0]
+    top, right, bottom, left = box
+    # 30pxの顔を、縮小前のフレームの解像度 (120px) で切り出す
+    assert bottom - top == 30 * RATIO and right - left == 30 * RATIO
+    # 切り出した画素は縮小前のフレームのもの (RGBに変換済み)
+    y, x = (small[0] - 15) * RATIO, (small[3] - 15) * RATIO
+    np.testing.assert_array_equal(crop[0, 0], frame_bgr[y, x, ::-1])
+
+
+def test_crop_box_round_trip():
+    region = (10, 110, 90, 30)
+    crop_shape = (320, 320, 3)
+    box = (20, 80, 60, 40)
+    crop_box = detector._to_crop(box, region, crop_shape)
+    assert detector._from_crop(crop_box, region, crop_shape) == box
@@ -0,0 +1,84 @@
+# tests/test_face_db.py
+
+import sys
+import types
+
+import cv2
+import numpy as np
+import pytest
+
+from src.config import config
+from src.recognition import face_db as face_db_module
+from src.recognition.face_db import ENCODING_DIM, FaceDB
+from src.recognition.store import EmbeddingStore
+
+# 偽の顔検出が返す顔の位置 (短辺60px。画像のファイルサイズとは必ず異なる)
+FACE_LOCATION = (10, 70, 70, 10)
+
+
+@pytest.fixture
+def fake_face_recognition(monkeypatch):
+    """dlibを使わずに、画像の内容から決まるエンコーディングを返す face_recognition"""
+    calls = {"encode": 0}
+
+    def face_encodings(image, locations):
+        calls["encode"] += 1
+        rng = np.random.default_rng(int(image.sum()) % (2**32))
+        return [rng.normal(0.0, 0.1, ENCODING_DIM) for _ in locations]
+
+    module = types.SimpleNamespace(
+        load_image_file=lambda path: cv2.imread(path)[:, :, ::-1].copy(),
+        face_locations=lambda image, model="hog": [FACE_LOCATION],
+        face_landmarks=lambda image, locations: [{} for _ in locations],
+        face_encodings=face_encodings,
+    )
+    monkeypatch.setitem(sys.modules, "face_recognition", module)
+    return calls
+
+
+@pytest.fixture
+def face_data(tmp_path, monkeypatch):
+    """2人分の登録画像を置いたデータディレクトリと、そこを向いた埋め込みストア"""
+    rng = np.random.default_rng(0)
+    for person in ("alice", "bob"):
+        (tmp_path / person).mkdir()
+        for i in range(2):
+            image = rng.integers(0, 256, (96, 96, 3), dtype=np.uint8)
+            cv2.imwrite(str(tmp_path / person / f"{i}.png"), image)
+
+    monkeypatch.setattr(config, "FACE_DATA_DIR", tmp_path)
+    monkeypatch.setattr(config, "FACE_DB_BUILD_WORKERS", 1)
+    monkeypatch.setattr(
+        face_db_module, "STORE", EmbeddingStore(tmp_path, dim=ENCODING_DIM)
+    )
+    monkeypatch.setattr(
+        face_db_module, "LEGACY_CACHE_FILE", tmp_path / "_encodings.pkl"
+    )
+    return tmp_path
+
+
+def test_unchanged_images_are_not_reencoded(face_data, fake_face_recognition):
+    FaceDB()
+    assert fake_face_recognition["encode"] == 4
+
+    # 変更がなければ、起動し直しても再読み込みしても再エンコードしない
+    FaceDB()
+    FaceDB(autoload=False).reload()
+    assert fake_face_recognition["encode"] == 4
+
+
+def test_image_records_keep_the_file_size(face_data, fake_face_recognition):
+    FaceDB()
+    header, _ = face_db_module.STORE.open()
+    for key, record in header["images"].items():
+        assert record["size"] == (face_data / key).stat().st_size
+        assert record["face_size"] == 60
+
+
+def test_changed_image_is_reencoded(face_data, fake_face_recognition):
+    face_db = FaceDB()
+    image = np.zeros((96, 96, 3), dtype=np.uint8)
+    cv2.imwrite(str(face_data / "alice" / "0.png"), image)
+
+    face_db.reload()
+    assert fake_face_recognition["encode"] == 5
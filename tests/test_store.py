@@ -0,0 +1,71 @@
+# tests/test_store.py
+
+import numpy as np
+from eventlet import patcher
+
+from src.recognition.store import EmbeddingStore
+
+# 本番では埋め込みストアにtpoolのOSスレッドや別プロセスから書き込む。src.app を読み込んだ
+# テストの後でも (モンキーパッチ済み) 、グリーンスレッドではなくOSスレッドで競合させる
+_threading = patcher.original("threading")
+
+DIM = 8
+
+
+def _write(store: EmbeddingStore, rows: int) -> None:
+    matrix = np.full((rows, DIM), rows, dtype=np.float32)
+    store.write(matrix, [{"name": "a", "offset": 0, "count": rows}], {})
+
+
+def test_write_and_open_round_trip(tmp_path):
+    store = EmbeddingStore(tmp_path, dim=DIM)
+    assert store.open() is None
+
+    _write(store, 3)
+    header, matrix = store.open()
+    assert header["count"] == 3
+    assert matrix.shape == (3, DIM)
+    assert len(list(tmp_path.glob("_embeddings.*.f32"))) == 1
+
+    store.remove()
+    assert store.open() is None
+    assert not list(tmp_path.glob("_embeddings.*.f32"))
+
+
+def test_concurrent_writers_never_leave_a_dangling_header(tmp_path):
+    # ロックはファイル記述ごとにかかるため、同じプロセス内のスレッドでも
+    # 複数のプロセス (Gunicornのワーカー) が同時に書き込む場合と同じように競合する
+    _write(EmbeddingStore(tmp_path, dim=DIM), 1)
+    stop = _threading.Event()
+    failures = []
+
+    def writer(rows: int) -> None:
+        store = EmbeddingStore(tmp_path, dim=DIM)
+        for _ in range(100):
+            _write(store, rows)
+
+    def reader() -> None:
+        store = EmbeddingStore(tmp_path, dim=DIM)
+        while not stop.is_set():
+            opened = store.open()
+            if opened is None:
+                failures.append("open")
+                continue
+            header, matrix = opened
+            if not np.all(np.asarray(matrix) == header["count"]):
+                failures.append("content")
+
+    threads = [_threading.Thread(target=writer, args=(rows,)) for rows in (2, 3)]
+    observer = _threading.Thread(target=reader)
+    observer.start()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stop.set()
+    observer.join()
+
+    assert not failures
+    header, _ = EmbeddingStore(tmp_path, dim=DIM).open()
+    assert len(list(tmp_path.glob("_embeddings.*.f32"))) == 1
+    assert (tmp_path / header["matrix"]).exists()
@@ -0,0 +1,57 @@
+# tests/test_tracker.py
+
+import numpy as np
+
+from src.recognition.tracker import FaceTracker, Track
+
+
+class _Gallery:
+    """照合の呼び出しを記録する、FaceDBの代わり"""
+
+    generation = 1
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+
+    def identify(self, encodings):
+        self.calls += 1
+        return [self.name] * len(encodings)
+
+
+def _tracks(tracker: FaceTracker, n: int) -> list[Track]:
+    return [
+        Track(i, (0, 1, 1, 0), np.empty((0, 0), np.uint8), tracker.vote_window)
+        for i in range(n)
+    ]
+
+
+def test_identify_matches_pending_faces():
+    tracker = FaceTracker(vote_window=1, dedup_distance=0.1)
+    tracks = _tracks(tracker, 2)
+    gallery = _Gallery("alice")
+    tracker.identify(tracks, [np.zeros(128), np.ones(128)], gallery)
+    assert gallery.calls == 1
+    assert [track.name for track in tracks] == ["alice", "alice"]
+
+
+def test_identify_uses_names_matched_by_the_executor():
+    tracker = FaceTracker(vote_window=1, dedup_distance=0.1)
+    tracks = _tracks(tracker, 2)
+    gallery = _Gallery("alice")
+    tracker.identify(tracks, [np.zeros(128), np.ones(128)], gallery, ["bob", None])
+    assert gallery.calls == 0
+    assert [track.name for track in tracks] == ["bob", "Unknown"]
+
+
+def test_deduplicated_faces_keep_the_cached_result():
+    tracker = FaceTracker(vote_window=1, dedup_distance=0.1)
+    tracks = _tracks(tracker, 1)
+    gallery = _Gallery("alice")
+    tracker.identify(tracks, [np.zeros(128)], gallery, ["bob"])
+    # ほぼ同じエンコーディングなら、新しい照合結果ではなく前回の結果で投票する
+    tracker.identify(tracks, [np.full(128, 1e-3)], gallery, ["carol"])
+    assert tracks[0].name == "bob"
+    tracker.identify(tracks, [np.ones(128)], gallery, ["carol"])
+    assert tracks[0].name == "carol"
+    assert gallery.calls == 0